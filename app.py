@@ -1,117 +1,997 @@
-from flask import Flask, request, jsonify, send_file
-import yt_dlp
+import time
+# זמן העלייה נמדד מכאן - כולל ייבוא Flask והמודולים של השרת
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, redirect, send_file
+from werkzeug.exceptions import HTTPException
 import os
-import uuid
+import copy
+import gzip
+import itertools
+import json
+import mimetypes
+import re
+import shutil
+import socket
+import zipfile
 import threading
-import time
 from datetime import datetime
+from urllib.parse import urlparse
+
+from batches import Batch, BatchRunner
+from chunks import ALGORITHM, CHUNK_SIZE, FileFollower, hash_file
+from cache import (InsufficientStorage, MetadataCache, MemoryBackend, ResultCache, cache_key,
+                   canonical_video_id)
+from file_index import FileIndex
+from format_planner import (TABLE_FIELDS, fallback_selector, filter_formats, format_table,
+                            make_target, plan_format, sort_formats)
+from metrics import Counter, Gauge, Histogram, Registry
+from state import RemoteJob, open_state
+from jobs import Job, JobQueue, QueueFull, chain
+from maintenance import Maintenance
+from shaping import BandwidthShaper, ShapedBody
+from transcode import AUDIO_FORMATS, TranscodePool, codec_name
+from upstream import Throttled, UpstreamScheduler, is_throttled
+from ydl_pool import YDLPool, load_ytdlp, preload
 
 app = Flask(__name__)
 
 # תיקיית הורדות זמניות
-DOWNLOAD_DIR = '/tmp/youtube_downloads'
+DOWNLOAD_DIR = os.environ.get('DOWNLOAD_DIR', '/tmp/youtube_downloads')
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-# מילון לניהול הורדות פעילות
+# מספר ההורדות שרצות במקביל וגודל התור שממתין להן
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', 2))
+MAX_QUEUED_DOWNLOADS = int(os.environ.get('MAX_QUEUED_DOWNLOADS', 20))
+
+# גודל מקסימלי למטמון הקבצים המוכנים (ברירת מחדל 10GB). הפינוי מתחיל מעל
+# HIGH_WATERMARK מהמכסה וממשיך עד LOW_WATERMARK, ובדיסק נשאר תמיד MIN_FREE_BYTES
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 10 * 1024 ** 3))
+CACHE_HIGH_WATERMARK = float(os.environ.get('CACHE_HIGH_WATERMARK', 0.9))
+CACHE_LOW_WATERMARK = float(os.environ.get('CACHE_LOW_WATERMARK', 0.75))
+MIN_FREE_BYTES = int(os.environ.get('MIN_FREE_BYTES', 1024 ** 3))
+# כמה זמן הורדה ממתינה למקום בדיסק לפני שהיא נכשלת
+STORAGE_WAIT_TIMEOUT = int(os.environ.get('STORAGE_WAIT_TIMEOUT', 300))
+
+# אינדקס הקבצים המוכנים - נשמר בין הפעלות של השרת
+FILE_INDEX_PATH = os.environ.get('FILE_INDEX_PATH', os.path.join(DOWNLOAD_DIR, '.index.sqlite3'))
+
+# מטמון מידע על סרטונים - קישורי ההורדה של יוטיוב פגים אחרי כמה שעות
+METADATA_TTL = int(os.environ.get('METADATA_TTL', 1800))
+METADATA_MAX_ENTRIES = int(os.environ.get('METADATA_MAX_ENTRIES', 1024))
+
+# מופעי YoutubeDL חמים: כמה פנויים נשמרים לכל סט הגדרות (0 - מופע חדש לכל בקשה),
+# ואחרי כמה בקשות מופע מוחלף
+YDL_POOL_SIZE = int(os.environ.get('YDL_POOL_SIZE', 8))
+YDL_MAX_USES = int(os.environ.get('YDL_MAX_USES', 200))
+# הגדרות החילוץ - משותפות לכל הבקשות, כך שכולן משתמשות באותם מופעים
+YDL_INFO_OPTIONS = {'quiet': True}
+YDL_FLAT_OPTIONS = {'quiet': True, 'extract_flat': 'in_playlist'}
+# yt-dlp נטען בשימוש הראשון. PRELOAD_YTDLP=1 טוען אותו כבר בייבוא - עם
+# gunicorn --preload זה קורה פעם אחת בתהליך הראשי והזיכרון משותף לעובדים
+PRELOAD_YTDLP = os.environ.get('PRELOAD_YTDLP') == '1'
+
+# קצב הפניות לאתר המקור (בקשות לשנייה ופרץ מקסימלי), כללי ולכל אתר. 0 - בלי הגבלה
+UPSTREAM_RATE = float(os.environ.get('UPSTREAM_RATE', 10))
+UPSTREAM_BURST = int(os.environ.get('UPSTREAM_BURST', 20))
+UPSTREAM_HOST_RATE = float(os.environ.get('UPSTREAM_HOST_RATE', 5))
+UPSTREAM_HOST_BURST = int(os.environ.get('UPSTREAM_HOST_BURST', 10))
+# השהיה מקסימלית לאתר שחוסם אותנו, וניסיונות חוזרים לחילוץ מידע שנחסם
+UPSTREAM_BACKOFF_MAX = int(os.environ.get('UPSTREAM_BACKOFF_MAX', 300))
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+# כמה שניות בקשת מידע ממתינה לתורה לפני שנדחית ב-429
+UPSTREAM_INFO_TIMEOUT = int(os.environ.get('UPSTREAM_INFO_TIMEOUT', 30))
+
+# הורדת קבוצות ופלייליסטים
+MAX_BATCH_ITEMS = int(os.environ.get('MAX_BATCH_ITEMS', 200))
+MAX_ACTIVE_BATCHES = int(os.environ.get('MAX_ACTIVE_BATCHES', 10))
+
+# תהליכי המרת אודיו (ברירת מחדל - מספר הליבות)
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', 0)) or None
+
+# תשובות JSON קטנות מזה לא נדחסות - הדחיסה עולה יותר ממה שהיא חוסכת
+GZIP_MIN_SIZE = 1024
+
+# הזרמת קבצים שעדיין בהורדה
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_START_TIMEOUT = 30
+
+# מצב משותף לכמה תהליכים (gunicorn -w N) או שרתים: sqlite (שרת אחד), redis
+# (כמה שרתים, REDIS_URL) או memory (תהליך יחיד)
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'sqlite')
+STATE_PATH = os.environ.get('STATE_PATH', os.path.join(DOWNLOAD_DIR, '.state.sqlite3'))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# הכתובת שבה שרתים אחרים מגיעים לשרת הזה (למשל http://10.0.0.5:5000). ריק - שרת יחיד,
+# וכל התהליכים חולקים את אותה תיקיית הורדות
+NODE_URL = os.environ.get('NODE_URL', '').rstrip('/')
+# קובץ שנמצא בשרת אחר: הפניה (307) או העברה דרך השרת הזה (FILE_PROXY=1)
+FILE_PROXY = os.environ.get('FILE_PROXY') == '1'
+# רוחב הפס לשליחת קבצים ב-/api/file, בבתים לשנייה: לכל השליחות יחד ולכל לקוח
+# (0 - בלי הגבלה, ובשרת האסינכרוני הקבצים נשלחים ב-sendfile). בזמן שהורדות מהאתר רצות,
+# INGEST_RESERVE מ-SERVE_RATE נשמר להן
+SERVE_RATE = int(os.environ.get('SERVE_RATE', 0))
+SERVE_CLIENT_RATE = int(os.environ.get('SERVE_CLIENT_RATE', 0))
+INGEST_RESERVE = float(os.environ.get('INGEST_RESERVE', 0.2))
+# נעילת הורדה והעותק שלה במצב המשותף מתחדשים כל עוד ההורדה רצה, ופגים אם התהליך נפל
+LOCK_TTL = 30
+
+# מילון לניהול הורדות פעילות - מזהה עבודה -> Job
 active_downloads = {}
 
+shared_state = open_state(STATE_BACKEND, path=STATE_PATH, url=REDIS_URL)
+result_cache = ResultCache(DOWNLOAD_DIR, CACHE_MAX_BYTES, FileIndex(FILE_INDEX_PATH),
+                           high_watermark=CACHE_HIGH_WATERMARK, low_watermark=CACHE_LOW_WATERMARK,
+                           min_free_bytes=MIN_FREE_BYTES, state=shared_state, node=NODE_URL,
+                           leases=shared_state, lease_ttl=LOCK_TTL)
+metadata_cache = MetadataCache(MemoryBackend(METADATA_MAX_ENTRIES), ttl=METADATA_TTL)
+transcode_pool = TranscodePool(TRANSCODE_WORKERS)
+ydl_pool = YDLPool(YDL_POOL_SIZE, max_uses=YDL_MAX_USES)
+shaper = BandwidthShaper(SERVE_RATE, SERVE_CLIENT_RATE, ingest_reserve=INGEST_RESERVE,
+                         ingest_active=lambda: job_queue.stats()['running'] > 0)
+upstream = UpstreamScheduler(UPSTREAM_RATE, UPSTREAM_BURST, UPSTREAM_HOST_RATE, UPSTREAM_HOST_BURST,
+                             max_backoff=UPSTREAM_BACKOFF_MAX)
+
+# מדדים ל-/metrics - העדכון זול (נעילה וחיבור), המדדים הרגעיים נקראים רק באיסוף
+metrics = Registry()
+STAGE_SECONDS = metrics.register(Histogram(
+    'ytdl_stage_duration_seconds', 'Time spent per pipeline stage', ['stage']))
+DOWNLOADED_BYTES = metrics.register(Counter(
+    'ytdl_downloaded_bytes_total', 'Bytes downloaded from upstream'))
+SERVED_BYTES = metrics.register(Counter(
+    'ytdl_served_bytes_total', 'Bytes sent to clients', ['endpoint']))
+JOBS_TOTAL = metrics.register(Counter(
+    'ytdl_jobs_total', 'Download jobs by outcome', ['state']))
+RESULT_CACHE_REQUESTS = metrics.register(Counter(
+    'ytdl_result_cache_requests_total', 'Download requests served from the file cache', ['result']))
+TRANSCODES_TOTAL = metrics.register(Counter(
+    'ytdl_transcodes_total', 'Audio conversions by mode (copy, encode, none)', ['mode']))
+metrics.register(Gauge('ytdl_queue_depth', 'Jobs waiting for a worker',
+                       lambda: job_queue.stats()['queued']))
+metrics.register(Gauge('ytdl_active_downloads', 'Jobs currently downloading',
+                       lambda: job_queue.stats()['running']))
+metrics.register(Gauge('ytdl_transcodes_pending', 'Audio conversions queued or running',
+                       lambda: transcode_pool.stats()['pending']))
+metrics.register(Gauge('ytdl_cache_bytes', 'Bytes of finished files in DOWNLOAD_DIR',
+                       lambda: result_cache.total_bytes))
+metrics.register(Gauge('ytdl_cache_reserved_bytes', 'Bytes reserved by downloads in progress',
+                       lambda: result_cache.stats()['reserved_bytes']))
+metrics.register(Gauge('ytdl_download_dir_free_bytes', 'Free bytes on the DOWNLOAD_DIR filesystem',
+                       lambda: shutil.disk_usage(DOWNLOAD_DIR).free))
+metrics.register(Gauge('ytdl_metadata_cache_hit_ratio', 'Metadata cache hit ratio',
+                       lambda: metadata_cache.stats()['hit_ratio']))
+metrics.register(Gauge('ytdl_shaped_transfers', 'File transfers under bandwidth shaping',
+                       lambda: shaper.stats()['active_transfers']))
+metrics.register(Gauge('ytdl_upstream_waiting', 'Calls waiting for an upstream token',
+                       lambda: sum(upstream.stats()['waiting'].values())))
+metrics.register(Gauge('ytdl_upstream_coalesced', 'Info requests that joined an extraction in flight',
+                       lambda: upstream.coalesced))
+metrics.register(Gauge('ytdl_import_seconds', 'Time to import the server module',
+                       lambda: startup['import_seconds']))
+
 def cleanup_old_files():
-    """מחיקת קבצים ישנים מדי דקה"""
-    while True:
+    """תחזוקה מדי דקה - פינוי המטמון לפי האינדקס והסרת עבודות ישנות"""
+    result_cache.evict()
+    job_queue.prune(600)
+    batch_runner.prune(600)
+    shared_state.prune()
+
+def lock_owner():
+    # מחושב בכל קריאה - עם gunicorn --preload התהליך שטען את המודול אינו העובד
+    return f'{NODE_URL or socket.gethostname()}:{os.getpid()}'
+
+def job_record(job):
+    """העותק של העבודה במצב המשותף. host והנתיבים מאפשרים לתהליך אחר באותו מחשב
+    להזרים את הקובץ החלקי (/api/stream)"""
+    return dict(job.to_dict(), node=NODE_URL or None, host=socket.gethostname(),
+                partial_path=job.partial_path, output_path=job.output_path,
+                stream=bool(job.params.get('stream')))
+
+# הגרסה האחרונה שפורסמה לכל עבודה ומתי
+published_jobs = {}
+
+# פרסום מהתחזוקה ומשינוי מצב במקביל - בנעילה, כך שעותק ישן לא דורס חדש
+publish_lock = threading.Lock()
+
+def publish_job(job):
+    """פרסום עבודה אחת במצב המשותף וחידוש הנעילה שלה. נקרא מיד בכל שינוי מצב
+    (on_state של התור), ומהתחזוקה כל שנייה בשביל ההתקדמות והנעילות"""
+    owner = lock_owner()
+    with publish_lock:
+        version, published_at = published_jobs.get(job.id, (None, 0))
+        # עבודה שלא השתנתה (ממתינה בתור, למקום בדיסק, להמרה) מתפרסמת שוב לפני
+        # שהעותק שלה פג - אחרת בתהליכים אחרים היא נעלמת או נראית כאילו נפלה
+        if version == job.version and (job.done or time.time() - published_at < LOCK_TTL / 3):
+            return
+        version = job.version
+        data = job_record(job)
+        # עבודה שרצה פגה יחד עם הנעילה, כך שאם התהליך נפל היא לא נשארת תקועה
+        shared_state.put_job(job.id, data, **({} if job.done else {'ttl': LOCK_TTL}))
+        if job.done:
+            shared_state.release(f'download:{job.id}', owner)
+        else:
+            shared_state.acquire(f'download:{job.id}', owner, LOCK_TTL)
+        published_jobs[job.id] = (version, time.time())
+
+def publish_jobs():
+    """פרסום העבודות של התהליך הזה במצב המשותף, כדי שתהליכים ושרתים אחרים
+    יראו אותן, וחידוש הנעילות של ההורדות שרצות - כל שנייה"""
+    for job in job_queue.all():
+        publish_job(job)
+    with publish_lock:
+        for job_id in set(published_jobs) - set(active_downloads):
+            del published_jobs[job_id]
+
+def find_job(job_id):
+    """עבודה של התהליך הזה, או העותק שלה במצב המשותף אם היא רצה במקום אחר"""
+    job = job_queue.get(job_id)
+    if job:
+        return job
+    data = shared_state.get_job(job_id)
+    return RemoteJob(shared_state, job_id, data) if data else None
+
+def upstream_host(url, video_id=None):
+    """המפתח של האתר בקצב הפניות - שם החולץ ('Youtube'), או שם השרת בקישור לא מוכר"""
+    video_id = video_id or canonical_video_id(url)
+    if video_id != url.strip():
+        return video_id.split(':', 1)[0]
+    return urlparse(url.strip()).hostname or 'unknown'
+
+def extract_metadata(url, copy_info=True, priority='info'):
+    """מידע על הסרטון מהמטמון, או חילוץ (בלי בחירת פורמט) במופע חם מהמאגר ושמירה במטמון.
+    מוחזר עותק, כי yt-dlp משנה את המילון בזמן העיבוד. copy_info=False למי שרק קורא.
+    חילוץ לאותו סרטון שכבר רץ לא יוצא שוב לאתר - מחכים לתוצאה שלו"""
+    key = canonical_video_id(url)
+    info = metadata_cache.get(key)
+    if info is None:
+        def extract():
+            with STAGE_SECONDS.time(stage='extract'), ydl_pool.checkout(YDL_INFO_OPTIONS) as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+                # קישור שמפנה לחולץ אחר (למשל shorts) - ממשיכים עד לסרטון עצמו
+                for _ in range(3):
+                    if info.get('_type') != 'url':
+                        break
+                    info = ydl.extract_info(info['url'], ie_key=info.get('ie_key'),
+                                            download=False, process=False)
+            return info
+
+        def fetch():
+            info = upstream.run(upstream_host(url, key), priority, extract, key=key,
+                                retries=UPSTREAM_RETRIES,
+                                timeout=UPSTREAM_INFO_TIMEOUT if priority == 'info' else None)
+            metadata_cache.set(key, info)
+            return info
+
+        info = upstream.coalesce(key, fetch, priority)
+    return copy.deepcopy(info) if copy_info else info
+
+def make_progress_hook(job, touched, follower=None):
+    """hook של yt-dlp שמעדכן את התקדמות העבודה ורושם ב-touched את הקבצים שנכתבו.
+    follower (FileFollower) מגבב את הקובץ תוך כדי שהוא נכתב"""
+    def hook(d):
+        if follower:
+            if d.get('status') == 'downloading' and d.get('tmpfilename'):
+                follower.follow(d['tmpfilename'], d.get('downloaded_bytes'))
+            elif d.get('status') == 'finished' and d.get('filename'):
+                follower.follow(d['filename'], final=True)
+        if d.get('tmpfilename'):
+            job.partial_path = d['tmpfilename']
+            touched.add(d['tmpfilename'])
+        if d.get('filename'):
+            job.output_path = d['filename']
+            touched.add(d['filename'])
+        job.update_progress(
+            status=d.get('status'),
+            downloaded_bytes=d.get('downloaded_bytes'),
+            total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+            speed=d.get('speed'),
+            eta=d.get('eta'),
+            filename=os.path.basename(d.get('filename', '')),
+        )
+        if d.get('status') == 'finished':
+            DOWNLOADED_BYTES.inc(d.get('total_bytes') or d.get('downloaded_bytes') or 0)
+    return hook
+
+def make_postprocessor_hook(timings):
+    """hook שמודד כל שלב עיבוד (המרה, מיזוג) ומוסיף את משכו ל-timings"""
+    started = {}
+    def hook(d):
+        name = d.get('postprocessor')
+        if d.get('status') == 'started':
+            started[name] = time.perf_counter()
+        elif d.get('status') == 'finished' and name in started:
+            elapsed = time.perf_counter() - started.pop(name)
+            timings.append(elapsed)
+            STAGE_SECONDS.observe(elapsed, stage='postprocess')
+    return hook
+
+def build_format_options(params):
+    """הגדרות yt-dlp שקובעות את תוכן הקובץ - הן גם חלק ממפתח המטמון.
+    הפורמט עצמו נבחר בזמן ההורדה לפי target (format_planner), ו-format הוא
+    הבורר השקול למקרה שאין רשימת פורמטים"""
+    target = params['target']
+    options = {
+        'format': fallback_selector(target, params['quality']),
+        'format_target': target,
+        'extractaudio': False,
+    }
+    
+    # אם מבקשים אודיו בלבד - ההמרה נעשית אחרי ההורדה במאגר ההמרות
+    if params['audio_only']:
+        options.update({
+            'extractaudio': True,
+            'audioformat': params['audio_format'],
+            'audioquality': '192',
+        })
+    
+    # בהזרמה הקובץ נשלח תוך כדי כתיבה, אסור לשכתב אותו בסוף
+    if params['stream']:
+        options['fixup'] = 'never'
+    
+    return options
+
+def run_download(job):
+    """ביצוע ההורדה בפועל - רץ בתוך עובד של התור"""
+    params = job.params
+    url = params['url']
+    
+    # הגדרות yt-dlp
+    output_template = os.path.join(DOWNLOAD_DIR, f'{job.id}.%(ext)s')
+    
+    touched = set()
+    postprocess_timings = []
+    follower = FileFollower()
+    ydl_opts = build_format_options(params)
+    ydl_opts.update({
+        'outtmpl': output_template,
+        'noprogress': True,
+        'progress_hooks': [make_progress_hook(job, touched, follower)],
+        'postprocessor_hooks': [make_postprocessor_hook(postprocess_timings)],
+    })
+    
+    # הורדת הסרטון
+    yt_dlp = load_ytdlp()
+    try:
+        # החילוץ במופע חם; להורדה מופע משלה, כי ה-hooks, תבנית השם והבורר נקבעים ביצירה
+        info = extract_metadata(url, priority='download')
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            title = info.get('title', 'Unknown')
+            duration = info.get('duration', 0)
+            
+            plan = plan_format(info, ydl_opts['format_target'])
+            if plan:
+                # הפורמט שנבחר, ואם yt-dlp סינן אותו בינתיים - הבורר הכללי
+                ydl.format_selector = ydl.build_format_selector(f"{plan['format']}/{ydl_opts['format']}")
+                job.update_progress(status='planned', format_id=plan['format'],
+                                    estimated_bytes=plan['estimated_bytes'])
+                if plan['merge']:
+                    # מיזוג של וידאו ואודיו - אין קובץ יחיד להזרים
+                    params['stream'] = False
+                if plan['estimated_bytes']:
+                    # שמירת מקום לקובץ - אם אין, ממתינים שהורדות אחרות יסתיימו
+                    job.update_progress(status='waiting_for_storage')
+                    result_cache.reserve(job.id, plan['estimated_bytes'], timeout=STORAGE_WAIT_TIMEOUT)
+            
+            # ביצוע ההורדה מהמידע שכבר חולץ, בלי לחלץ שוב
+            # גם ההורדה עוברת בתור הפניות לאתר (בלי ניסיון חוזר - הקובץ כבר בחלקו על הדיסק)
+            started = time.perf_counter()
+            info = upstream.run(upstream_host(url), 'download',
+                                lambda: ydl.process_ie_result(info, download=True))
+            STAGE_SECONDS.observe(time.perf_counter() - started - sum(postprocess_timings),
+                                  stage='download')
+        
+        # הנתיב הסופי אחרי מיזוג והמרות
+        downloads = info.get('requested_downloads') or [{}]
+        filepath = downloads[0].get('filepath') or job.output_path
+        if not filepath or not os.path.isfile(filepath):
+            raise RuntimeError('Download failed')
+    except Exception:
+        fail_download(job, touched)
+        raise
+    
+    if ydl_opts['extractaudio']:
+        # ההמרה רצה במאגר ההמרות - העובד מתפנה להורדה הבאה
+        job.update_progress(status='transcoding')
+        downloaded = {**info, **downloads[0]}
+        transcoded = transcode_pool.submit(
+            filepath, ydl_opts['audioformat'], ydl_opts['audioquality'],
+            source_codec=codec_name(downloaded.get('acodec')),
+            audio_only_source=downloaded.get('vcodec') == 'none')
+        return chain(transcoded,
+                     lambda outcome: finish_transcode(job, outcome, title, duration),
+                     lambda error: fail_download(job, touched | {filepath}))
+    
+    return finish_download(job, filepath, title, duration, digests=follower.digests(filepath))
+
+def fail_download(job, paths):
+    """מחיקת הקבצים החלקיים של הורדה שנכשלה"""
+    # ההורדה יכלה להיכשל גם בזמן ההמרה - המצב בהתקדמות לא נשאר 'transcoding'
+    job.update_progress(status='failed')
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    result_cache.release(job.id)
+    JOBS_TOTAL.inc(state=Job.FAILED)
+
+def finish_transcode(job, outcome, title, duration):
+    STAGE_SECONDS.observe(outcome['seconds'], stage='transcode')
+    TRANSCODES_TOTAL.inc(mode=outcome['mode'])
+    job.update_progress(status='finished')
+    return finish_download(job, outcome['path'], title, duration,
+                           transcode_mode=outcome['mode'],
+                           transcode_seconds=round(outcome['seconds'], 3))
+
+def finish_download(job, filepath, title, duration, digests=None, **extra):
+    """רישום הקובץ המוכן במטמון - התוצאה של העבודה. digests - גיבובי החתיכות
+    שחושבו בזמן ההורדה; בלעדיהם (מיזוג, המרה) הקובץ מגובב מהדיסק"""
+    try:
+        if digests is None:
+            with STAGE_SECONDS.time(stage='hash'):
+                digests = hash_file(filepath)
+        entry = result_cache.add(job.id, {
+            'filename': os.path.basename(filepath),
+            'title': title,
+            'duration': duration
+        }, manifest=(CHUNK_SIZE, digests))
+    except Exception:
+        # העבודה נכשלת (למשל פינוי שנכשל אחרי הרישום) - הרשומה והקובץ נמחקים,
+        # והעבודה נספרת פעם אחת, ככישלון
+        result_cache.discard(job.id)
+        fail_download(job, {filepath})
+        raise
+    JOBS_TOTAL.inc(state=Job.FINISHED)
+    entry.update(extra)
+    return entry
+
+job_queue = JobQueue(run_download, workers=MAX_CONCURRENT_DOWNLOADS,
+                     max_pending=MAX_QUEUED_DOWNLOADS, registry=active_downloads, autostart=False,
+                     on_state=publish_job)
+
+def parse_download_params(data, url):
+    """הגדרות ההורדה מגוף הבקשה. זורק ValueError על ערך לא תקין"""
+    # null נחשב כמו שדה חסר
+    quality = data.get('quality')
+    if quality is None:
+        quality = 'best'
+    audio_only = bool(data.get('audio_only'))
+    audio_format = data.get('audio_format', 'mp3')
+    if audio_format not in AUDIO_FORMATS:
+        audio_format = 'mp3'
+    return {
+        'url': url,
+        'quality': quality,
+        'audio_only': audio_only,
+        'audio_format': audio_format,
+        # הרזולוציה המקסימלית מ-quality ('720p'), קונטיינר, קודק וגודל מקסימלי
+        'target': make_target(quality, audio_format if audio_only else None,
+                              container=data.get('container'), vcodec=data.get('vcodec'),
+                              max_filesize=data.get('max_filesize')),
+        # הזרמה אפשרית רק כשנוצר קובץ יחיד בלי מיזוג או המרה
+        'stream': bool(data.get('stream')) and not audio_only and '+' not in quality,
+    }
+
+def start_download(params):
+    """יצירת עבודת הורדה או הצטרפות לקיימת. זורק QueueFull כשהתור מלא,
+    ו-InsufficientStorage כשכבר ידוע שהקובץ גדול מהמכסה.
+    מזהה ההורדה נגזר מהסרטון ומההגדרות - בקשות זהות מקבלות אותו מזהה,
+    ואם הקובץ כבר במטמון העבודה נרשמת כגמורה מיד"""
+    video_id = canonical_video_id(params['url'])
+    download_id = cache_key(video_id, build_format_options(params))
+    job = Job(params, job_id=download_id)
+    
+    cached = result_cache.get(download_id)
+    RESULT_CACHE_REQUESTS.inc(result='hit' if cached else 'miss')
+    if cached:
+        return job_queue.register_finished(job, cached)
+    if NODE_URL:
+        # הקובץ כבר מוכן בשרת אחר - /api/file יפנה אליו
+        location = shared_state.get_file(download_id)
+        if location and location['node'] != NODE_URL:
+            return job_queue.register_finished(job, location)
+    
+    # אם המידע כבר במטמון אפשר לדחות מיד קובץ שלא ייכנס
+    info = metadata_cache.peek(video_id)
+    plan = plan_format(info, params['target']) if info else None
+    if plan and plan['estimated_bytes']:
+        result_cache.check(plan['estimated_bytes'])
+    
+    # single-flight בין תהליכים ושרתים: מי שמחזיק בנעילה מוריד, השאר עוקבים אחריו
+    existing = job_queue.get(download_id)
+    if not existing or existing.done:
+        owner = lock_owner()
+        if not shared_state.acquire(f'download:{download_id}', owner, LOCK_TTL):
+            return RemoteJob(shared_state, download_id, shared_state.get_job(download_id))
         try:
-            for filename in os.listdir(DOWNLOAD_DIR):
-                filepath = os.path.join(DOWNLOAD_DIR, filename)
-                if os.path.isfile(filepath):
-                    # מחיקת קבצים שישנים מ-10 דקות
-                    if time.time() - os.path.getmtime(filepath) > 600:
-                        os.remove(filepath)
-        except Exception as e:
-            print(f"Error in cleanup: {e}")
-        time.sleep(60)
-
-# הפעלת ניקוי קבצים ברקע
-cleanup_thread = threading.Thread(target=cleanup_old_files, daemon=True)
-cleanup_thread.start()
+            job = job_queue.submit(job)
+        except QueueFull:
+            shared_state.release(f'download:{download_id}', owner)
+            raise
+        # פרסום מיידי - בלי לחכות ל-publish_jobs, כדי שתהליך אחר לא יחזיר 404 על המזהה
+        shared_state.put_job(job.id, job_record(job), ttl=LOCK_TTL)
+        return job
+    return job_queue.submit(job)
+
+def expand_urls(url):
+    """קישורי הסרטונים שבפלייליסט (חילוץ שטוח, בלי לחלץ כל סרטון), או הקישור עצמו"""
+    def extract():
+        with ydl_pool.checkout(YDL_FLAT_OPTIONS) as ydl:
+            return ydl.extract_info(url, download=False, process=False)
+    
+    # פריסת פלייליסטים בעדיפות הנמוכה ביותר - אחרי בקשות מידע והורדות
+    info = upstream.run(upstream_host(url), 'batch', extract, retries=UPSTREAM_RETRIES)
+    
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        # סרטון בודד - המידע כבר חולץ, שומרים אותו כדי שההורדה לא תחלץ שוב
+        if info.get('_type', 'video') == 'video':
+            metadata_cache.set(canonical_video_id(url), info)
+        return [url]
+    
+    entries = itertools.islice(info.get('entries') or [], MAX_BATCH_ITEMS)
+    return [entry.get('webpage_url') or entry.get('url') for entry in entries if entry]
+
+batch_runner = BatchRunner(expand_urls, start_download,
+                           max_active=MAX_ACTIVE_BATCHES, max_items=MAX_BATCH_ITEMS)
+
+# כל התחזוקה ב-thread אחד לתהליך
+maintenance = Maintenance()
+maintenance.every(60, cleanup_old_files)
+maintenance.every(1, publish_jobs)
+maintenance.every(LOCK_TTL / 3, result_cache.renew_leases, name='renew_leases')
+
+# זמני העלייה, ל-/health ול-/metrics
+startup = {'import_seconds': None, 'start_seconds': None, 'yt_dlp_preload_seconds': None}
+started_pid = None
+start_lock = threading.Lock()
+
+def start():
+    """הפעלת השירותים של התהליך: עובדי ההורדות, התחזוקה ומופעי YoutubeDL חמים.
+    ייבוא המודול לא מפעיל שום thread - start נקרא בבקשה הראשונה של כל תהליך
+    (אחרי fork של gunicorn, threads של התהליך הראשי לא קיימים בעובדים)"""
+    global started_pid
+    if started_pid == os.getpid():
+        return
+    with start_lock:
+        if started_pid == os.getpid():
+            return
+        began = time.perf_counter()
+        # שאריות של הורדות שנקטעו כשהשרת נעצר
+        result_cache.remove_partials(600)
+        job_queue.start()
+        maintenance.start()
+        # מופע חם לבקשות המידע הראשונות, בלי לעכב את הבקשה הנוכחית
+        threading.Thread(target=lambda: ydl_pool.warm(YDL_INFO_OPTIONS, 2), daemon=True).start()
+        startup['start_seconds'] = round(time.perf_counter() - began, 4)
+        started_pid = os.getpid()
+
+@app.before_request
+def start_on_first_request():
+    start()
+
+def busy_response(message='Server is busy, try again later'):
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = '30'
+    return response, 429
+
+def event_stream(job):
+    """זרם Server-Sent Events עם מצב העבודה (או הקבוצה) עד לסיומה"""
+    def generate():
+        version = None
+        while True:
+            current = job.wait_for_change(version, timeout=15)
+            if current == version:
+                # שמירה על החיבור פתוח דרך פרוקסים
+                yield ': keep-alive\n\n'
+                continue
+            version = current
+            data = job.to_dict()
+            yield f'data: {json.dumps(data)}\n\n'
+            # לפי המצב שנשלח - העבודה יכולה להסתיים בין to_dict לבדיקה
+            if data['state'] in (Job.FINISHED, Job.FAILED):
+                break
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/download', methods=['POST'])
 def download_video():
     try:
         data = request.get_json()
         url = data.get('url')
-        quality = data.get('quality', 'best')
         
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        # יצירת מזהה ייחודי להורדה
-        download_id = str(uuid.uuid4())
+        try:
+            params = parse_download_params(data, url)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # הגדרות yt-dlp
-        output_template = os.path.join(DOWNLOAD_DIR, f'{download_id}.%(ext)s')
+        try:
+            job = start_download(params)
+        except QueueFull:
+            return busy_response()
+        except InsufficientStorage as e:
+            return jsonify({'error': str(e)}), 507
         
-        ydl_opts = {
-            'format': quality,
-            'outtmpl': output_template,
-            'extractaudio': False,
+        response = {
+            'success': True,
+            'download_id': job.id,
+            'state': job.state,
+            'status_url': f'/api/jobs/{job.id}'
         }
+        if job.state == Job.FINISHED:
+            response['cached'] = True
+            return jsonify(response)
+        return jsonify(response), 202
         
-        # אם מבקשים אודיו בלבד
-        if data.get('audio_only'):
-            ydl_opts.update({
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }]
-            })
-        
-        # הורדת הסרטון
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            title = info.get('title', 'Unknown')
-            duration = info.get('duration', 0)
-            
-            # ביצוע ההורדה
-            ydl.download([url])
-        
-        # מציאת הקובץ שהורד
-        downloaded_file = None
-        for file in os.listdir(DOWNLOAD_DIR):
-            if file.startswith(download_id):
-                downloaded_file = file
-                break
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch', methods=['POST'])
+def create_batch():
+    """הורדת רשימת קישורים ו/או פלייליסטים. כל פריט נכנס לתור ההורדות הרגיל,
+    ולכל היותר max_parallel פריטים של הקבוצה פעילים בו-זמנית"""
+    try:
+        data = request.get_json()
+        urls = data.get('urls') or ([data['url']] if data.get('url') else [])
         
-        if not downloaded_file:
-            return jsonify({'error': 'Download failed'}), 500
+        if not urls or not all(isinstance(url, str) for url in urls):
+            return jsonify({'error': 'urls is required'}), 400
+        
+        max_parallel = max(1, min(int(data.get('max_parallel', 2)), MAX_CONCURRENT_DOWNLOADS))
+        try:
+            options = parse_download_params(data, None)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        options.pop('url')
+        options['stream'] = False
+        
+        try:
+            batch = batch_runner.submit(Batch({'urls': urls, 'options': options}, max_parallel))
+        except QueueFull:
+            return busy_response('Too many active batches, try again later')
         
         return jsonify({
             'success': True,
-            'download_id': download_id,
-            'filename': downloaded_file,
-            'title': title,
-            'duration': duration
-        })
+            'batch_id': batch.id,
+            'status_url': f'/api/batch/{batch.id}',
+            'events_url': f'/api/batch/{batch.id}/events',
+            'zip_url': f'/api/batch/{batch.id}/zip'
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/batch/<batch_id>')
+def get_batch(batch_id):
+    batch = batch_runner.get(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(batch.to_dict())
+
+@app.route('/api/batch/<batch_id>/events')
+def batch_events(batch_id):
+    batch = batch_runner.get(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    return event_stream(batch)
+
+class ZipStream:
+    """יעד כתיבה ל-zipfile שאוסף את הבתים כדי לשלוח אותם בהמשך - בלי לשמור את כל הארכיון"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+@app.route('/api/batch/<batch_id>/zip')
+def batch_zip(batch_id):
+    """ZIP בזרם של קבצי הקבוצה - כל קובץ נשלח ברגע שההורדה שלו מסתיימת"""
+    batch = batch_runner.get(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    def wait_for_item(index):
+        version = None
+        while True:
+            with batch._changed:
+                expanded = batch.state not in (Job.QUEUED, Batch.EXPANDING)
+                if expanded and (index >= len(batch.items) or batch.done
+                                 or batch.items[index]['state'] in (Job.FINISHED, Job.FAILED)):
+                    return batch.items[index] if index < len(batch.items) else None
+            version = batch.wait_for_change(version, timeout=15)
+    
+    def generate():
+        stream = ZipStream()
+        names = set()
+        # קבצי מדיה כבר דחוסים - ZIP_STORED חוסך CPU
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+            for index in itertools.count():
+                item = wait_for_item(index)
+                if item is None:
+                    break
+                entry = result_cache.get(item['download_id']) if item.get('download_id') else None
+                if item['state'] != Job.FINISHED or not entry:
+                    continue
+                
+                ext = os.path.splitext(entry['filename'])[1]
+                title = item.get('title') or entry.get('title') or item['download_id']
+                base = re.sub(r'[\\/:*?"<>|]+', '_', title)
+                name = f'{base}{ext}'
+                for n in itertools.count(2):
+                    if name not in names:
+                        break
+                    name = f'{base} ({n}){ext}'
+                names.add(name)
+                
+                with result_cache.pinned(item['download_id']), \
+                        open(result_cache.path(entry), 'rb') as src, \
+                        archive.open(name, 'w', force_zip64=True) as dest:
+                    for block in iter(lambda: src.read(STREAM_CHUNK_SIZE), b''):
+                        dest.write(block)
+                        data = stream.drain()
+                        SERVED_BYTES.inc(len(data), endpoint='zip')
+                        yield data
+                yield stream.drain()
+        yield stream.drain()
+    
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename=batch-{batch.id}.zip'})
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = find_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    job = find_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return event_stream(job)
+
 @app.route('/api/file/<download_id>')
 def get_file(download_id):
     try:
-        # מציאת הקובץ
-        for filename in os.listdir(DOWNLOAD_DIR):
-            if filename.startswith(download_id):
-                filepath = os.path.join(DOWNLOAD_DIR, filename)
-                # שליחת הקובץ עם מחיקה אוטומטית אחרי השליחה
-                return send_file(filepath, as_attachment=True, 
-                               download_name=filename)
+        # מציאת הקובץ במטמון
+        entry = result_cache.get(download_id)
+        if entry:
+            # הקובץ לא יפונה כל עוד הוא נשלח, גם ללקוח איטי
+            result_cache.pin(download_id)
+            if request.range and len(request.range.ranges) > 1:
+                # כמה טווחים (multipart/byteranges) לא נתמכים - הקובץ כולו, 200
+                request.environ.pop('HTTP_RANGE')
+            try:
+                # conditional - תמיכה ב-Range, If-Range ו-ETag להמשך הורדה שנקטעה
+                response = send_file(result_cache.path(entry), as_attachment=True, 
+                                   download_name=entry['filename'], conditional=True,
+                                   etag=file_etag(download_id, entry))
+            except FileNotFoundError:
+                # הקובץ נמחק מחוץ לשרת
+                result_cache.unpin(download_id)
+                result_cache.discard(download_id)
+            except BaseException:
+                result_cache.unpin(download_id)
+                raise
+            else:
+                on_response_close(response, lambda: result_cache.unpin(download_id))
+                return shape_transfer(measure_transfer(response), download_id)
+        
+        # הקובץ בשרת אחר
+        location = shared_state.get_file(download_id) if NODE_URL else None
+        if location and location['node'] != NODE_URL:
+            if FILE_PROXY:
+                return shape_transfer(proxy_file(f"{location['node']}/api/file/{download_id}"),
+                                      download_id, endpoint='proxy')
+            return redirect(f"{location['node']}/api/file/{download_id}", code=307)
         
         return jsonify({'error': 'File not found'}), 404
         
+    except HTTPException:
+        # למשל 416 על טווח מחוץ לקובץ
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def file_etag(download_id, entry):
+    return f"{download_id}-{entry['size']}-{int(entry['created_at'])}"
+
+@app.route('/api/file/<download_id>/manifest')
+def get_file_manifest(download_id):
+    """גיבוב לכל חתיכה בקובץ, לבדיקה בצד הלקוח. etag זהה ל-ETag של הקובץ עצמו"""
+    entry = result_cache.get(download_id)
+    if entry:
+        manifest = result_cache.manifest(download_id)
+        if not manifest:
+            # קובץ שהורד לפני שהיו גיבובים
+            return jsonify({'error': 'No manifest for this file'}), 404
+        return json_response({
+            'size': entry['size'],
+            'etag': file_etag(download_id, entry),
+            'algorithm': ALGORITHM,
+            **manifest,
+        })
+    
+    location = shared_state.get_file(download_id) if NODE_URL else None
+    if location and location['node'] != NODE_URL:
+        url = f"{location['node']}/api/file/{download_id}/manifest"
+        if not FILE_PROXY:
+            return redirect(url, code=307)
+        # לא דרך proxy_file, שמבקש בלי דחיסה - תשובת JSON קטנה נדחסת כאן מחדש
+        import requests
+        upstream = requests.get(url, timeout=30)
+        return json_response(upstream.json(), upstream.status_code)
+    return jsonify({'error': 'File not found'}), 404
+
+# כותרות שעוברות בין הלקוח לשרת שמחזיק בקובץ
+PROXY_REQUEST_HEADERS = ('Range', 'If-Range', 'If-None-Match', 'If-Modified-Since')
+PROXY_RESPONSE_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Content-Disposition',
+                          'Accept-Ranges', 'ETag', 'Last-Modified')
+
+def proxy_file(url):
+    """העברת הקובץ משרת אחר דרך השרת הזה, כולל בקשות טווח"""
+    import requests
+    headers = {name: request.headers[name] for name in PROXY_REQUEST_HEADERS if name in request.headers}
+    # בלי דחיסה - Content-Length מועבר כמו שהוא, ו-iter_content היה מחזיר את הגוף פתוח
+    headers['Accept-Encoding'] = 'identity'
+    upstream = requests.get(url, headers=headers, stream=True, timeout=30)
+    response = Response(upstream.iter_content(STREAM_CHUNK_SIZE), status=upstream.status_code,
+                        headers={name: upstream.headers[name] for name in PROXY_RESPONSE_HEADERS
+                                 if name in upstream.headers})
+    response.call_on_close(upstream.close)
+    return measure_transfer(response, endpoint='proxy')
+
+def on_response_close(response, callback):
+    """קריאה ל-callback כשהשרת מסיים לשלוח את התשובה (או כשהחיבור נסגר)"""
+    if response.direct_passthrough and hasattr(response.response, 'close'):
+        # עוטף הקובץ של send_file (direct_passthrough) לא עובר דרך Response.close -
+        # close שלו נקרא בסוף השליחה, ו-call_on_close לא היה נקרא במקרה הזה
+        file_close = response.response.close
+        closed = []
+        
+        def close():
+            file_close()
+            if not closed:
+                closed.append(True)
+                callback()
+        
+        response.response.close = close
+    else:
+        response.call_on_close(callback)
+    return response
+
+def shape_transfer(response, download_id, endpoint='file'):
+    """שליחת גוף התשובה בקצב שה-shaper מקצה. בלי מגבלה התשובה לא משתנה"""
+    if not shaper.enabled or request.method == 'HEAD' or response.status_code not in (200, 206):
+        return response
+    transfer = shaper.open(request.remote_addr, download_id, endpoint, response.content_length)
+    response.response = ShapedBody(response.response, transfer)
+    return response
+
+class CountedBody:
+    """גוף תשובת WSGI שסופר את הבתים שהשרת באמת לקח. בלוק נספר כשהשרת מבקש
+    את הבא אחריו, כך שבחיבור שנקטע באמצע נספר רק מה שנשלח"""
+    
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+        self.sent = 0
+        self._closed = False
+    
+    def __iter__(self):
+        for block in self.body:
+            yield block
+            self.sent += len(block)
+    
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self.on_close(self.sent)
+
+def measure_transfer(response, endpoint='file'):
+    """מדידת זמן השליחה והבתים שנשלחו - נרשם כשהשרת סוגר את התשובה.
+    הגוף עובר דרך CountedBody, ולכן קובץ לא נשלח ב-sendfile של השרת
+    (השרת האסינכרוני שולח קבצים ב-sendfile בעצמו)"""
+    started = time.perf_counter()
+    
+    def on_close(sent):
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='transfer')
+        SERVED_BYTES.inc(sent, endpoint=endpoint)
+    
+    response.response = CountedBody(response.response, on_close)
+    return response
+
+def open_partial_file(job):
+    """פתיחת הקובץ שבכתיבה (או הסופי אם כבר שונה שמו)"""
+    for path in (job.partial_path, job.output_path):
+        if path:
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                continue
+    return None
+
+@app.route('/api/stream/<download_id>')
+def stream_file(download_id):
+    """הזרמת הקובץ ללקוח תוך כדי שהשרת עדיין מוריד אותו"""
+    job = find_job(download_id)
+    if not job or job.state == Job.FINISHED:
+        return get_file(download_id)
+    if isinstance(job, RemoteJob):
+        # ההורדה רצה בתהליך או בשרת אחר
+        if job.node and job.node != NODE_URL:
+            return redirect(f'{job.node}/api/stream/{download_id}', code=307)
+        if job.host != socket.gethostname():
+            return jsonify({'error': 'Download is running on another host, try again later'}), 409
+        # תהליך אחר באותו מחשב - הקובץ החלקי נקרא מהדיסק המשותף
+        streamable = job.streamable
+    else:
+        streamable = job.params.get('stream')
+    if not streamable:
+        return jsonify({'error': 'Streaming is not available for this download'}), 409
+    
+    # המתנה עד שהקובץ נוצר בדיסק
+    partial = None
+    version = None
+    deadline = time.time() + STREAM_START_TIMEOUT
+    while not job.done and time.time() < deadline:
+        partial = open_partial_file(job)
+        if partial:
+            break
+        version = job.wait_for_change(version, timeout=1)
+    
+    if not partial:
+        if job.state == Job.FINISHED:
+            return get_file(download_id)
+        if job.state == Job.FAILED:
+            return jsonify({'error': job.error}), 500
+        return jsonify({'error': 'Download did not start in time'}), 504
+    
+    filename = os.path.basename(job.output_path or partial.name)
+    
+    def generate():
+        version = None
+        finished = False
+        with partial:
+            while True:
+                chunk = partial.read(STREAM_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                elif finished:
+                    break
+                elif job.done:
+                    # קריאה אחרונה של מה שנכתב לפני סיום העבודה
+                    finished = True
+                else:
+                    version = job.wait_for_change(version, timeout=0.5)
+    
+    # בזמן הכתיבה אין אורך ידוע ולכן אין Range - המשך אפשרי דרך /api/file בסיום
+    headers = {
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Accept-Ranges': 'none',
+    }
+    if job.progress.get('total_bytes'):
+        headers['X-Expected-Length'] = str(job.progress['total_bytes'])
+    
+    response = Response(generate(), headers=headers,
+                        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    return measure_transfer(response, endpoint='stream')
+
 @app.route('/api/info', methods=['POST'])
 def get_video_info():
     try:
@@ -121,36 +1001,103 @@ def get_video_info():
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(url, download=False)
+        try:
+            filters, sort_keys, fields = parse_format_query(request.args)
+            params = parse_download_params(data, url)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # רק קריאה מהמידע - בלי העתקה של המילון השלם
+        info = extract_metadata(url, copy_info=False)
+        
+        # הפורמט שהורדה עם אותן הגדרות תבחר, והגודל המשוער שלו
+        plan = plan_format(info, params['target'])
+        
+        formats = sort_formats(filter_formats(format_table(info), **filters), sort_keys)
+        if 'limit' in request.args:
+            formats = formats[:int(request.args['limit'])]
+        if fields:
+            formats = [{k: row[k] for k in fields if k in row} for row in formats]
             
-        return jsonify({
+        return json_response({
             'title': info.get('title'),
             'duration': info.get('duration'),
             'uploader': info.get('uploader'),
             'view_count': info.get('view_count'),
-            'formats': [
-                {
-                    'quality': f.get('height', 'audio'),
-                    'ext': f.get('ext'),
-                    'filesize': f.get('filesize')
-                }
-                for f in info.get('formats', [])[:10]  # מגביל ל-10 פורמטים
-            ]
+            'formats': formats,
+            'plan': plan
         })
         
+    except Throttled as e:
+        return busy_response(str(e))
     except Exception as e:
+        if is_throttled(e):
+            return busy_response('Upstream is rate limiting requests, try again later')
         return jsonify({'error': str(e)}), 500
 
+def parse_format_query(args):
+    """סינון, מיון והקרנה של טבלת הפורמטים מפרמטרי ה-URL. זורק ValueError על ערך לא תקין"""
+    filters = {}
+    for name in ('min_height', 'max_height', 'max_filesize'):
+        if name in args:
+            if not args[name].isdigit():
+                raise ValueError(f'{name} must be a non-negative integer')
+            filters[name] = int(args[name])
+    for name in ('ext', 'vcodec', 'acodec', 'kind'):
+        if args.get(name):
+            filters[name] = args[name]
+    if filters.get('kind') not in (None, 'video', 'audio', 'muxed'):
+        raise ValueError('kind must be video, audio or muxed')
+    if 'limit' in args and not args['limit'].isdigit():
+        raise ValueError('limit must be a non-negative integer')
+    
+    sort_keys = [key for key in args.get('sort', '').split(',') if key]
+    fields = [field for field in args.get('fields', '').split(',') if field]
+    unknown = {key.lstrip('-') for key in sort_keys} | set(fields)
+    unknown -= set(TABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown format fields: {', '.join(sorted(unknown))}")
+    return filters, sort_keys, fields
+
+def json_response(payload, status=200):
+    """JSON בלי רווחים, דחוס ב-gzip כשהלקוח תומך והתשובה לא קטנה"""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/api/transfers')
+def list_transfers():
+    """השליחות הפעילות ב-/api/file: לקוח, בתים שנשלחו, קצב וזמן המתנה לכל חיבור"""
+    return jsonify({**shaper.stats(), 'transfers': shaper.transfers()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+    return jsonify({
+        'status': 'ok',
+        'timestamp': datetime.now().isoformat(),
+        'queue': job_queue.stats(),
+        'cache': result_cache.stats(),
+        'transcode': transcode_pool.stats(),
+        'metadata_cache': metadata_cache.stats(),
+        'ydl_pool': ydl_pool.stats(),
+        'upstream': upstream.stats(),
+        'shaping': shaper.stats(),
+        'startup': startup,
+        'maintenance': maintenance.stats(),
+    })
+
+if PRELOAD_YTDLP:
+    startup['yt_dlp_preload_seconds'] = round(preload(), 4)
+startup['import_seconds'] = round(time.perf_counter() - IMPORT_STARTED, 4)
 
 if __name__ == '__main__':
+    start()
     app.run(host='0.0.0.0', port=5000, debug=False)
-3.2 הפעלת השרת
-bash# הפעלה רגילה לבדיקה
-python3 app.py
-
-# הפעלה עם Gunicorn לייצור
-gunicorn -w 2 -b 0.0.0.0:5000 app:app
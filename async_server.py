@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+שרת אסינכרוני (asyncio) לאותו API של app.py, בלי תלויות נוספות
+
+    python async_server.py --host 0.0.0.0 --port 5000
+
+כל חיבור הוא coroutine ולא thread, כך שתהליך אחד מחזיק אלפי לקוחות איטיים או ממתינים:
+* /api/file/<id> נשלח ישירות מהדיסק לסוקט (sendfile) בלי לעבור דרך Python
+* /api/jobs/<id>/events ממתין לשינוי בעבודה בלי thread ממתין
+* שאר הנתיבים עוברים לאפליקציית Flask במאגר threads חסום - חילוץ המידע
+  (yt-dlp) והגישה לאינדקס לא חוסמים את לולאת האירועים
+* תשובות זורמות של Flask (/api/stream, אירועי batch, zip) נקראות במאגר threads
+  נפרד, כך שזרמים ארוכים לא תופסים את ה-threads של הבקשות הקצרות
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import mimetypes
+import os
+import sys
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import quote, unquote, urlsplit
+
+from werkzeug.http import http_date, parse_etags, parse_if_range_header, parse_range_header, quote_etag
+
+from app import SERVED_BYTES, STAGE_SECONDS, app, file_etag, find_job, result_cache, shaper, start
+from jobs import Job
+
+# threads לקריאות חוסמות (Flask, yt-dlp, SQLite) - לא לחיבורים, שאינם מוגבלים
+ASYNC_EXECUTOR_THREADS = int(os.environ.get('ASYNC_EXECUTOR_THREADS', 32))
+# threads לקריאת תשובות זורמות של Flask - thread לכל זרם פעיל
+ASYNC_STREAM_THREADS = int(os.environ.get('ASYNC_STREAM_THREADS', 256))
+# חיבור keep-alive בלי בקשה חדשה נסגר אחרי
+KEEPALIVE_TIMEOUT = 75
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+# תשובה של Flask עד הגודל הזה נקראת כולה בקריאה אחת ל-thread
+BUFFERED_RESPONSE_BYTES = 256 * 1024
+SSE_KEEPALIVE = 15
+
+executor = ThreadPoolExecutor(max_workers=ASYNC_EXECUTOR_THREADS, thread_name_prefix='async-worker')
+stream_executor = ThreadPoolExecutor(max_workers=ASYNC_STREAM_THREADS, thread_name_prefix='async-stream')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, target, version, headers, body, peer):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        self.body = body
+        self.peer = peer
+        # נשלחו כבר כותרות תשובה - שגיאה מכאן והלאה רק סוגרת את החיבור
+        self.responded = False
+        url = urlsplit(target)
+        self.path = unquote(url.path, encoding='latin-1')
+        self.query = url.query
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+
+def run(func, *args):
+    return asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+def run_stream(func, *args):
+    return asyncio.get_running_loop().run_in_executor(stream_executor, func, *args)
+
+
+async def read_request(reader, peer):
+    """קריאת בקשה אחת מהחיבור - None אם הלקוח סגר אותו בין בקשות"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HTTPError(400, 'Incomplete request')
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, 'Request headers too large')
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HTTPError(400, 'Malformed request line')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HTTPError(411, 'Chunked request bodies are not supported')
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(400, 'Invalid Content-Length')
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, 'Request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return Request(method, target, version, headers, body, peer)
+
+
+def response_head(status, headers, keep_alive):
+    if isinstance(status, int):
+        status = f'{status} {HTTPStatus(status).phrase}'
+    lines = [f'HTTP/1.1 {status}', f'Date: {http_date()}', 'Server: youtube-downloader-async']
+    lines += [f'{name}: {value}' for name, value in headers]
+    if not keep_alive:
+        lines.append('Connection: close')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def send_head(request, writer, status, headers, keep_alive):
+    request.responded = True
+    writer.write(response_head(status, headers, keep_alive))
+
+
+async def send_json(writer, status, payload, keep_alive, request=None):
+    body = json.dumps(payload).encode('utf-8')
+    if request:
+        request.responded = True
+    writer.write(response_head(status, [('Content-Type', 'application/json'),
+                                        ('Content-Length', str(len(body)))], keep_alive) + body)
+    await writer.drain()
+    return keep_alive
+
+
+async def handle_connection(reader, writer):
+    peer = writer.get_extra_info('peername') or ('', 0)
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request(reader, peer), KEEPALIVE_TIMEOUT)
+            except HTTPError as e:
+                await send_json(writer, e.status, {'error': str(e)}, keep_alive=False)
+                break
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                break
+            if request is None or not await dispatch(request, writer):
+                break
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def dispatch(request, writer):
+    """טיפול בבקשה - מחזיר האם החיבור נשאר פתוח לבקשה הבאה"""
+    parts = request.path.strip('/').split('/')
+    try:
+        if request.method in ('GET', 'HEAD') and len(parts) == 3 and parts[:2] == ['api', 'file']:
+            return await serve_file(request, writer, parts[2])
+        if (request.method == 'GET' and len(parts) == 4 and parts[:2] == ['api', 'jobs']
+                and parts[3] == 'events'):
+            return await job_events(request, writer, parts[2])
+        return await call_wsgi(request, writer)
+    except ConnectionError:
+        return False
+    except Exception as e:
+        print(f'Error handling {request.method} {request.path}: {e}', file=sys.stderr)
+        if request.responded or writer.is_closing():
+            return False
+        return await send_json(writer, 500, {'error': str(e)}, keep_alive=False)
+
+
+def content_disposition(filename):
+    def quoted(name):
+        return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    try:
+        filename.encode('ascii')
+        return f'attachment; filename={quoted(filename)}'
+    except UnicodeEncodeError:
+        # שם לא-ASCII (למשל כותרת בעברית) - RFC 5987, עם חלופה לדפדפנים ישנים
+        fallback = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return f"attachment; filename={quoted(fallback)}; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+async def serve_file(request, writer, download_id):
+    """כמו get_file ב-app.py (Range, If-Range, ETag), עם sendfile מהלולאה.
+    קובץ שאינו בשרת הזה (הפניה לשרת אחר, 404) מטופל ב-Flask"""
+    entry = await run(result_cache.get, download_id)
+    if not entry:
+        return await call_wsgi(request, writer)
+
+    # pin ו-unpin כותבים חכירה במצב המשותף (SQLite) - לא על הלולאה. ה-unpin יוצא
+    # אחרי שה-pin הסתיים, גם אם החיבור בוטל בזמן שה-pin עוד חיכה ל-thread
+    pinning = run(result_cache.pin, download_id)
+    try:
+        await asyncio.shield(pinning)
+        try:
+            file = open(result_cache.path(entry), 'rb')
+        except FileNotFoundError:
+            # הקובץ נמחק מחוץ לשרת
+            await run(result_cache.discard, download_id)
+            return await send_json(writer, 404, {'error': 'File not found'}, request.keep_alive, request)
+        with file:
+            stat = os.fstat(file.fileno())
+            size = stat.st_size
+            etag = file_etag(download_id, entry)
+            headers = [
+                ('Content-Type', mimetypes.guess_type(entry['filename'])[0] or 'application/octet-stream'),
+                ('Content-Disposition', content_disposition(entry['filename'])),
+                ('Accept-Ranges', 'bytes'),
+                ('ETag', quote_etag(etag)),
+                ('Last-Modified', http_date(stat.st_mtime)),
+                ('Cache-Control', 'no-cache'),
+            ]
+
+            if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+                send_head(request, writer, 304, headers, request.keep_alive)
+                await writer.drain()
+                return request.keep_alive
+
+            status, offset, count = 200, 0, size
+            byte_range = parse_range_header(request.headers.get('range'))
+            if_range = parse_if_range_header(request.headers.get('if-range'))
+            if if_range.etag or if_range.date:
+                # טווח רק אם הקובץ לא השתנה מאז החלק שכבר אצל הלקוח
+                if (if_range.etag != etag if if_range.etag
+                        else int(stat.st_mtime) > if_range.date.timestamp()):
+                    byte_range = None
+            if byte_range and len(byte_range.ranges) > 1:
+                # כמה טווחים (multipart/byteranges) לא נתמכים - הקובץ כולו, כמו ב-app.py
+                byte_range = None
+            if byte_range:
+                span = byte_range.range_for_length(size)
+                if span is None:
+                    headers = [('Content-Range', f'bytes */{size}'), ('Content-Length', '0')]
+                    send_head(request, writer, 416, headers, request.keep_alive)
+                    await writer.drain()
+                    return request.keep_alive
+                status, offset, count = 206, span[0], span[1] - span[0]
+                headers.append(('Content-Range', f'bytes {span[0]}-{span[1] - 1}/{size}'))
+            headers.append(('Content-Length', str(count)))
+
+            send_head(request, writer, status, headers, request.keep_alive)
+            await writer.drain()
+            if request.method == 'HEAD' or not count:
+                return request.keep_alive
+            started = time.perf_counter()
+            try:
+                if shaper.enabled:
+                    await send_shaped(request, writer, file, download_id, offset, count)
+                else:
+                    await asyncio.get_running_loop().sendfile(writer.transport, file, offset, count)
+            finally:
+                # sendfile מעדכן את מיקום הקובץ גם כשהחיבור נקטע באמצע
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='transfer')
+                SERVED_BYTES.inc(file.tell() - offset, endpoint='file')
+            return request.keep_alive
+    finally:
+        pinning.add_done_callback(lambda _: executor.submit(result_cache.unpin, download_id))
+
+
+async def send_shaped(request, writer, file, download_id, offset, count):
+    """sendfile בבלוקים, כל בלוק אחרי ההמתנה שה-shaper קבע לו"""
+    loop = asyncio.get_running_loop()
+    transfer = shaper.open(request.peer[0], download_id, 'file', count)
+    try:
+        end = offset + count
+        while offset < end:
+            size = min(shaper.chunk_size(), end - offset)
+            delay = transfer.pace(size)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await loop.sendfile(writer.transport, file, offset, size)
+            offset += size
+    finally:
+        transfer.close()
+
+
+async def wait_for_change(job, version, timeout):
+    """כמו job.wait_for_change, בלי לתפוס thread בזמן ההמתנה"""
+    if isinstance(job, Job):
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def listener():
+            try:
+                loop.call_soon_threadsafe(changed.set)
+            except RuntimeError:
+                # הלולאה כבר נסגרה
+                pass
+
+        job.add_listener(listener)
+        try:
+            if job.version == version and not job.done:
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return job.version
+        finally:
+            job.remove_listener(listener)
+
+    # עבודה שרצה בתהליך אחר - בדיקה במצב המשותף כל POLL_INTERVAL
+    deadline = time.time() + timeout
+    while True:
+        await run(job.refresh)
+        if job.version != version or job.done or time.time() >= deadline:
+            return job.version
+        await asyncio.sleep(job.POLL_INTERVAL)
+
+
+async def job_events(request, writer, job_id):
+    """כמו event_stream ב-app.py: Server-Sent Events עד סיום העבודה"""
+    job = await run(find_job, job_id)
+    if not job:
+        return await send_json(writer, 404, {'error': 'Job not found'}, request.keep_alive, request)
+
+    chunked = request.version == 'HTTP/1.1'
+    headers = [('Content-Type', 'text/event-stream; charset=utf-8'), ('Cache-Control', 'no-cache'),
+               ('X-Accel-Buffering', 'no')]
+    if chunked:
+        headers.append(('Transfer-Encoding', 'chunked'))
+    keep_alive = request.keep_alive and chunked
+    send_head(request, writer, 200, headers, keep_alive)
+
+    def write(data):
+        writer.write(b'%x\r\n%s\r\n' % (len(data), data) if chunked else data)
+
+    version = None
+    while True:
+        await writer.drain()
+        current = await wait_for_change(job, version, SSE_KEEPALIVE)
+        if current == version:
+            write(b': keep-alive\n\n')
+            continue
+        version = current
+        data = job.to_dict()
+        write(f'data: {json.dumps(data)}\n\n'.encode('utf-8'))
+        # לפי המצב שנשלח - העבודה יכולה להסתיים בין to_dict לבדיקה
+        if data['state'] in (Job.FINISHED, Job.FAILED):
+            break
+    if chunked:
+        writer.write(b'0\r\n\r\n')
+    await writer.drain()
+    return keep_alive
+
+
+def wsgi_environ(request, writer):
+    host, port = writer.get_extra_info('sockname')[:2]
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': request.path,
+        'QUERY_STRING': request.query,
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(port),
+        'SERVER_PROTOCOL': request.version,
+        'REMOTE_ADDR': request.peer[0],
+        'CONTENT_TYPE': request.headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(len(request.body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(request.body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in request.headers.items():
+        if name not in ('content-type', 'content-length'):
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def start_wsgi(environ):
+    """הרצת Flask וקריאת תחילת התשובה. תשובה קטנה נקראת כולה (וה-iterator נסגר),
+    כך שבקשת JSON רגילה עולה מעבר אחד בלבד ל-thread. מזרם (בלי Content-Length)
+    לא נקרא כלום - החתיכה הראשונה שלו יכולה לחכות להורדה"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, headers
+        return lambda data: None
+
+    body = app(environ, start_response)
+    length = next((int(v) for k, v in started['headers'] if k.lower() == 'content-length'), None)
+    iterator = iter(body)
+    chunks, received = [], 0
+    if length is None:
+        return started['status'], started['headers'], chunks, iterator, body
+    try:
+        for chunk in iterator:
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= min(length, BUFFERED_RESPONSE_BYTES):
+                break
+        else:
+            iterator = None
+    except BaseException:
+        if hasattr(body, 'close'):
+            body.close()
+        raise
+    if iterator is None and hasattr(body, 'close'):
+        body.close()
+    return started['status'], started['headers'], chunks, iterator, body
+
+
+async def call_wsgi(request, writer):
+    status, headers, chunks, iterator, body = await run(start_wsgi, wsgi_environ(request, writer))
+    try:
+        has_length = any(name.lower() == 'content-length' for name, _ in headers)
+        bodyless = request.method == 'HEAD' or status[:3] in ('204', '304')
+        chunked = not has_length and not bodyless and request.version == 'HTTP/1.1'
+        keep_alive = request.keep_alive and (has_length or chunked or bodyless)
+        if chunked:
+            headers = headers + [('Transfer-Encoding', 'chunked')]
+        send_head(request, writer, status, headers, keep_alive)
+
+        def write(data):
+            if data and not bodyless:
+                writer.write(b'%x\r\n%s\r\n' % (len(data), data) if chunked else data)
+
+        for chunk in chunks:
+            write(chunk)
+        await writer.drain()
+        while iterator is not None:
+            chunk = await run_stream(next, iterator, None)
+            if chunk is None:
+                break
+            write(chunk)
+            await writer.drain()
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        return keep_alive
+    finally:
+        if iterator is not None and hasattr(body, 'close'):
+            await run_stream(body.close)
+
+
+async def serve(host, port):
+    # הנתיבים המהירים לא עוברים ב-Flask, ולכן גם לא ב-before_request שלו
+    start()
+    server = await asyncio.start_server(handle_connection, host, port, limit=MAX_HEADER_BYTES,
+                                        backlog=1024)
+    print(f'Serving on http://{host}:{port}', flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Async server for the youtube-downloader API')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+הורדת קבוצות קישורים ופלייליסטים - פיזור על תור ההורדות עם מגבלת מקביליות לכל קבוצה
+"""
+
+import threading
+import time
+from collections import deque
+
+from jobs import Job, QueueFull
+
+
+class Batch(Job):
+    """קבוצת הורדות שמתוזמנות יחד. כל פריט הופך לעבודה רגילה בתור ההורדות"""
+
+    EXPANDING = 'expanding'
+
+    def __init__(self, params, max_parallel):
+        super().__init__(params)
+        self.max_parallel = max_parallel
+        self.items = []
+
+    def update_item(self, index, **fields):
+        with self._changed:
+            self.items[index].update(fields)
+            self._notify()
+
+    def to_dict(self):
+        data = super().to_dict()
+        data.pop('job_id')
+        data.pop('download_id')
+        data.pop('progress')
+        data['batch_id'] = self.id
+        data['max_parallel'] = self.max_parallel
+        with self._changed:
+            data['items'] = [dict(item) for item in self.items]
+        return data
+
+
+class BatchRunner:
+    """מריץ כל קבוצה ב-thread מתאם משלו.
+
+    expand(url) מחזיר את רשימת קישורי הסרטונים (פלייליסט נפרש לפריטים),
+    start(params) מחזיר Job מתור ההורדות או זורק QueueFull."""
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, expand, start, max_active=10, max_items=200):
+        self.expand = expand
+        self.start = start
+        self.max_active = max_active
+        self.max_items = max_items
+        self.batches = {}
+        self._lock = threading.Lock()
+
+    def submit(self, batch):
+        """הפעלת קבוצה חדשה - זורק QueueFull אם יש יותר מדי קבוצות פעילות"""
+        with self._lock:
+            active = sum(1 for b in self.batches.values() if not b.done)
+            if active >= self.max_active:
+                raise QueueFull('Too many active batches')
+            self.batches[batch.id] = batch
+        threading.Thread(target=self._run, args=(batch,), name=f'batch-{batch.id[:8]}',
+                         daemon=True).start()
+        return batch
+
+    def get(self, batch_id):
+        with self._lock:
+            return self.batches.get(batch_id)
+
+    def prune(self, max_age):
+        cutoff = time.time() - max_age
+        with self._lock:
+            for batch_id, batch in list(self.batches.items()):
+                if batch.done and batch.finished_at < cutoff:
+                    del self.batches[batch_id]
+
+    def _run(self, batch):
+        batch.started_at = time.time()
+        batch.set_state(Batch.EXPANDING)
+        try:
+            self._expand(batch)
+            batch.set_state(Job.RUNNING)
+            self._schedule(batch)
+            states = [item['state'] for item in batch.items]
+            batch.result = {
+                'total': len(states),
+                'finished': states.count(Job.FINISHED),
+                'failed': states.count(Job.FAILED),
+            }
+            state = Job.FINISHED
+        except Exception as e:
+            batch.error = str(e)
+            state = Job.FAILED
+        batch.finished_at = time.time()
+        batch.set_state(state)
+
+    def _expand(self, batch):
+        items = []
+        for url in batch.params['urls']:
+            try:
+                urls = self.expand(url)
+            except Exception as e:
+                items.append({'url': url, 'download_id': None, 'state': Job.FAILED, 'error': str(e)})
+                continue
+            for video_url in urls:
+                items.append({'url': video_url, 'download_id': None, 'state': Job.QUEUED})
+        with batch._changed:
+            batch.items = items[:self.max_items]
+            batch._notify()
+
+    def _schedule(self, batch):
+        """הגשת פריטים לתור כך שלכל היותר max_parallel מהם פעילים בו-זמנית"""
+        pending = deque(i for i, item in enumerate(batch.items) if item['state'] == Job.QUEUED)
+        active = {}
+
+        while pending or active:
+            while pending and len(active) < batch.max_parallel:
+                index = pending[0]
+                params = dict(batch.params['options'], url=batch.items[index]['url'])
+                try:
+                    job = self.start(params)
+                except QueueFull:
+                    # התור הכללי מלא - מנסים שוב בסיבוב הבא
+                    break
+                except Exception as e:
+                    pending.popleft()
+                    batch.update_item(index, state=Job.FAILED, error=str(e))
+                    continue
+                pending.popleft()
+                active[index] = job
+                batch.update_item(index, download_id=job.id, state=job.state)
+
+            for index, job in list(active.items()):
+                item = batch.items[index]
+                if job.state != item['state'] and not job.done:
+                    batch.update_item(index, state=job.state)
+                elif job.done:
+                    del active[index]
+                    fields = {'state': job.state}
+                    if job.result:
+                        fields.update(filename=job.result.get('filename'),
+                                      title=job.result.get('title'))
+                    if job.error:
+                        fields['error'] = job.error
+                    batch.update_item(index, **fields)
+
+            if pending or active:
+                time.sleep(self.POLL_INTERVAL)
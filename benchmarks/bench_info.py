@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+זמן התגובה של /api/info עם מופע YoutubeDL חדש לכל בקשה (קר) מול מאגר המופעים (חם)
+
+    python benchmarks/bench_info.py --requests 200 --clients 4 --latency-ms 20
+
+כל בקשה לסרטון אחר, כך שמטמון המידע לא עונה במקום החילוץ. השרת מופעל
+פעמיים - עם YDL_POOL_SIZE=0 ועם ברירת המחדל.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import ResourceMonitor, Scenario, free_port, start_server
+from benchmarks.origin import start_origin
+
+MODES = (('cold', '0'), ('warm', None))
+
+
+def run_mode(args, origin, name, pool_size):
+    if pool_size is None:
+        os.environ.pop('YDL_POOL_SIZE', None)
+    else:
+        os.environ['YDL_POOL_SIZE'] = pool_size
+    port = free_port()
+    api = f'http://127.0.0.1:{port}/api'
+
+    def info(session, index):
+        response = session.post(f'{api}/info', json={'url': f'{origin}/watch?v={name}{index}'},
+                                timeout=60)
+        response.raise_for_status()
+        return len(response.content)
+
+    with tempfile.TemporaryDirectory() as download_dir:
+        server = start_server(args, port, download_dir)
+        try:
+            # החילוץ הראשון טוען את החולצים גם במצב החם - לא נמדד
+            session = requests.Session()
+            for index in range(args.warmup):
+                info(session, -1 - index)
+            scenario = Scenario(name, info, args.requests, args.clients)
+            with ResourceMonitor(server.pid) as monitor:
+                scenario.run()
+            result = scenario.report(monitor)
+            result['pool'] = session.get(f'http://127.0.0.1:{port}/health', timeout=10).json()['ydl_pool']
+        finally:
+            server.terminate()
+            server.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=4, help='לקוחות במקביל')
+    parser.add_argument('--warmup', type=int, default=4, help='בקשות לפני המדידה')
+    parser.add_argument('--latency-ms', type=float, default=20,
+                        help='השהיה של שרת המדיה לכל בקשת מידע')
+    parser.add_argument('--server-cmd',
+                        help="פקודת הפעלה לשרת, למשל 'gunicorn -w 1 --threads 8 -b 127.0.0.1:{port} app:app'")
+    parser.add_argument('--json', help='שמירת התוצאות לקובץ')
+    args = parser.parse_args()
+
+    origin_server, _ = start_origin(1024 * 1024, latency=args.latency_ms / 1000)
+    origin = f'http://127.0.0.1:{origin_server.server_port}'
+    print(f"{args.clients} clients, {args.requests} requests, origin latency {args.latency_ms}ms")
+
+    results = {}
+    for name, pool_size in MODES:
+        results[name] = result = run_mode(args, origin, name, pool_size)
+        print(f"{name:5} {result['requests_per_second']:8.2f} req/s  p50 {result['p50_ms']}ms  "
+              f"p99 {result['p99_ms']}ms  rss {result['peak_rss_mb']}MB  errors {result['errors']}  "
+              f"instances created {result['pool']['created']}, reused {result['pool']['reused']}")
+    origin_server.shutdown()
+
+    cold, warm = results['cold'], results['warm']
+    if cold['p50_ms'] and warm['p50_ms']:
+        print(f"warm vs cold: p50 {(warm['p50_ms'] - cold['p50_ms']) / cold['p50_ms'] * 100:+.1f}%  "
+              f"throughput {(warm['requests_per_second'] - cold['requests_per_second']) / cold['requests_per_second'] * 100:+.1f}%")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+זמן העלייה של השרת: ייבוא app, זמן עד תשובה ראשונה ל-/health, ובקשת
+/api/info הראשונה (שטוענת את yt-dlp) - עם טעינה עצלה ועם PRELOAD_YTDLP=1
+
+    python benchmarks/bench_startup.py --runs 5 --json startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import BENCHMARKS, ROOT, free_port
+from benchmarks.origin import start_origin
+
+MODES = (('lazy', {}), ('preload', {'PRELOAD_YTDLP': '1'}))
+
+# ייבוא בתהליך נקי: זמן הייבוא ומספר ה-threads שנשארו פעילים אחריו
+IMPORT_PROBE = '''
+import json, threading, time
+began = time.perf_counter()
+import app
+print(json.dumps({"import_seconds": time.perf_counter() - began,
+                  "threads": threading.active_count(),
+                  "yt_dlp_loaded": __import__("sys").modules.get("yt_dlp") is not None}))
+'''
+
+
+def server_env(download_dir, extra):
+    env = dict(os.environ, DOWNLOAD_DIR=download_dir, **extra)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [BENCHMARKS, ROOT, env.get('PYTHONPATH')]))
+    return env
+
+
+def measure_import(extra):
+    with tempfile.TemporaryDirectory() as download_dir:
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=ROOT, check=True,
+                                env=server_env(download_dir, extra), capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def measure_server(extra, origin, index):
+    """זמן מהפעלת התהליך ועד /health ראשון, ומשך /api/info הראשון"""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as download_dir:
+        began = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+            cwd=ROOT, env=server_env(download_dir, extra),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if time.perf_counter() - began > 30:
+                    raise RuntimeError('Server did not start within 30 seconds')
+                try:
+                    requests.get(f'http://127.0.0.1:{port}/health', timeout=1)
+                    break
+                except requests.exceptions.ConnectionError:
+                    time.sleep(0.01)
+            ready = time.perf_counter() - began
+
+            info_began = time.perf_counter()
+            response = requests.post(f'http://127.0.0.1:{port}/api/info', timeout=60,
+                                     json={'url': f'{origin}/watch?v=startup{index}'})
+            response.raise_for_status()
+            first_info = time.perf_counter() - info_began
+            startup = requests.get(f'http://127.0.0.1:{port}/health', timeout=10).json()['startup']
+        finally:
+            server.terminate()
+            server.wait()
+    return {'ready_seconds': ready, 'first_info_seconds': first_info, **startup}
+
+
+def summarize(samples):
+    """חציון לכל מדד מספרי"""
+    return {key: round(statistics.median(sample[key] for sample in samples), 4)
+            for key, value in samples[0].items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='הפעלות לכל מצב (מדווח החציון)')
+    parser.add_argument('--json', help='שמירת התוצאות לקובץ')
+    parser.add_argument('--baseline', help='קובץ תוצאות קודם להשוואה')
+    args = parser.parse_args()
+
+    origin_server, _ = start_origin(1024 * 1024)
+    origin = f'http://127.0.0.1:{origin_server.server_port}'
+
+    results = {}
+    for name, extra in MODES:
+        imports = [measure_import(extra) for _ in range(args.runs)]
+        servers = [measure_server(extra, origin, f'{name}{i}') for i in range(args.runs)]
+        results[name] = result = {**summarize(imports), **summarize(servers),
+                                  'yt_dlp_loaded_on_import': imports[0]['yt_dlp_loaded']}
+        print(f"{name:8} import {result['import_seconds'] * 1000:7.1f}ms  "
+              f"threads after import {result['threads']}  "
+              f"ready {result['ready_seconds'] * 1000:7.1f}ms  "
+              f"first /api/info {result['first_info_seconds'] * 1000:7.1f}ms")
+    origin_server.shutdown()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print('\nchange vs baseline:')
+        for name, result in results.items():
+            base = baseline.get(name, {})
+            changes = [f'{key} {(result[key] - base[key]) / base[key] * 100:+.1f}%'
+                       for key in ('import_seconds', 'ready_seconds', 'first_info_seconds')
+                       if base.get(key)]
+            print(f'  {name:8} ' + '  '.join(changes))
+
+
+if __name__ == '__main__':
+    main()
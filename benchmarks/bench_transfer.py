@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+השוואה בין הורדה בחיבור אחד להורדה מקבילה בטווחי בתים (transfer.SegmentedDownloader)
+מול שרת מקומי עם הגבלת רוחב פס לכל חיבור
+
+    python benchmarks/bench_transfer.py --size-mb 64 --bandwidth-mbps 8 --latency-ms 50
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.origin import start_origin, synthetic_bytes
+from transfer import SegmentedDownloader, make_session
+
+
+def single_stream(session, url, path):
+    """כמו הלקוח המקורי - חיבור אחד וחתיכות של 8KB"""
+    with session.get(url, stream=True, timeout=60) as response, open(path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+
+
+def segmented(session, url, path, size, segments, max_segments):
+    downloader = SegmentedDownloader(session, url, path, size, initial_segments=segments,
+                                     max_segments=max_segments)
+    downloader.run()
+    return downloader.segments
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--bandwidth-mbps', type=float, default=8,
+                        help='רוחב פס לכל חיבור במגה-בייט לשנייה (0 - ללא הגבלה)')
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--max-segments', type=int, default=16)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    bandwidth = args.bandwidth_mbps * 1024 * 1024 or None
+    server, url = start_origin(size, bandwidth=bandwidth, latency=args.latency_ms / 1000)
+    expected = hashlib.sha256(synthetic_bytes(0, size - 1)).hexdigest()
+    session = make_session(args.max_segments)
+
+    print(f"file {args.size_mb}MB, per-connection {args.bandwidth_mbps}MB/s, "
+          f"latency {args.latency_ms}ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'single.mp4')
+        began = time.time()
+        single_stream(session, url, path)
+        elapsed = time.time() - began
+        assert file_hash(path) == expected, 'single-stream download is corrupt'
+        print(f"single stream: {elapsed:7.2f}s  {args.size_mb / elapsed:7.2f}MB/s")
+
+        path = os.path.join(tmp, 'segmented.mp4')
+        began = time.time()
+        workers = segmented(session, url, path, size, args.segments, args.max_segments)
+        elapsed = time.time() - began
+        assert file_hash(path) == expected, 'segmented download is corrupt'
+        print(f"segmented:     {elapsed:7.2f}s  {args.size_mb / elapsed:7.2f}MB/s  "
+              f"({workers} connections)")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+בדיקת עומס לשרת (app.py) בלי רשת חיצונית - חולץ yt-dlp מדומה ומדיה סינתטית משרת מקומי
+
+    python benchmarks/loadtest.py --clients 8 --requests 100 --size-mb 8 --json result.json
+    python benchmarks/loadtest.py --baseline result.json
+
+השרת רץ כתהליך נפרד עם תיקיית הורדות זמנית. התוסף benchmarks/yt_dlp_plugins
+מטפל בכתובות http://127.0.0.1:<port>/watch?v=<id> של שרת המדיה המקומי.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.origin import start_origin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, 'benchmarks')
+SCENARIOS = ('info', 'download', 'file')
+
+
+def process_tree(pid):
+    """התהליך וכל צאצאיו (למשל עובדי gunicorn)"""
+    pids = [pid]
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/task/{child}/children') as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def read_proc(pid):
+    """RSS (בתים) וקריאה/כתיבה לדיסק (בתים) של עץ התהליכים, לפי /proc"""
+    rss = read_bytes = write_bytes = 0
+    for child in process_tree(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+            with open(f'/proc/{child}/io') as f:
+                io = dict(line.split(': ') for line in f.read().splitlines())
+            read_bytes += int(io['read_bytes'])
+            write_bytes += int(io['write_bytes'])
+        except (OSError, KeyError, ValueError):
+            pass
+    return rss, read_bytes, write_bytes
+
+
+class ResourceMonitor:
+    """דגימת השימוש במשאבים של השרת לאורך תרחיש - שיא RSS ותוספת קריאה/כתיבה"""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak_rss, self._read, self._write = read_proc(self.pid)
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        rss, read_bytes, write_bytes = read_proc(self.pid)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.read_bytes = read_bytes - self._read
+        self.write_bytes = write_bytes - self._write
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, read_proc(self.pid)[0])
+
+
+def start_server(args, port, download_dir):
+    env = dict(os.environ, DOWNLOAD_DIR=download_dir)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [BENCHMARKS, ROOT, env.get('PYTHONPATH')]))
+    env.pop('YTDLP_NO_PLUGINS', None)
+    # שרת המדיה המקומי לא מגביל קצב - בלי הגבלת הפניות, אלא אם נקבעה במפורש
+    env.setdefault('UPSTREAM_RATE', '0')
+    env.setdefault('UPSTREAM_HOST_RATE', '0')
+    if args.server_cmd:
+        command = shlex.split(args.server_cmd.format(port=port))
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'Server exited with code {server.returncode}')
+        try:
+            requests.get(f'http://127.0.0.1:{port}/health', timeout=1)
+            return server
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('Server did not start within 30 seconds')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_job(session, api, job_id, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = session.get(f'{api}/jobs/{job_id}', timeout=30).json()
+        if job['state'] in ('finished', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+def download(session, api, url, quality):
+    """הגשת הורדה והמתנה לסיומה - מחזיר את מזהה ההורדה"""
+    while True:
+        response = session.post(f'{api}/download', json={'url': url, 'quality': quality},
+                                timeout=30)
+        if response.status_code != 429:
+            break
+        time.sleep(0.5)
+    response.raise_for_status()
+    data = response.json()
+    if response.status_code == 202:
+        data = wait_for_job(session, api, data['download_id'])
+        if data['state'] != 'finished':
+            raise RuntimeError(data.get('error') or 'Download failed')
+    return data['download_id']
+
+
+class Scenario:
+    """הרצת בקשה אחת (request(session, index)) שוב ושוב מ-N לקוחות במקביל"""
+
+    def __init__(self, name, request, total, clients):
+        self.name = name
+        self.request = request
+        self.total = total
+        self.clients = clients
+        self.latencies = []
+        self.errors = []
+        self.bytes = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        threads = [threading.Thread(target=self._client) for _ in range(self.clients)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - began
+
+    def _client(self):
+        session = requests.Session()
+        while True:
+            with self._lock:
+                index = self._next
+                self._next += 1
+            if index >= self.total:
+                return
+            began = time.perf_counter()
+            try:
+                received = self.request(session, index) or 0
+            except Exception as e:
+                with self._lock:
+                    self.errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - began
+            with self._lock:
+                self.latencies.append(elapsed)
+                self.bytes += received
+
+    def report(self, monitor):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            'requests': self.total,
+            'errors': len(self.errors),
+            'clients': self.clients,
+            'seconds': round(self.elapsed, 3),
+            'requests_per_second': round(len(latencies) / self.elapsed, 2),
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+            'mb_per_second': round(self.bytes / self.elapsed / 1024 / 1024, 2),
+            'peak_rss_mb': round(monitor.peak_rss / 1024 / 1024, 1),
+            'disk_read_mb': round(monitor.read_bytes / 1024 / 1024, 1),
+            'disk_write_mb': round(monitor.write_bytes / 1024 / 1024, 1),
+        }
+
+
+def build_scenarios(args, api, origin):
+    """לכל תרחיש - פונקציית בקשה אחת ופונקציית הכנה"""
+    def video_url(index):
+        # --unique: כל בקשה לסרטון חדש (מסלול קר), אחרת סבב על --videos סרטונים
+        video = f'u{index}' if args.unique else f'v{index % args.videos}'
+        return f'{origin}/watch?v={video}'
+
+    def info(session, index):
+        response = session.post(f'{api}/info', json={'url': video_url(index)}, timeout=60)
+        response.raise_for_status()
+        return len(response.content)
+
+    def download_request(session, index):
+        download(session, api, video_url(index), args.quality)
+
+    download_ids = []
+
+    def prepare_files():
+        session = requests.Session()
+        download_ids[:] = [download(session, api, f'{origin}/watch?v=v{i}', args.quality)
+                           for i in range(args.videos)]
+
+    def file(session, index):
+        download_id = download_ids[index % len(download_ids)]
+        received = 0
+        with session.get(f'{api}/file/{download_id}', stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                received += len(chunk)
+        return received
+
+    return {
+        'info': (info, None),
+        'download': (download_request, None),
+        'file': (file, prepare_files),
+    }
+
+
+def compare(results, baseline):
+    """הדפסת השינוי ביחס לתוצאות קודמות"""
+    print('\nchange vs baseline:')
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        changes = []
+        for key in ('requests_per_second', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+            if result.get(key) is not None and base.get(key):
+                changes.append(f'{key} {(result[key] - base[key]) / base[key] * 100:+.1f}%')
+        print(f'  {name:9} ' + '  '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--clients', type=int, default=8, help='לקוחות במקביל')
+    parser.add_argument('--requests', type=int, default=100, help='בקשות לכל תרחיש')
+    parser.add_argument('--videos', type=int, default=10, help='סרטונים שונים בסבב')
+    parser.add_argument('--unique', action='store_true',
+                        help='כל בקשה לסרטון אחר - בלי פגיעות במטמונים')
+    parser.add_argument('--quality', default='best')
+    parser.add_argument('--size-mb', type=float, default=8, help='גודל הפורמט הגדול ביותר')
+    parser.add_argument('--bandwidth-mbps', type=float, default=0,
+                        help='רוחב פס לכל חיבור בשרת המדיה במגה-בייט לשנייה (0 - ללא הגבלה)')
+    parser.add_argument('--latency-ms', type=float, default=20,
+                        help='השהיה של שרת המדיה לכל בקשת מידע ומדיה')
+    parser.add_argument('--server-cmd',
+                        help="פקודת הפעלה לשרת, למשל 'gunicorn -w 1 --threads 8 -b 127.0.0.1:{port} app:app'")
+    parser.add_argument('--json', help='שמירת התוצאות לקובץ')
+    parser.add_argument('--baseline', help='קובץ תוצאות קודם להשוואה')
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    bandwidth = args.bandwidth_mbps * 1024 * 1024 or None
+    origin_server, _ = start_origin(size, bandwidth=bandwidth, latency=args.latency_ms / 1000)
+    origin = f'http://127.0.0.1:{origin_server.server_port}'
+
+    port = free_port()
+    api = f'http://127.0.0.1:{port}/api'
+    results = {}
+    with tempfile.TemporaryDirectory() as download_dir:
+        server = start_server(args, port, download_dir)
+        try:
+            scenarios = build_scenarios(args, api, origin)
+            names = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+            print(f"{args.clients} clients, {args.requests} requests, media {args.size_mb}MB, "
+                  f"latency {args.latency_ms}ms{', unique videos' if args.unique else ''}")
+            for name in names:
+                request, prepare = scenarios[name]
+                if prepare:
+                    prepare()
+                scenario = Scenario(name, request, args.requests, args.clients)
+                with ResourceMonitor(server.pid) as monitor:
+                    scenario.run()
+                results[name] = result = scenario.report(monitor)
+                print(f"{name:9} {result['requests_per_second']:8.2f} req/s  "
+                      f"p50 {result['p50_ms']}ms  p99 {result['p99_ms']}ms  "
+                      f"{result['mb_per_second']}MB/s  rss {result['peak_rss_mb']}MB  "
+                      f"disk r/w {result['disk_read_mb']}/{result['disk_write_mb']}MB  "
+                      f"errors {result['errors']}")
+                if scenario.errors:
+                    print(f'          first error: {scenario.errors[0]}')
+        finally:
+            server.terminate()
+            server.wait()
+    origin_server.shutdown()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
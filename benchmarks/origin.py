@@ -0,0 +1,132 @@
+"""
+שרת מדיה מקומי לבדיקות ביצועים - קובץ סינתטי עם תמיכה ב-Range,
+הגבלת רוחב פס לכל חיבור והשהיה לפני הבית הראשון.
+
+    /media/...                   - הקובץ הסינתטי (size בתים)
+    /info/<id>.json              - מידע בסגנון yt-dlp לסרטון מדומה, עם כמה פורמטים
+    /media/<id>/<format_id>.<ext> - המדיה של פורמט מסוים
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK = hashlib.sha256(b'benchmark').digest() * 2048  # 64KB
+
+
+def synthetic_bytes(start, end):
+    """הבתים start..end (כולל) של הקובץ הסינתטי"""
+    offset = start % len(BLOCK)
+    length = end - start + 1
+    repeated = BLOCK * (length // len(BLOCK) + 2)
+    return repeated[offset:offset + length]
+
+
+# פורמטים של סרטון מדומה: (format_id, ext, height, vcodec, acodec, tbr, חלק מגודל הבסיס)
+FORMATS = (
+    ('18', 'mp4', 360, 'avc1.42001E', 'mp4a.40.2', 500, 0.25),
+    ('22', 'mp4', 720, 'avc1.64001F', 'mp4a.40.2', 2000, 1.0),
+    ('140', 'm4a', None, 'none', 'mp4a.40.2', 128, 0.1),
+)
+
+
+def video_info(base_url, video_id, size):
+    """המידע שהחולץ המדומה מחזיר ל-yt-dlp"""
+    return {
+        'id': video_id,
+        'title': f'Benchmark video {video_id}',
+        'uploader': 'benchmark',
+        'duration': 600,
+        'view_count': 0,
+        'formats': [{
+            'format_id': format_id,
+            'url': f'{base_url}/media/{video_id}/{format_id}.{ext}',
+            'ext': ext,
+            'height': height,
+            'vcodec': vcodec,
+            'acodec': acodec,
+            'tbr': tbr,
+            'filesize': int(size * share),
+        } for format_id, ext, height, vcodec, acodec, tbr, share in FORMATS],
+    }
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_media(body=False)
+
+    def do_GET(self):
+        match = re.match(r'/info/([\w-]+)\.json$', self.path)
+        if match:
+            self.send_info(match.group(1))
+        else:
+            self.send_media(body=True)
+
+    def send_info(self, video_id):
+        time.sleep(self.server.latency)
+        base_url = f'http://127.0.0.1:{self.server.server_port}'
+        body = json.dumps(video_info(base_url, video_id, self.server.size)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def media_size(self):
+        match = re.match(r'/media/[\w-]+/(\w+)\.\w+$', self.path)
+        for format_id, *_, share in FORMATS:
+            if match and match.group(1) == format_id:
+                return int(self.server.size * share)
+        return self.server.size
+
+    def send_media(self, body):
+        size = self.media_size()
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"synthetic-{size}"')
+        self.end_headers()
+        if not body:
+            return
+
+        time.sleep(self.server.latency)
+        # שליחה בקצב קבוע לכל חיבור
+        step = 64 * 1024
+        began = time.time()
+        sent = 0
+        for position in range(start, end + 1, step):
+            chunk = synthetic_bytes(position, min(position + step, end + 1) - 1)
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if self.server.bandwidth:
+                ahead = sent / self.server.bandwidth - (time.time() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+def start_origin(size, bandwidth=None, latency=0.0, port=0):
+    """הפעלת השרת ב-thread ברקע - מחזיר (server, כתובת הקובץ)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), OriginHandler)
+    server.daemon_threads = True
+    server.size = size
+    server.bandwidth = bandwidth
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/media/video.mp4'
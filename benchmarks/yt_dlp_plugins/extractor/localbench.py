@@ -0,0 +1,16 @@
+"""
+חולץ yt-dlp מדומה לבדיקות ביצועים - מושך מידע ומדיה סינתטית מ-benchmarks/origin.py.
+נטען אוטומטית כתוסף של yt-dlp כשהתיקייה benchmarks נמצאת ב-PYTHONPATH
+"""
+
+from yt_dlp.extractor.common import InfoExtractor
+
+
+class LocalBenchIE(InfoExtractor):
+    IE_NAME = 'localbench'
+    _VALID_URL = r'https?://127\.0\.0\.1:(?P<port>\d+)/watch\?v=(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        port, video_id = self._match_valid_url(url).group('port', 'id')
+        # בקשת רשת אחת, כמו דף הצפייה ביוטיוב, עם ההשהיה שהוגדרה בשרת
+        return self._download_json(f'http://127.0.0.1:{port}/info/{video_id}.json', video_id)
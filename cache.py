@@ -0,0 +1,376 @@
+"""
+מטמונים של השרת - קבצים מוכנים לפי תוכן, ומידע שחולץ על סרטונים
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ydl_pool import load_ytdlp
+
+# סיומות של קבצים זמניים שיוצר yt-dlp בזמן ההורדה
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp')
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical_video_id(url):
+    """מזהה קנוני לסרטון ('Youtube:<id>') כך שקישורים שונים לאותו סרטון יתאחדו"""
+    # yt-dlp נטען רק בשימוש הראשון, כולל התוספים - בלעדיהם המפתח לא יתאים
+    # לחולץ שירוץ בפועל
+    load_ytdlp()
+    from yt_dlp.extractor import gen_extractor_classes
+
+    url = url.strip()
+    for ie in gen_extractor_classes():
+        if ie.suitable(url):
+            video_id = ie.get_temp_id(url)
+            if video_id and ie.ie_key() != 'Generic':
+                return f'{ie.ie_key()}:{video_id}'
+            break
+    return url
+
+
+def cache_key(video_id, options):
+    """מפתח המטמון - גיבוב של מזהה הסרטון וההגדרות שמשפיעות על הקובץ"""
+    payload = json.dumps([video_id, options], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class InsufficientStorage(Exception):
+    """אין מקום לקובץ - לא במכסה ולא בדיסק, גם אחרי פינוי"""
+
+
+class ResultCache:
+    """קבצים מוכנים בתיקיית ההורדות, מפונים לפי LRU כשעוברים את מגבלת הגודל.
+    הרשומות נשמרות באינדקס (FileIndex) כך שחיפוש קובץ לא סורק את התיקייה.
+
+    מנהל גם את המקום בדיסק:
+    * הפינוי מתחיל מעל high_watermark מהמכסה (או כשהדיסק מתחת ל-min_free_bytes)
+      וממשיך עד low_watermark, כדי לא לפנות קובץ אחד בכל הורדה.
+    * קבצים שנקראים כרגע (pin) לא מפונים.
+    * הורדות שרצות שומרות מקום (reserve) לפי הגודל המשוער, והמקום הזה נספר
+      כתפוס עד שהקובץ נכנס למטמון
+
+    כשכמה שרתים עובדים יחד, state (מצב משותף) ו-node (הכתובת של השרת הזה)
+    מפרסמים איפה נמצא כל קובץ.
+
+    leases (מצב משותף) - הנעיצות והמקום השמור נרשמים בו כחכירות עם תפוגה, כך
+    שכל התהליכים בשרת (gunicorn -w N, אותו אינדקס) רואים אותם בפינוי ובבדיקת
+    המקום. renew_leases מחדש אותן; חכירות של תהליך שנפל פגות אחרי lease_ttl"""
+
+    def __init__(self, directory, max_bytes, index, high_watermark=0.9, low_watermark=0.75,
+                 min_free_bytes=0, state=None, node=None, leases=None, lease_ttl=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index = index
+        self.state = state if node else None
+        self.node = node
+        self.leases = leases
+        self.lease_ttl = lease_ttl
+        self._host = node or socket.gethostname()
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.min_free_bytes = min_free_bytes
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._pins = {}
+        self._reserved = {}
+        if not len(self.index):
+            self.scan()
+        self.total_bytes = self.index.total_bytes()
+        self.evict()
+
+    def scan(self):
+        """בניית האינדקס מהקבצים שכבר קיימים בתיקייה (הפעלה ראשונה)"""
+        for filename in os.listdir(self.directory):
+            filepath = os.path.join(self.directory, filename)
+            if (filename.startswith('.') or filename.endswith(PARTIAL_SUFFIXES)
+                    or not os.path.isfile(filepath)):
+                continue
+            stat = os.stat(filepath)
+            self.index.put(filename.split('.', 1)[0], {
+                'filename': filename,
+                'size': stat.st_size,
+                'created_at': stat.st_mtime,
+                'last_access': max(stat.st_atime, stat.st_mtime),
+            })
+
+    def remove_partials(self, max_age):
+        """מחיקת קבצים זמניים שנשארו מהורדות שנקטעו (למשל בקריסה)"""
+        cutoff = time.time() - max_age
+        for filename in os.listdir(self.directory):
+            filepath = os.path.join(self.directory, filename)
+            if filename.endswith(PARTIAL_SUFFIXES) and os.path.getmtime(filepath) < cutoff:
+                os.remove(filepath)
+
+    def get(self, key):
+        """החזרת רשומת המטמון וסימונה כשימוש אחרון, או None"""
+        return self.index.get(key)
+
+    def path(self, entry):
+        return os.path.join(self.directory, entry['filename'])
+
+    def add(self, key, result, manifest=None):
+        """הוספת קובץ שהורד זה עתה - result כולל לפחות filename. משחרר את המקום ששמר reserve.
+        manifest - (chunk_size, hashes) של הקובץ, נשמר לפני שהקובץ נחשף ללקוחות"""
+        entry = dict(result)
+        entry['size'] = os.path.getsize(os.path.join(self.directory, entry['filename']))
+        if manifest:
+            self.index.put_manifest(key, *manifest)
+        old = self.index.put(key, entry)
+        with self._lock:
+            self.total_bytes += entry['size'] - (old['size'] if old else 0)
+            # המקום שנשמר להורדה נספר עכשיו בקובץ עצמו
+            if self._reserved.pop(key, None) is not None and self.leases:
+                self.leases.remove_lease('reserve', key, self._owner())
+        if self.state:
+            self.state.put_file(key, {'node': self.node, 'filename': entry['filename'],
+                                      'size': entry['size'], 'title': entry.get('title')})
+        self.evict()
+        return entry
+
+    def manifest(self, key):
+        return self.index.get_manifest(key)
+
+    def discard(self, key):
+        """הסרת רשומה שהקובץ שלה כבר לא קיים"""
+        entry = self.index.get(key, touch=False)
+        if entry:
+            self.index.remove(key)
+            with self._lock:
+                self.total_bytes -= entry['size']
+                self._space.notify_all()
+            if self.state:
+                self.state.remove_file(key, self.node)
+
+    def _owner(self):
+        # מחושב בכל קריאה - אחרי fork של gunicorn --preload לכל עובד מזהה משלו
+        return f'{self._host}:{os.getpid()}'
+
+    def _shared(self, kind):
+        """החכירות מסוג kind של כל התהליכים בשרת הזה - [(key, value)]"""
+        prefix = f'{self._host}:'
+        return [(name, value) for name, owner, value in self.leases.leases(kind)
+                if owner.startswith(prefix)]
+
+    def _pinned_keys(self):
+        with self._lock:
+            keys = set(self._pins)
+        if self.leases:
+            keys.update(name for name, _ in self._shared('pin'))
+        return keys
+
+    def _reserved_bytes(self):
+        """המקום ששמרו ההורדות שרצות - בכל התהליכים, אם יש מצב משותף"""
+        if self.leases:
+            return sum(value for _, value in self._shared('reserve'))
+        return sum(self._reserved.values())
+
+    def renew_leases(self):
+        """חידוש החכירות של התהליך הזה - נקרא מהתחזוקה, הרבה לפני lease_ttl"""
+        if not self.leases:
+            return
+        owner = self._owner()
+        with self._lock:
+            for key, count in self._pins.items():
+                self.leases.put_lease('pin', key, owner, count, self.lease_ttl)
+            for key, size in self._reserved.items():
+                self.leases.put_lease('reserve', key, owner, size, self.lease_ttl)
+
+    def pin(self, key):
+        """סימון קובץ כנקרא - לא יפונה עד unpin, גם לא בתהליך אחר"""
+        with self._lock:
+            count = self._pins[key] = self._pins.get(key, 0) + 1
+            if self.leases:
+                self.leases.put_lease('pin', key, self._owner(), count, self.lease_ttl)
+
+    def unpin(self, key):
+        with self._lock:
+            if self._pins.get(key, 0) > 1:
+                self._pins[key] -= 1
+            elif self._pins.pop(key, None) is not None and self.leases:
+                self.leases.remove_lease('pin', key, self._owner())
+
+    @contextmanager
+    def pinned(self, key):
+        self.pin(key)
+        try:
+            yield
+        finally:
+            self.unpin(key)
+
+    def check(self, size):
+        """זורק InsufficientStorage אם קובץ בגודל size לא ייכנס למכסה אף פעם"""
+        if size > self.max_bytes * self.high_watermark:
+            raise InsufficientStorage(f'File is larger than the cache quota ({size} bytes)')
+
+    def reserve(self, key, size, timeout=0):
+        """שמירת size בתים להורדה שמתחילה. אם אין מקום גם אחרי פינוי, ממתין
+        עד timeout שניות שהורדות אחרות יסתיימו, ואז זורק InsufficientStorage"""
+        self.check(size)
+        deadline = time.time() + timeout
+        while True:
+            self.evict(size)
+            with self._lock:
+                if self._fits(size):
+                    self._reserved[key] = size
+                    if self.leases:
+                        self.leases.put_lease('reserve', key, self._owner(), size, self.lease_ttl)
+                    return
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise InsufficientStorage('Not enough free storage for this download')
+                self._space.wait(min(remaining, 5))
+
+    def release(self, key):
+        """סיום ההורדה (או כישלונה) - המקום ששמרה כבר לא שמור"""
+        with self._lock:
+            if self._reserved.pop(key, None) is not None:
+                if self.leases:
+                    self.leases.remove_lease('reserve', key, self._owner())
+                self._space.notify_all()
+
+    def _fits(self, size):
+        reserved = self._reserved_bytes()
+        used = self.total_bytes + reserved + size
+        return used <= self.max_bytes and self._free_bytes(size, reserved) >= self.min_free_bytes
+
+    def _free_bytes(self, extra, reserved):
+        """המקום הפנוי בדיסק אחרי ההורדות שרצות (reserved) ו-extra בתים נוספים"""
+        free = shutil.disk_usage(self.directory).free
+        return free - reserved - extra
+
+    def _over(self, limit, extra, reserved):
+        with self._lock:
+            used = self.total_bytes + reserved + extra
+            return used > self.max_bytes * limit or self._free_bytes(extra, reserved) < self.min_free_bytes
+
+    def evict(self, extra=0):
+        """פינוי הקבצים שהשימוש בהם הכי ישן, כולל מקום ל-extra בתים נוספים.
+        מתחיל מעל high_watermark וממשיך עד low_watermark; קבצים נעוצים מדולגים"""
+        removed = []
+        # תהליכים אחרים עם אותו אינדקס מוסיפים ומוחקים קבצים גם הם
+        with self._lock:
+            self.total_bytes = self.index.total_bytes()
+        # המקום ששמרו הורדות בכל התהליכים - פעם אחת לכל פינוי
+        reserved = self._reserved_bytes()
+        if not self._over(self.high_watermark, extra, reserved):
+            return removed
+        while self._over(self.low_watermark, extra, reserved):
+            count = len(self.index)
+            # תמיד נשאר לפחות הקובץ האחרון, גם אם הוא לבדו חורג מהמגבלה
+            if count <= 1:
+                break
+            evicted = False
+            for entry in self.index.least_recently_used(min(count - 1, 64)):
+                if not self._over(self.low_watermark, extra, reserved):
+                    break
+                # נבדק ממש לפני המחיקה - תהליך אחר יכול היה לנעוץ אותו בינתיים
+                if entry['download_id'] in self._pinned_keys():
+                    continue
+                with self._lock:
+                    self.total_bytes -= entry['size']
+                self.index.remove(entry['download_id'])
+                if self.state:
+                    self.state.remove_file(entry['download_id'], self.node)
+                removed.append(entry)
+                evicted = True
+                try:
+                    os.remove(self.path(entry))
+                except OSError as e:
+                    print(f"Error evicting {entry['filename']}: {e}")
+            if not evicted:
+                # כל מה שנשאר נעוץ
+                break
+        if removed:
+            with self._lock:
+                self._space.notify_all()
+        return removed
+
+    def stats(self):
+        reserved = self._reserved_bytes()
+        pinned = len(self._pinned_keys())
+        return {
+            'entries': len(self.index),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'reserved_bytes': reserved,
+            'pinned': pinned,
+            'free_bytes': shutil.disk_usage(self.directory).free,
+        }
+
+
+class MemoryBackend:
+    """אחסון בזיכרון התהליך עם תפוגה (TTL) ופינוי LRU"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MetadataCache:
+    """מטמון למידע שמחלץ yt-dlp, לפי מזהה קנוני של הסרטון.
+    האחסון עצמו ניתן להחלפה - כל אובייקט עם get(key) ו-set(key, value, ttl)"""
+
+    def __init__(self, backend=None, ttl=1800):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def peek(self, key):
+        """כמו get, בלי להיספר כפגיעה או החטאה"""
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'ttl': self.ttl,
+        }
+        if hasattr(self.backend, '__len__'):
+            stats['entries'] = len(self.backend)
+        return stats
@@ -0,0 +1,117 @@
+"""
+גיבוב לכל חתיכה בקובץ (manifest). השרת מחשב אותו בזמן שההורדה נכתבת, והלקוח
+בודק מולו כל חתיכה שהוא מקבל ומוריד מחדש רק חתיכות פגומות
+"""
+
+import hashlib
+import os
+
+# חתיכה בגודל של חתיכת ההורדה המקבילה בלקוח - כל בקשת Range נבדקת בנפרד
+CHUNK_SIZE = 4 * 1024 * 1024
+ALGORITHM = 'sha256'
+READ_SIZE = 1024 * 1024
+
+
+def chunk_digest(data):
+    return hashlib.new(ALGORITHM, data).hexdigest()
+
+
+class ChunkHasher:
+    """גיבוב לכל chunk_size בתים של נתונים שמגיעים לפי הסדר"""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.reset()
+
+    def reset(self):
+        self.position = 0
+        self.digests = []
+        self._current = hashlib.new(ALGORITHM)
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            part = view[:self.chunk_size - self.position % self.chunk_size]
+            self._current.update(part)
+            self.position += len(part)
+            view = view[len(part):]
+            if not self.position % self.chunk_size:
+                self.digests.append(self._current.hexdigest())
+                self._current = hashlib.new(ALGORITHM)
+
+    def update_from(self, f, end=None):
+        """המשך הגיבוב מהקובץ הפתוח f, מ-position ועד end (או סוף הקובץ)"""
+        f.seek(self.position)
+        while end is None or self.position < end:
+            block = f.read(READ_SIZE if end is None else min(READ_SIZE, end - self.position))
+            if not block:
+                break
+            self.update(block)
+
+    def finish(self):
+        """כל הגיבובים, כולל החתיכה האחרונה החלקית"""
+        if self.position % self.chunk_size:
+            return self.digests + [self._current.copy().hexdigest()]
+        return list(self.digests)
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    hasher = ChunkHasher(chunk_size)
+    with open(path, 'rb') as f:
+        hasher.update_from(f)
+    return hasher.finish()
+
+
+def bad_chunks(digests, manifest):
+    """מספרי החתיכות שלא תואמות ל-manifest (או שלא התקבלו בכלל)"""
+    expected = manifest['hashes']
+    return [index for index, digest in enumerate(expected)
+            if index >= len(digests) or digests[index] != digest]
+
+
+class FileFollower:
+    """גיבוב של קובץ שנכתב לפי הסדר, כמו הורדה של yt-dlp: follow נקרא מה-progress
+    hook וקורא רק את הבתים שנוספו מאז הקריאה הקודמת, כשהם עוד במטמון הדפים -
+    כך שבסוף ההורדה הגיבובים כבר מוכנים, בלי לקרוא את הקובץ שוב"""
+
+    def __init__(self, chunk_size=CHUNK_SIZE, min_read=READ_SIZE):
+        self.hasher = ChunkHasher(chunk_size)
+        self.min_read = min_read
+        self.path = None
+        self._final_stat = None
+
+    def follow(self, path, written=None, final=False):
+        """path - הקובץ שבכתיבה (.part) או הסופי; written - כמה בתים כבר נכתבו לפי yt-dlp"""
+        target = path[:-len('.part')] if path.endswith('.part') else path
+        if target != self.path:
+            # קובץ אחר (למשל האודיו אחרי הווידאו לפני מיזוג)
+            self.path = target
+            self.hasher.reset()
+            self._final_stat = None
+        if not final and written is not None and written - self.hasher.position < self.min_read:
+            return
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size < self.hasher.position:
+                # הקובץ נכתב מחדש מההתחלה
+                self.hasher.reset()
+            self.hasher.update_from(f)
+            if final:
+                stat = os.fstat(f.fileno())
+                self._final_stat = (stat.st_size, stat.st_mtime_ns)
+
+    def digests(self, path):
+        """הגיבובים של path אם הוא הקובץ שנעקב עד סופו ולא השתנה מאז (למשל
+        ב-postprocessor שכתב אותו מחדש), אחרת None"""
+        if self._final_stat is None or os.path.abspath(path) != os.path.abspath(self.path):
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != self._final_stat or stat.st_size != self.hasher.position:
+            return None
+        return self.hasher.finish()
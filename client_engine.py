@@ -0,0 +1,390 @@
+"""
+מנוע הלקוח - הבקשות לשרת וקבלת הקבצים, בלי ממשק משתמש.
+משמש גם את האפליקציה הגרפית וגם את download_cli.py
+"""
+
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+
+from chunks import ChunkHasher, bad_chunks, hash_file
+from transfer import (MIN_SEGMENTED_SIZE, DownloadCancelled, SegmentedDownloader, make_session,
+                      repair_chunks)
+
+CONFIG_FILE = 'config.json'
+DEFAULT_CONFIG = {
+    'server_url': 'http://YOUR_SERVER_IP:5000',
+    'download_dir': os.path.expanduser('~/Downloads'),
+    'default_quality': 'best',
+    'queue_concurrency': 3,
+}
+
+
+def load_config():
+    """הגדרות הלקוח מ-config.json (נוצר עם ברירות המחדל אם אינו קיים)"""
+    try:
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                return {**DEFAULT_CONFIG, **json.load(f)}
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(DEFAULT_CONFIG, f, indent=2, ensure_ascii=False)
+    except Exception:
+        pass
+    return dict(DEFAULT_CONFIG)
+
+
+def save_config(**values):
+    config = {}
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    config.update(values)
+    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+
+
+def download_options(quality='best', audio_format=None):
+    """גוף הבקשה להגדרות ההורדה. audio_format - 'mp3' או 'm4a' להורדת אודיו בלבד"""
+    return {
+        'quality': quality,
+        'audio_only': bool(audio_format),
+        'audio_format': audio_format or 'mp3',
+    }
+
+
+class ServerError(Exception):
+    """השרת דחה את הבקשה או שההורדה בשרת נכשלה"""
+
+
+class ServerBusy(ServerError):
+    """429 - התור בשרת מלא"""
+
+
+class DownloadEvents:
+    """אירועי ההורדה מהמנוע. נקראים מה-thread של ההורדה; ממשק משתמש דורס
+    את מה שמעניין אותו ומעביר ל-thread שלו"""
+
+    def log(self, message):
+        """הודעה ליומן"""
+
+    def job_update(self, job):
+        """מצב העבודה בשרת (מזרם האירועים)"""
+
+    def transfer_progress(self, downloaded, total, rate=None, segments=None):
+        """קבלת הקובץ למחשב - total הוא 0 כשהגודל לא ידוע"""
+
+    def cancelled(self):
+        """True כדי לעצור את ההורדה - המנוע בודק בין חתיכות וזורק DownloadCancelled"""
+        return False
+
+
+class DownloadEngine:
+    """כל הבקשות לשרת אחד על Session אחד עם מאגר חיבורים, כך שכמה הורדות
+    במקביל (וכמה חיבורים לכל הורדה) משתמשות שוב באותם חיבורים"""
+
+    def __init__(self, server_url, pool_size=16, session=None):
+        self.server_url = server_url.rstrip('/')
+        self.session = session or make_session(pool_size)
+        # (תיקייה, מזהה הורדה) -> [נעילה, מספר הממתינים]
+        self._local_files = {}
+        self._local_files_lock = threading.Lock()
+
+    def health(self):
+        response = self.session.get(f'{self.server_url}/health', timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def video_info(self, url, options, params=None):
+        """מידע על הסרטון, טבלת הפורמטים והפורמט שהשרת יבחר"""
+        response = self.session.post(f'{self.server_url}/api/info', params=params,
+                                     json={'url': url, **options}, timeout=30)
+        if response.status_code != 200:
+            raise ServerError(self._error(response))
+        return response.json()
+
+    def submit(self, url, options, stream=False):
+        """שליחת בקשת הורדה - מחזיר את מזהה ההורדה"""
+        response = self.session.post(f'{self.server_url}/api/download',
+                                     json={'url': url, **options, 'stream': stream}, timeout=30)
+        if response.status_code == 429:
+            raise ServerBusy(self._error(response))
+        if response.status_code not in (200, 202):
+            raise ServerError(self._error(response))
+        return response.json()['download_id']
+
+    def download(self, url, download_dir, options, stream=True, events=None):
+        """הורדה מלאה: בקשה לשרת, מעקב, וקבלת הקובץ לתיקייה - מחזיר את הנתיב המקומי.
+        עם stream הקובץ מתקבל כבר בזמן שהשרת מוריד אותו, אם השרת מאפשר"""
+        events = events or DownloadEvents()
+        stream = stream and not options.get('audio_only')
+        download_id = self.submit(url, options, stream)
+        local_path = None
+
+        with self.local_file(download_dir, download_id, events):
+            # קבלת הקובץ תוך כדי שהשרת עוד מוריד אותו
+            if stream:
+                result = self.wait_for_job(download_id, events, until_streamable=True)
+                if result['state'] == 'running':
+                    local_path = self.stream_file(download_id, download_dir, events)
+
+            if not local_path:
+                result = self.wait_for_job(download_id, events)
+                if result['state'] == 'failed':
+                    raise ServerError(result.get('error', 'שגיאה לא ידועה'))
+                events.log(f"✅ השרת סיים להוריד: {result.get('title', 'לא ידוע')}")
+                local_path = self.fetch_file(download_id, result['filename'], download_dir, events)
+        return local_path
+
+    @contextlib.contextmanager
+    def local_file(self, download_dir, download_id, events):
+        """הקבצים המקומיים (.part, .pieces) נקראים לפי מזהה ההורדה, כך ששתי הורדות של
+        אותו קובץ לאותה תיקייה (גם בשני קישורים שונים) רצות בזו אחר זו"""
+        key = (os.path.abspath(download_dir), download_id)
+        with self._local_files_lock:
+            entry = self._local_files.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            while not entry[0].acquire(timeout=0.5):
+                if events.cancelled():
+                    raise DownloadCancelled()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._local_files_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._local_files[key]
+
+    def wait_for_job(self, download_id, events, until_streamable=False):
+        """מעקב אחרי עבודת ההורדה בשרת דרך זרם האירועים עד לסיומה
+        (או עד שהקובץ מתחיל להיכתב, אם until_streamable)"""
+        response = self.session.get(f'{self.server_url}/api/jobs/{download_id}/events',
+                                    stream=True, timeout=(10, 60))
+        response.raise_for_status()
+
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if events.cancelled():
+                    raise DownloadCancelled()
+                if not line or not line.startswith('data:'):
+                    continue
+                job = json.loads(line[len('data:'):])
+                events.job_update(job)
+                if job['state'] in ('finished', 'failed'):
+                    return job
+                if until_streamable and job.get('progress', {}).get('filename'):
+                    return job
+
+        raise requests.exceptions.ConnectionError("החיבור לשרת נותק לפני סיום ההורדה")
+
+    def fetch_file(self, download_id, filename, download_dir, events, retries=5):
+        """הורדת קובץ מוכן מהשרת - קבצים גדולים בכמה חיבורים במקביל, השאר בחיבור אחד"""
+        url = f'{self.server_url}/api/file/{download_id}'
+        local_path = os.path.join(download_dir, filename)
+
+        # קובץ שנמצא בשרת אחר מופנה אליו (307) - הטווחים וה-manifest נלקחים ישירות משם
+        head = self.session.head(url, timeout=10, allow_redirects=True)
+        url = head.url
+        size = int(head.headers.get('content-length', 0))
+        manifest = self.file_manifest(url, head.headers.get('ETag')) if head.status_code == 200 else None
+        if (head.status_code == 200 and head.headers.get('Accept-Ranges') == 'bytes'
+                and size >= MIN_SEGMENTED_SIZE):
+            return self.fetch_segmented(url, local_path, size, head.headers.get('ETag'), events,
+                                        manifest)
+        return self.fetch_single(url, local_path, events, retries, manifest)
+
+    def file_manifest(self, url, etag=None):
+        """גיבובי החתיכות של הקובץ בשרת, או None (שרת ישן או קובץ בלי manifest).
+        etag - ה-ETag של הקובץ שמורידים; manifest של גרסה אחרת לא מוחזר"""
+        try:
+            response = self.session.get(f'{url}/manifest', timeout=30)
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        manifest = response.json()
+        if etag and manifest.get('etag') != etag.strip('"'):
+            return None
+        return manifest
+
+    def verify_file(self, url, path, manifest, digests, events):
+        """בדיקת הקובץ מול ה-manifest והורדה מחדש של החתיכות הפגומות בלבד.
+        digests - הגיבובים שחושבו בזמן הקבלה, או None לגיבוב מהדיסק"""
+        if digests is None:
+            digests = hash_file(path, manifest['chunk_size'])
+        bad = bad_chunks(digests, manifest)
+        if bad:
+            events.log(f"🩹 {len(bad)} חתיכות לא תאמו לשרת - מוריד רק אותן מחדש")
+            repair_chunks(self.session, url, path, manifest, bad, etag=f'"{manifest["etag"]}"',
+                          cancelled=events.cancelled)
+        return len(bad)
+
+    def fetch_segmented(self, url, local_path, size, etag, events, manifest=None):
+        """הורדה בטווחי בתים מקבילים לקובץ .part שהוקצה מראש. עם manifest כל
+        חתיכה נבדקת מול הגיבוב שלה"""
+        part_path = local_path + '.part'
+        events.log(f"🧩 מוריד {size / 1024 / 1024:.1f}MB בכמה חיבורים במקביל")
+        options = {'piece_size': manifest['chunk_size'], 'hashes': manifest['hashes']} if manifest else {}
+        downloader = SegmentedDownloader(self.session, url, part_path, size, etag=etag,
+                                         progress=events.transfer_progress,
+                                         cancelled=events.cancelled, **options)
+        downloader.run()
+        if downloader.corrupted:
+            events.log(f"🩹 {downloader.corrupted} חתיכות הגיעו פגומות והורדו מחדש")
+        os.replace(part_path, local_path)
+        return local_path
+
+    def fetch_single(self, url, local_path, events, retries=5, manifest=None):
+        """הורדה בחיבור אחד לקובץ .part, עם המשך מאותה נקודה אחרי ניתוק.
+        עם manifest הקובץ מגובב תוך כדי הקבלה, ובסוף מורדות שוב רק חתיכות פגומות"""
+        part_path = local_path + '.part'
+        etag_path = part_path + '.etag'
+        total_size = 0
+        hasher = ChunkHasher(manifest['chunk_size']) if manifest else None
+
+        # .part שנשאר מהורדה מקבילה לא רציף - מתחילים מחדש
+        if os.path.exists(part_path + '.pieces'):
+            os.remove(part_path + '.pieces')
+            os.remove(part_path)
+
+        for attempt in range(retries + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {}
+            if offset and os.path.exists(etag_path):
+                with open(etag_path, 'r', encoding='utf-8') as f:
+                    # If-Range - אם הקובץ בשרת השתנה יחזור הקובץ המלא במקום המשך
+                    headers = {'Range': f'bytes={offset}-', 'If-Range': f.read().strip()}
+
+            try:
+                file_response = self.session.get(url, headers=headers, stream=True, timeout=(10, 60))
+
+                if file_response.status_code == 416:
+                    # ה-.part כבר מכיל את כל הקובץ
+                    file_response.close()
+                    total_size = int(file_response.headers.get('Content-Range', '/0').split('/')[-1])
+                    break
+                if file_response.status_code == 206:
+                    total_size = int(file_response.headers['Content-Range'].split('/')[-1])
+                    events.log(f"⏯️ ממשיך הורדה מ-{offset / 1024 / 1024:.1f}MB")
+                    # גיבוב רציף רק אם הגיע בדיוק עד כאן (.part מהרצה קודמת - מגובב מהדיסק בסוף)
+                    self.write_response(file_response, part_path, total_size, events, offset=offset,
+                                        hasher=hasher if hasher and hasher.position == offset else None)
+                elif file_response.status_code == 200:
+                    total_size = int(file_response.headers.get('content-length', 0))
+                    if file_response.headers.get('ETag'):
+                        with open(etag_path, 'w', encoding='utf-8') as f:
+                            f.write(file_response.headers['ETag'])
+                    if manifest and file_response.headers.get('ETag', '').strip('"') != manifest['etag']:
+                        # הקובץ בשרת הוחלף מאז שה-manifest נקרא
+                        manifest = hasher = None
+                    if hasher:
+                        hasher.reset()
+                    self.write_response(file_response, part_path, total_size, events, hasher=hasher)
+                else:
+                    file_response.close()
+                    raise ServerError("שגיאה בהורדת הקובץ מהשרת")
+                break
+
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ReadTimeout):
+                if attempt == retries:
+                    raise
+                events.log("🔁 החיבור נותק - מנסה להמשיך את ההורדה...")
+                time.sleep(min(2 ** attempt, 30))
+
+        # וידוא שהתקבל הקובץ בשלמותו
+        size = os.path.getsize(part_path)
+        if total_size and size != total_size:
+            raise ServerError(f"הקובץ שהתקבל חלקי ({size} מתוך {total_size} בתים)")
+        if manifest:
+            self.verify_file(url, part_path, manifest,
+                             hasher.finish() if hasher.position == size else None, events)
+
+        os.replace(part_path, local_path)
+        if os.path.exists(etag_path):
+            os.remove(etag_path)
+        return local_path
+
+    def stream_file(self, download_id, download_dir, events):
+        """קבלת הקובץ תוך כדי שהשרת מוריד אותו - מחזיר None אם השרת לא מאפשר הזרמה"""
+        response = self.session.get(f'{self.server_url}/api/stream/{download_id}',
+                                    stream=True, timeout=(10, 120))
+        if response.status_code == 409:
+            response.close()
+            return None
+        if response.status_code != 200:
+            response.close()
+            raise ServerError("שגיאה בהורדת הקובץ מהשרת")
+
+        events.log("📡 מקבל את הקובץ תוך כדי הורדה בשרת")
+        filename = self.filename_from_response(response) or download_id
+        local_path = os.path.join(download_dir, filename)
+        part_path = local_path + '.part'
+        total_size = int(response.headers.get('X-Expected-Length')
+                         or response.headers.get('content-length') or 0)
+        # ה-manifest קיים רק כשההורדה בשרת מסתיימת - מגבבים עכשיו ובודקים בסוף
+        hasher = ChunkHasher()
+        try:
+            self.write_response(response, part_path, total_size, events, hasher=hasher)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            # הזרם נקטע - ממשיכים דרך /api/file כשההורדה בשרת תסתיים
+            events.log("🔁 הזרם נקטע - ממתין לסיום ההורדה בשרת")
+            return None
+
+        # בזרם אין אורך ידוע מראש - מוודאים שההורדה בשרת באמת הצליחה
+        job = self.session.get(f'{self.server_url}/api/jobs/{download_id}', timeout=10).json()
+        if job.get('state') not in ('finished', 'failed'):
+            # הזרם נגמר לפני שהסיום הגיע לתהליך שענה (כמה עובדים) - ממתינים לו
+            job = self.wait_for_job(download_id, events)
+        if job.get('state') != 'finished':
+            os.remove(part_path)
+            raise ServerError(job.get('error', 'ההורדה בשרת נכשלה'))
+        if job.get('size') and os.path.getsize(part_path) != job['size']:
+            return None
+        file_url = f'{self.server_url}/api/file/{download_id}'
+        manifest = self.file_manifest(file_url)
+        if manifest:
+            self.verify_file(file_url, part_path, manifest,
+                             hasher.finish() if manifest['chunk_size'] == hasher.chunk_size else None,
+                             events)
+        os.replace(part_path, local_path)
+        return local_path
+
+    @staticmethod
+    def write_response(response, local_path, total_size, events, offset=0, hasher=None):
+        """כתיבת גוף התשובה לקובץ מקומי עם דיווח התקדמות.
+        offset - מספר הבתים שכבר קיימים בקובץ (המשך הורדה); hasher (ChunkHasher) מקבל כל
+        חתיכה שנכתבת"""
+        downloaded = offset
+        with response, open(local_path, 'ab' if offset else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if events.cancelled():
+                    raise DownloadCancelled()
+                if chunk:
+                    f.write(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+                    downloaded += len(chunk)
+                    events.transfer_progress(downloaded, total_size)
+        return downloaded
+
+    @staticmethod
+    def filename_from_response(response):
+        """שם הקובץ מכותרת Content-Disposition"""
+        match = re.search(r'filename="?([^";]+)"?', response.headers.get('Content-Disposition', ''))
+        return os.path.basename(match.group(1)) if match else None
+
+    @staticmethod
+    def _error(response):
+        try:
+            return response.json().get('error', 'שגיאה לא ידועה')
+        except ValueError:
+            return f'HTTP {response.status_code}'
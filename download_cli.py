@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+הורדה מרובה משורת הפקודה, בלי ממשק גרפי - אותו מנוע כמו האפליקציה (client_engine)
+
+    python download_cli.py urls.txt -j 4 -o ~/Downloads --quality 720p
+    cat urls.txt | python download_cli.py - --audio m4a --json result.json
+
+קובץ הקישורים: קישור בכל שורה, שורות ריקות ו-# מדולגות.
+בסוף מודפסים מספר הקבצים, הבתים, הזמן והקצב הכולל.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from client_engine import DownloadEngine, DownloadEvents, download_options, load_config
+
+
+def read_urls(path):
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    with f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class CliEvents(DownloadEvents):
+    """האירועים של הורדה אחת - נשמרים למונה המשותף, ההודעות מודפסות עם הקישור"""
+
+    def __init__(self, monitor, url, verbose):
+        self.monitor = monitor
+        self.url = url
+        self.verbose = verbose
+
+    def log(self, message):
+        if self.verbose:
+            self.monitor.print(f'{self.url}: {message}')
+
+    def transfer_progress(self, downloaded, total, rate=None, segments=None):
+        self.monitor.update(self.url, downloaded)
+
+
+class Monitor:
+    """סכום הבתים שהתקבלו בכל ההורדות, ושורת מצב שמתעדכנת פעם בשנייה"""
+
+    def __init__(self, total, show):
+        self.total = total
+        self.show = show
+        self.finished = 0
+        self.received = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def update(self, url, downloaded):
+        with self._lock:
+            self.received[url] = downloaded
+
+    def done(self):
+        with self._lock:
+            self.finished += 1
+
+    def bytes(self):
+        with self._lock:
+            return sum(self.received.values())
+
+    def print(self, line):
+        with self._lock:
+            print(('\r\033[K' if self.show else '') + line, flush=True)
+
+    def __enter__(self):
+        if self.show:
+            threading.Thread(target=self._status, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self.show:
+            print('\r\033[K', end='', flush=True)
+
+    def _status(self):
+        while not self._stop.wait(1):
+            elapsed = time.perf_counter() - self.started
+            received = self.bytes()
+            with self._lock:
+                print(f'\r\033[K[{self.finished}/{self.total}] {received / 1024 / 1024:.1f}MB '
+                      f'{received / elapsed / 1024 / 1024:.1f}MB/s', end='', flush=True)
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('urls', help="קובץ קישורים, או '-' לקריאה מ-stdin")
+    parser.add_argument('-s', '--server', default=config['server_url'], help='כתובת השרת')
+    parser.add_argument('-o', '--output', default=config['download_dir'], help='תיקיית שמירה')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='הורדות במקביל')
+    parser.add_argument('-q', '--quality', default=config.get('default_quality', 'best'))
+    parser.add_argument('--audio', choices=('mp3', 'm4a'), help='אודיו בלבד בפורמט הזה')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='לא לקבל את הקובץ בזמן שהשרת עוד מוריד אותו')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--json', help='שמירת התוצאות לקובץ')
+    args = parser.parse_args()
+
+    # קישור כפול היה כותב לאותם קבצים מקומיים - כל קישור יורד פעם אחת
+    urls = list(dict.fromkeys(read_urls(args.urls)))
+    os.makedirs(args.output, exist_ok=True)
+    # חיבור לאירועים וחיבור לקובץ לכל הורדה, ועוד חיבורים לקבצים גדולים
+    engine = DownloadEngine(args.server, pool_size=max(16, args.jobs * 4))
+    options = download_options(args.quality, args.audio)
+
+    def fetch(url):
+        began = time.perf_counter()
+        path = engine.download(url, args.output, options, stream=not args.no_stream,
+                               events=CliEvents(monitor, url, args.verbose))
+        return {'url': url, 'path': path, 'bytes': os.path.getsize(path),
+                'seconds': round(time.perf_counter() - began, 3)}
+
+    results, failures = [], []
+    with Monitor(len(urls), sys.stdout.isatty()) as monitor, \
+            ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(fetch, url): url for url in urls}
+        for future in as_completed(futures):
+            monitor.done()
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({'url': futures[future], 'error': str(e)})
+                monitor.print(f'✗ {futures[future]}: {e}')
+            else:
+                results.append(result)
+                monitor.print(f"✓ {os.path.basename(result['path'])} "
+                              f"({result['bytes'] / 1024 / 1024:.1f}MB, {result['seconds']:.1f}s)")
+    elapsed = time.perf_counter() - monitor.started
+
+    total_bytes = sum(r['bytes'] for r in results)
+    summary = {
+        'files': len(results),
+        'failed': len(failures),
+        'bytes': total_bytes,
+        'seconds': round(elapsed, 3),
+        'mb_per_second': round(total_bytes / elapsed / 1024 / 1024, 2) if elapsed else None,
+        'files_per_second': round(len(results) / elapsed, 2) if elapsed else None,
+    }
+    print(f"{summary['files']} files, {summary['failed']} failed, "
+          f"{total_bytes / 1024 / 1024:.1f}MB in {elapsed:.1f}s "
+          f"({summary['mb_per_second']}MB/s, {summary['files_per_second']} files/s)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'results': results, 'failures': failures}, f,
+                      indent=2, ensure_ascii=False)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
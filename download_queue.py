@@ -0,0 +1,333 @@
+"""
+תור ההורדות של הלקוח - כמה הורדות במקביל דרך אותו מנוע, עם ביטול וניסיון
+חוזר לכל פריט. התור נשמר לקובץ, כך שהורדות שלא הסתיימו ממשיכות בהפעלה הבאה
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import requests
+
+from client_engine import DownloadEvents, ServerBusy, ServerError
+from transfer import DownloadCancelled
+
+QUEUE_FILE = 'download_queue.json'
+# השרת עמוס (429) - הפריט חוזר לתור ומנסים שוב אחרי
+BUSY_RETRY_DELAY = 15
+
+
+class QueueItem:
+    """הורדה אחת בתור"""
+
+    WAITING = 'waiting'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    # השדות שנשמרים לקובץ - ההתקדמות והמהירות רק בזיכרון
+    SAVED = ('id', 'url', 'download_dir', 'options', 'state', 'title', 'path', 'error',
+             'size', 'added_at')
+
+    def __init__(self, url, download_dir, options, id=None, state=WAITING, title=None,
+                 path=None, error=None, size=0, added_at=None):
+        self.id = id or uuid.uuid4().hex[:12]
+        self.url = url
+        self.download_dir = download_dir
+        self.options = options
+        self.state = state
+        self.title = title
+        self.path = path
+        self.error = error
+        self.size = size
+        self.added_at = added_at or time.time()
+        # 'server' בזמן שהשרת מוריד, 'transfer' בזמן קבלת הקובץ
+        self.stage = None
+        self.percent = 100 if state == self.DONE else None
+        self.speed = None
+        self.eta = None
+        self.retry_at = 0
+        self.cancel_event = threading.Event()
+
+    @property
+    def label(self):
+        return self.title or self.url
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.SAVED}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.SAVED if name in data})
+
+
+class ItemEvents(DownloadEvents):
+    """אירועי המנוע לפריט אחד -> שדות ההתקדמות שלו"""
+
+    def __init__(self, queue, item):
+        self.queue = queue
+        self.item = item
+        self.cancel_event = item.cancel_event
+        self._sample = (time.monotonic(), 0)
+
+    def log(self, message):
+        self.queue.log(f'{self.item.label}: {message}')
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def job_update(self, job):
+        item = self.item
+        progress = job.get('progress') or {}
+        item.title = job.get('title') or item.title
+        item.stage = 'server'
+        item.percent = progress.get('percent')
+        item.speed = progress.get('speed')
+        item.eta = progress.get('eta')
+        if job.get('size'):
+            item.size = job['size']
+        self.queue.changed(item)
+
+    def transfer_progress(self, downloaded, total, rate=None, segments=None):
+        item = self.item
+        if rate is None:
+            # בחיבור אחד המנוע לא מודד קצב - לפי הבתים שהתקבלו בשנייה האחרונה
+            now = time.monotonic()
+            started, start_bytes = self._sample
+            if now - started < 1:
+                return
+            self._sample = (now, downloaded)
+            rate = (downloaded - start_bytes) / (now - started)
+        item.stage = 'transfer'
+        item.speed = rate
+        if total:
+            item.size = total
+            item.percent = min(downloaded / total * 100, 100)
+            item.eta = (total - downloaded) / rate if rate else None
+        self.queue.changed(item)
+
+
+def describe_error(error):
+    """הודעת שגיאה קצרה למשתמש"""
+    if isinstance(error, ServerError):
+        return str(error)
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'זמן ההורדה פג'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'בעיית חיבור לשרת'
+    return str(error) or type(error).__name__
+
+
+class DownloadQueue:
+    """פריטים ממתינים מתחילים לפי סדר ההוספה, עד concurrency הורדות במקביל.
+
+    on_change(item) נקרא (מכל thread) כשפריט השתנה או הוסר מהתור,
+    on_log(message) להודעות ליומן"""
+
+    def __init__(self, engine, path=QUEUE_FILE, concurrency=3, on_change=None, on_log=None):
+        self.engine = engine
+        self.path = path
+        self.concurrency = max(1, concurrency)
+        self.on_change = on_change
+        self.on_log = on_log
+        self._items = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._timer = None
+        self.load()
+
+    def load(self):
+        """טעינת התור מהקובץ - הורדות שרצו כשהתוכנה נסגרה חוזרות להמתנה"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading queue: {e}")
+            return
+        for entry in data.get('items', []):
+            item = QueueItem.from_dict(entry)
+            if item.state == QueueItem.RUNNING:
+                item.state = QueueItem.WAITING
+            self._items[item.id] = item
+
+    def save(self):
+        with self._lock:
+            data = {'items': [item.to_dict() for item in self._items.values()]}
+        with self._save_lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def changed(self, item):
+        if self.on_change:
+            self.on_change(item)
+
+    def items(self):
+        with self._lock:
+            return list(self._items.values())
+
+    def get(self, item_id):
+        with self._lock:
+            return self._items.get(item_id)
+
+    def add(self, url, download_dir, options):
+        """הוספת הורדה לתור. אם אותו קישור, באותן הגדרות ולאותה תיקייה, כבר ממתין
+        או רץ - מוחזר הפריט הקיים (שניהם היו כותבים לאותם קבצים מקומיים)"""
+        with self._lock:
+            existing = self._find_active(url, download_dir, options)
+            if not existing:
+                item = QueueItem(url, download_dir, options)
+                self._items[item.id] = item
+        if existing:
+            self.log(f"⏭️ כבר בתור: {existing.label}")
+            return existing
+        self.save()
+        self.changed(item)
+        self.start()
+        return item
+
+    def _find_active(self, url, download_dir, options):
+        download_dir = os.path.abspath(download_dir)
+        for item in self._items.values():
+            if (item.state in (QueueItem.WAITING, QueueItem.RUNNING) and item.url == url
+                    and item.options == options and os.path.abspath(item.download_dir) == download_dir):
+                return item
+        return None
+
+    def cancel(self, item_id):
+        """ביטול פריט ממתין או פעיל. הורדה פעילה נעצרת בחתיכה הבאה,
+        והקבצים החלקיים נשארים כך שניסיון חוזר ממשיך מאותה נקודה"""
+        with self._lock:
+            item = self._items.get(item_id)
+            if not item or item.state not in (QueueItem.WAITING, QueueItem.RUNNING):
+                return
+            item.cancel_event.set()
+            item.state = QueueItem.CANCELLED
+            item.speed = item.eta = None
+        self.save()
+        self.changed(item)
+
+    def retry(self, item_id):
+        with self._lock:
+            item = self._items.get(item_id)
+            if not item or item.state not in (QueueItem.FAILED, QueueItem.CANCELLED):
+                return
+            item.cancel_event = threading.Event()
+            item.state = QueueItem.WAITING
+            item.error = None
+            item.retry_at = 0
+        self.save()
+        self.changed(item)
+        self.start()
+
+    def remove(self, item_id):
+        self.cancel(item_id)
+        with self._lock:
+            item = self._items.pop(item_id, None)
+        if item:
+            self.save()
+            self.changed(item)
+
+    def clear_finished(self):
+        for item in self.items():
+            if item.state == QueueItem.DONE:
+                self.remove(item.id)
+
+    def set_concurrency(self, concurrency):
+        self.concurrency = max(1, concurrency)
+        self.start()
+
+    def start(self):
+        """הפעלת פריטים ממתינים עד concurrency הורדות במקביל"""
+        started = []
+        with self._lock:
+            now = time.time()
+            next_retry = None
+            for item in self._items.values():
+                if len(self._active) >= self.concurrency:
+                    break
+                # פריט שבוטל ונוסה שוב לפני שה-thread הקודם שלו הסתיים מחכה לו
+                if item.state != QueueItem.WAITING or item.id in self._active:
+                    continue
+                if item.retry_at > now:
+                    next_retry = min(next_retry or item.retry_at, item.retry_at)
+                    continue
+                item.state = QueueItem.RUNNING
+                item.stage = None
+                self._active.add(item.id)
+                started.append(item)
+            if next_retry and not self._timer:
+                self._timer = threading.Timer(next_retry - now, self._retry_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        for item in started:
+            threading.Thread(target=self._run, args=(item, ItemEvents(self, item)),
+                             daemon=True).start()
+            self.changed(item)
+        if started:
+            self.save()
+
+    def _retry_timer(self):
+        with self._lock:
+            self._timer = None
+        self.start()
+
+    def _run(self, item, events):
+        state, error = QueueItem.DONE, None
+        try:
+            os.makedirs(item.download_dir, exist_ok=True)
+            path = self.engine.download(item.url, item.download_dir, item.options,
+                                        stream=True, events=events)
+        except DownloadCancelled:
+            state = QueueItem.CANCELLED
+        except ServerBusy:
+            state = QueueItem.WAITING
+        except Exception as e:
+            state = QueueItem.CANCELLED if events.cancelled() else QueueItem.FAILED
+            error = describe_error(e)
+
+        with self._lock:
+            self._active.discard(item.id)
+            # בוטל ונוסה שוב בזמן שרץ - המצב שייך כבר לניסיון החדש
+            current = item.cancel_event is events.cancel_event
+            if current:
+                item.state = state
+                item.error = error
+                item.stage = item.speed = item.eta = None
+                if state == QueueItem.DONE:
+                    item.path = path
+                    item.size = os.path.getsize(path)
+                    item.percent = 100
+                    item.title = item.title or os.path.basename(path)
+                elif state == QueueItem.WAITING:
+                    item.retry_at = time.time() + BUSY_RETRY_DELAY
+
+        if current:
+            if state == QueueItem.DONE:
+                self.log(f"💾 קובץ נשמר: {item.path}")
+            elif state == QueueItem.WAITING:
+                self.log(f"🚦 השרת עמוס - {item.label} יחזור לתור בעוד {BUSY_RETRY_DELAY} שניות")
+            elif state == QueueItem.FAILED:
+                self.log(f"❌ {item.label}: {error}")
+            self.save()
+            self.changed(item)
+        self.start()
+
+    def summary(self):
+        """מספר הפריטים בכל מצב"""
+        counts = {}
+        for item in self.items():
+            counts[item.state] = counts.get(item.state, 0) + 1
+        return counts
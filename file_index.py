@@ -0,0 +1,112 @@
+"""
+אינדקס קבוע (SQLite) של הקבצים המוכנים בשרת
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+
+class FileIndex:
+    """מזהה הורדה -> שם קובץ, גודל, זמן יצירה ושימוש אחרון ופרטי הסרטון"""
+
+    COLUMNS = ('download_id', 'filename', 'size', 'created_at', 'last_access', 'title', 'duration')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                download_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                title TEXT,
+                duration REAL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS files_last_access ON files (last_access)')
+        # גיבוב לכל חתיכה בקובץ (chunks.py), לבדיקה בצד הלקוח
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS manifests (
+                download_id TEXT PRIMARY KEY,
+                chunk_size INTEGER NOT NULL,
+                hashes TEXT NOT NULL
+            )
+        ''')
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+
+    @property
+    def _db(self):
+        # חיבור SQLite אסור לשימוש אחרי fork - עובד של gunicorn --preload פותח חיבור משלו
+        if self._pid != os.getpid():
+            self._connect()
+        return self._conn
+
+    def get(self, download_id, touch=True):
+        """רשומת הקובץ כמילון, או None. touch מעדכן את זמן השימוש האחרון"""
+        with self._lock:
+            row = self._db.execute('SELECT * FROM files WHERE download_id = ?',
+                                   (download_id,)).fetchone()
+            if row and touch:
+                self._db.execute('UPDATE files SET last_access = ? WHERE download_id = ?',
+                                 (time.time(), download_id))
+        return dict(row) if row else None
+
+    def put(self, download_id, entry):
+        """הוספה או החלפה של רשומה - מחזיר את הרשומה הקודמת אם הייתה"""
+        now = time.time()
+        row = {column: entry.get(column) for column in self.COLUMNS}
+        row.update(download_id=download_id)
+        row['created_at'] = row['created_at'] or now
+        row['last_access'] = row['last_access'] or now
+
+        with self._lock:
+            old = self._db.execute('SELECT * FROM files WHERE download_id = ?',
+                                   (download_id,)).fetchone()
+            self._db.execute(
+                f'INSERT OR REPLACE INTO files ({", ".join(self.COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(self.COLUMNS))})',
+                [row[column] for column in self.COLUMNS])
+        return dict(old) if old else None
+
+    def remove(self, download_id):
+        with self._lock:
+            self._db.execute('DELETE FROM files WHERE download_id = ?', (download_id,))
+            self._db.execute('DELETE FROM manifests WHERE download_id = ?', (download_id,))
+
+    def put_manifest(self, download_id, chunk_size, hashes):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO manifests VALUES (?, ?, ?)',
+                             (download_id, chunk_size, ' '.join(hashes)))
+
+    def get_manifest(self, download_id):
+        """{'chunk_size', 'hashes'} או None"""
+        with self._lock:
+            row = self._db.execute('SELECT chunk_size, hashes FROM manifests WHERE download_id = ?',
+                                   (download_id,)).fetchone()
+        return {'chunk_size': row['chunk_size'], 'hashes': row['hashes'].split()} if row else None
+
+    def least_recently_used(self, limit=64):
+        """הרשומות שהשימוש בהן הכי ישן"""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM files ORDER BY last_access LIMIT ?',
+                                    (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def total_bytes(self):
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
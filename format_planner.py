@@ -0,0 +1,250 @@
+"""
+בחירת הפורמט להורדה מתוך רשימת הפורמטים שחולצה - הזול ביותר שעומד ביעד:
+בלי מיזוג ובלי קידוד מחדש כשאפשר, ועם הערכת גודל לפני ההורדה
+"""
+
+import re
+
+from transcode import AUDIO_FORMATS, codec_name
+
+# שמות שונים לאותו קודק וידאו
+VIDEO_CODECS = {'avc1': 'h264', 'h264': 'h264', 'vp09': 'vp9', 'vp9': 'vp9', 'av01': 'av1',
+                'av1': 'av1', 'hev1': 'h265', 'hvc1': 'h265', 'h265': 'h265'}
+# קונטיינר וידאו -> סיומת האודיו שאפשר למזג לתוכו בלי המרה
+MERGE_AUDIO_EXT = {'mp4': 'm4a', 'webm': 'webm'}
+
+
+def video_codec(vcodec):
+    if not vcodec or vcodec == 'none':
+        return None
+    name = vcodec.split('.')[0].lower()
+    return VIDEO_CODECS.get(name, name)
+
+
+def make_target(quality='best', audio_format=None, container=None, vcodec=None, max_filesize=None):
+    """יעד ההורדה מהגדרות הבקשה. quality הוא 'best', 'worst', '<גובה>p' (למשל '720p'),
+    או בורר פורמט של yt-dlp שמועבר כמו שהוא - אז מוחזר None ואין תכנון.
+    זורק ValueError על quality שאינו מחרוזת ועל max_filesize שאינו מספר שלם חיובי"""
+    if quality is not None and not isinstance(quality, str):
+        raise ValueError('quality must be a string')
+    if max_filesize not in (None, '', 0):
+        if isinstance(max_filesize, bool) or not str(max_filesize).isdigit():
+            raise ValueError('max_filesize must be a positive integer')
+        max_filesize = int(max_filesize)
+    target = {}
+    if audio_format:
+        target['audio_format'] = audio_format
+    else:
+        match = re.fullmatch(r'(\d+)p', quality or 'best')
+        if match:
+            target['max_height'] = int(match.group(1))
+        elif quality == 'worst':
+            target['worst'] = True
+        elif quality != 'best':
+            return None
+        if container:
+            target['container'] = container
+        if vcodec:
+            target['vcodec'] = video_codec(vcodec)
+    if max_filesize:
+        target['max_filesize'] = max_filesize
+    return target
+
+
+def fallback_selector(target, quality='best'):
+    """בורר yt-dlp ששקול ליעד, למקרה שאין רשימת פורמטים לתכנן ממנה"""
+    if target is None:
+        return quality
+    size = f"[filesize<={target['max_filesize']}]" if target.get('max_filesize') else ''
+    if 'audio_format' in target:
+        preferred = f"bestaudio[ext={target['audio_format']}]{size}/" if target['audio_format'] == 'm4a' else ''
+        return f'{preferred}bestaudio{size}/best{size}'
+    if target.get('worst'):
+        return 'worst'
+    filters = size
+    if target.get('max_height'):
+        filters += f"[height<={target['max_height']}]"
+    if target.get('container'):
+        filters += f"[ext={target['container']}]"
+    if not filters:
+        return 'bestvideo+bestaudio/best'
+    return f'bestvideo{filters}+bestaudio/best{filters}/best'
+
+
+def estimated_size(fmt, duration):
+    """גודל הפורמט בבתים - מהמידע של האתר, או הערכה לפי קצב הסיביות והאורך"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return int(size) if size else None
+
+
+def has_video(fmt):
+    return fmt.get('vcodec') != 'none'
+
+
+def has_audio(fmt):
+    return fmt.get('acodec') != 'none'
+
+
+def usable(fmt):
+    return ((fmt.get('url') or fmt.get('fragments')) and not fmt.get('has_drm')
+            and (has_video(fmt) or has_audio(fmt)) and fmt.get('ext') != 'mhtml')
+
+
+def plan_format(info, target):
+    """בחירת הפורמט (או זוג וידאו+אודיו) להורדה. מחזיר None אם אין מה לתכנן,
+    ואז yt-dlp בוחר לפי fallback_selector"""
+    formats = [f for f in info.get('formats') or [] if usable(f)]
+    if target is None or not formats:
+        return None
+    duration = info.get('duration')
+    if 'audio_format' in target:
+        choice = plan_audio(formats, duration, target)
+    else:
+        choice = plan_video(formats, duration, target)
+    if not choice:
+        return None
+
+    sizes = [estimated_size(f, duration) for f in choice]
+    ext = choice[0].get('ext')
+    if len(choice) > 1 and choice[1].get('ext') != MERGE_AUDIO_EXT.get(ext):
+        ext = 'mkv'
+    plan = {
+        'format': '+'.join(f['format_id'] for f in choice),
+        'height': choice[0].get('height'),
+        'ext': ext,
+        'merge': len(choice) > 1,
+        'estimated_bytes': sum(sizes) if None not in sizes else None,
+    }
+    if 'audio_format' in target:
+        plan['transcode'] = codec_name(choice[0].get('acodec')) != AUDIO_FORMATS[target['audio_format']][0]
+    return plan
+
+
+def _fits_size(choice, duration, target):
+    if not target.get('max_filesize'):
+        return True
+    sizes = [estimated_size(f, duration) for f in choice]
+    return None in sizes or sum(sizes) <= target['max_filesize']
+
+
+def plan_audio(formats, duration, target):
+    """אודיו: קודם אודיו בלבד (קובץ עם וידאו גדול ממנו פי כמה, גם כשאפשר להעתיק
+    את האודיו שבו), אחר כך מקור שאפשר להעתיק בלי קידוד, ואז האיכות הגבוהה ביותר"""
+    copy_codec = AUDIO_FORMATS[target['audio_format']][0]
+    candidates = [(f,) for f in formats if has_audio(f) and _fits_size((f,), duration, target)]
+    if not candidates:
+        return None
+
+    def rank(choice):
+        fmt = choice[0]
+        return (has_video(fmt), codec_name(fmt.get('acodec')) != copy_codec,
+                -(fmt.get('abr') or fmt.get('tbr') or 0))
+
+    return min(candidates, key=rank)
+
+
+def plan_video(formats, duration, target):
+    """וידאו: הרזולוציה הגבוהה ביותר עד התקרה (או הנמוכה ביותר ב-worst), ובתוכה
+    קובץ מוכן עם אודיו לפני מיזוג, קצב פריימים גבוה, ואז הכי מעט בתים"""
+    container = target.get('container')
+
+    def fits(fmt):
+        return ((not target.get('max_height') or (fmt.get('height') or 0) <= target['max_height'])
+                and (not target.get('vcodec') or video_codec(fmt.get('vcodec')) == target['vcodec']))
+
+    videos = [f for f in formats if has_video(f) and fits(f)]
+    candidates = [(f,) for f in videos if has_audio(f) and (not container or f.get('ext') == container)]
+
+    audios = [f for f in formats if not has_video(f) and has_audio(f)]
+    for fmt in videos:
+        if has_audio(fmt) or (container and fmt.get('ext') != container):
+            continue
+        # אודיו שנכנס לאותו קונטיינר בלי המרה, אם יש כזה
+        merge_ext = MERGE_AUDIO_EXT.get(fmt.get('ext'))
+        compatible = [a for a in audios if a.get('ext') == merge_ext] or ([] if container else audios)
+        if compatible:
+            audio = max(compatible, key=lambda a: a.get('abr') or a.get('tbr') or 0)
+            candidates.append((fmt, audio))
+
+    candidates = [c for c in candidates if _fits_size(c, duration, target)]
+    if not candidates:
+        return None
+
+    def height(choice):
+        return choice[0].get('height') or 0
+
+    best_height = (min if target.get('worst') else max)(height(c) for c in candidates)
+
+    def cost(choice):
+        high_fps = (choice[0].get('fps') or 30) > 30
+        size = sum(estimated_size(f, duration) or float('inf') for f in choice)
+        return (len(choice), high_fps == bool(target.get('worst')), size)
+
+    return min((c for c in candidates if height(c) == best_height), key=cost)
+
+
+# עמודות טבלת הפורמטים הקומפקטית של /api/info
+TABLE_FIELDS = ('id', 'ext', 'height', 'fps', 'vcodec', 'acodec', 'tbr', 'filesize', 'filesize_approx')
+
+
+def format_table(info):
+    """טבלת פורמטים קומפקטית בלי כפילויות - שורה אחת לכל שילוב של קונטיינר,
+    רזולוציה, קצב פריימים וקודקים. מבין כפילויות נשמר פורמט ישיר (לא HLS)
+    עם גודל ידוע וקצב סיביות גבוה. ערכים חסרים לא נכללים בשורה"""
+    duration = info.get('duration')
+    best = {}
+    for fmt in info.get('formats') or []:
+        if not usable(fmt):
+            continue
+        key = (fmt.get('ext'), fmt.get('height'), fmt.get('fps'), fmt.get('vcodec'), fmt.get('acodec'))
+        rank = (not (fmt.get('protocol') or '').startswith('m3u8'),
+                bool(fmt.get('filesize')), fmt.get('tbr') or 0)
+        if key not in best or rank > best[key][0]:
+            best[key] = (rank, fmt)
+
+    table = []
+    for _, fmt in best.values():
+        row = {
+            'id': fmt['format_id'],
+            'ext': fmt.get('ext'),
+            'height': fmt.get('height'),
+            'fps': fmt.get('fps'),
+            'vcodec': fmt.get('vcodec'),
+            'acodec': fmt.get('acodec'),
+            'tbr': round(fmt['tbr'], 1) if fmt.get('tbr') else None,
+            'filesize': fmt.get('filesize'),
+            'filesize_approx': None if fmt.get('filesize') else estimated_size(fmt, duration),
+        }
+        table.append({k: v for k, v in row.items() if v is not None})
+    return table
+
+
+def filter_formats(table, kind=None, min_height=None, max_height=None, ext=None, vcodec=None,
+                   acodec=None, max_filesize=None):
+    """סינון הטבלה. kind הוא video (וידאו בלבד), audio (אודיו בלבד) או muxed (שניהם)"""
+    def keep(row):
+        video, audio = row.get('vcodec') != 'none', row.get('acodec') != 'none'
+        size = row.get('filesize') or row.get('filesize_approx')
+        return ((kind != 'video' or (video and not audio))
+                and (kind != 'audio' or (audio and not video))
+                and (kind != 'muxed' or (video and audio))
+                and (min_height is None or (row.get('height') or 0) >= min_height)
+                and (max_height is None or (row.get('height') or 0) <= max_height)
+                and (not ext or row.get('ext') == ext)
+                and (not vcodec or video_codec(row.get('vcodec')) == video_codec(vcodec))
+                and (not acodec or codec_name(row.get('acodec')) == codec_name(acodec))
+                and (max_filesize is None or (size or 0) <= max_filesize))
+    return [row for row in table if keep(row)]
+
+
+def sort_formats(table, keys):
+    """מיון לפי רשימת עמודות, '-' לפני עמודה למיון יורד. ערכים חסרים תמיד בסוף"""
+    for key in reversed(keys):
+        descending = key.startswith('-')
+        field = key.lstrip('-')
+        present = [row for row in table if row.get(field) is not None]
+        missing = [row for row in table if row.get(field) is None]
+        table = sorted(present, key=lambda row: row[field], reverse=descending) + missing
+    return table
@@ -0,0 +1,262 @@
+"""
+תור עבודות הורדה עם מאגר עובדים מוגבל
+"""
+
+import functools
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+
+class QueueFull(Exception):
+    """התור מלא - אין מקום לעבודות נוספות"""
+
+
+def chain(future, callback, errback=None):
+    """Future חדש שמתמלא בתוצאה של callback(התוצאה של future).
+    אם future נכשל, errback(השגיאה) נקרא לפני שהשגיאה מועברת הלאה"""
+    chained = Future()
+
+    def done(completed):
+        try:
+            chained.set_result(callback(completed.result()))
+        except Exception as e:
+            if errback and completed.exception() is e:
+                errback(e)
+            chained.set_exception(e)
+
+    future.add_done_callback(done)
+    return chained
+
+
+class Job:
+    """עבודת הורדה בודדת ומצבה"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+
+    # מרווח מינימלי בשניות בין עדכוני התקדמות שנשלחים למאזינים
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, params, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.params = params
+        self.state = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.progress = {}
+        self.partial_path = None
+        self.output_path = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+        self._changed = threading.Condition()
+        self._last_notify = 0
+        self._listeners = []
+
+    @property
+    def done(self):
+        return self.state in (Job.FINISHED, Job.FAILED)
+
+    def set_state(self, state):
+        with self._changed:
+            self.state = state
+            self._notify()
+
+    def update_progress(self, **fields):
+        """עדכון נתוני ההתקדמות - המאזינים מתעוררים לכל היותר פעם ב-PROGRESS_INTERVAL"""
+        with self._changed:
+            status_changed = fields.get('status') != self.progress.get('status')
+            self.progress.update(fields)
+            total = self.progress.get('total_bytes')
+            if total:
+                self.progress['percent'] = round((self.progress.get('downloaded_bytes') or 0) * 100 / total, 1)
+            if status_changed or time.time() - self._last_notify >= Job.PROGRESS_INTERVAL:
+                self._notify()
+
+    def wait_for_change(self, version, timeout=None):
+        """המתנה לשינוי אחרי הגרסה הנתונה - מחזיר את הגרסה הנוכחית"""
+        with self._changed:
+            if self.version == version and not self.done:
+                self._changed.wait(timeout)
+            return self.version
+
+    def add_listener(self, callback):
+        """callback() נקרא בכל שינוי, מתוך ה-thread שעדכן - חייב להיות קצר ולא לחסום
+        (למשל loop.call_soon_threadsafe). מאפשר להמתין לשינוי בלי thread ממתין"""
+        with self._changed:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._changed:
+            self._listeners.remove(callback)
+
+    def _notify(self):
+        self.version += 1
+        self._last_notify = time.time()
+        self._changed.notify_all()
+        for callback in self._listeners:
+            callback()
+
+    def to_dict(self):
+        """ייצוג העבודה לתשובת JSON"""
+        with self._changed:
+            data = {
+                'job_id': self.id,
+                'download_id': self.id,
+                'state': self.state,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'progress': dict(self.progress),
+            }
+        if self.result:
+            data.update(self.result)
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """מאגר עובדים בגודל קבוע שצורך עבודות מתור חסום.
+
+    handler(job) מחזיר את התוצאה, או Future כשהמשך העבודה רץ במקום אחר
+    (למשל המרת אודיו) - אז העובד מתפנה מיד לעבודה הבאה.
+
+    autostart=False - העובדים עולים רק ב-start(), למשל אחרי fork של gunicorn
+    (threads לא עוברים לתהליך הבן).
+
+    on_state(job) נקרא מיד אחרי כל שינוי מצב (התחלה, סיום או כישלון), למשל
+    לפרסום העבודה במצב המשותף"""
+
+    def __init__(self, handler, workers=2, max_pending=20, registry=None, autostart=True,
+                 on_state=None):
+        self.handler = handler
+        self.on_state = on_state
+        self.workers = workers
+        self.jobs = registry if registry is not None else {}
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._detached = 0
+        self._threads = []
+        if autostart:
+            self.start()
+
+    def start(self):
+        """הפעלת העובדים - פעם אחת"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                worker = threading.Thread(target=self._worker, name=f'download-worker-{i}', daemon=True)
+                worker.start()
+                self._threads.append(worker)
+
+    def submit(self, job):
+        """הכנסת עבודה לתור - זורק QueueFull אם אין מקום.
+        אם עבודה עם אותו מזהה כבר ממתינה או רצה, היא מוחזרת במקום החדשה (single-flight)"""
+        with self._lock:
+            existing = self.jobs.get(job.id)
+            if existing and not existing.done:
+                return existing
+            self.jobs[job.id] = job
+        try:
+            self._pending.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.jobs.pop(job.id, None)
+            raise QueueFull('Download queue is full')
+        return job
+
+    def register_finished(self, job, result):
+        """רישום עבודה שהתוצאה שלה כבר מוכנה (למשל מהמטמון) בלי להריץ אותה"""
+        job.result = result
+        job.started_at = job.finished_at = time.time()
+        job.state = Job.FINISHED
+        with self._lock:
+            existing = self.jobs.get(job.id)
+            if not existing or existing.done:
+                self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def all(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def prune(self, max_age):
+        """הסרת עבודות שהסתיימו לפני יותר מ-max_age שניות"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            for job_id, job in list(self.jobs.items()):
+                if job.done and job.finished_at < cutoff:
+                    del self.jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            running, detached = self._running, self._detached
+        return {
+            'workers': self.workers,
+            'running': running,
+            'postprocessing': detached,
+            'queued': self._pending.qsize(),
+            'capacity': self._pending.maxsize,
+        }
+
+    def _worker(self):
+        while True:
+            job = self._pending.get()
+            with self._lock:
+                self._running += 1
+            job.started_at = time.time()
+            self._set_state(job, Job.RUNNING)
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                self._finish(job, error=e)
+            else:
+                if isinstance(result, Future):
+                    with self._lock:
+                        self._detached += 1
+                    result.add_done_callback(functools.partial(self._finish_detached, job))
+                else:
+                    self._finish(job, result)
+            with self._lock:
+                self._running -= 1
+            self._pending.task_done()
+
+    def _finish_detached(self, job, future):
+        with self._lock:
+            self._detached -= 1
+        error = future.exception()
+        if error:
+            self._finish(job, error=error)
+        else:
+            self._finish(job, future.result())
+
+    def _finish(self, job, result=None, error=None):
+        if error is None:
+            job.result = result
+            state = Job.FINISHED
+        else:
+            job.error = str(error)
+            state = Job.FAILED
+        job.finished_at = time.time()
+        self._set_state(job, state)
+
+    def _set_state(self, job, state):
+        job.set_state(state)
+        if self.on_state:
+            try:
+                self.on_state(job)
+            except Exception as e:
+                print(f"Error in state callback for job {job.id}: {e}")
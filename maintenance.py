@@ -0,0 +1,49 @@
+"""
+משימות תחזוקה מחזוריות של השרת - כולן ב-thread אחד לכל תהליך
+"""
+
+import threading
+import time
+
+
+class Maintenance:
+    """מריץ כל משימה פעם ב-interval שניות. משימה שנכשלה נרשמת ותרוץ שוב
+    בזמן הרגיל; משימה איטית רק מעכבת את האחרות, לא מכפילה את עצמה"""
+
+    def __init__(self):
+        self._tasks = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def every(self, interval, func, name=None):
+        self._tasks.append({'interval': interval, 'func': func,
+                            'name': name or func.__name__, 'due': 0.0, 'runs': 0})
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for task in self._tasks:
+                if task['due'] > now:
+                    continue
+                try:
+                    task['func']()
+                except Exception as e:
+                    print(f"Error in {task['name']}: {e}")
+                task['runs'] += 1
+                task['due'] = time.monotonic() + task['interval']
+            next_due = min((task['due'] for task in self._tasks), default=now + 1)
+            self._stop.wait(max(next_due - time.monotonic(), 0.05))
+
+    def stats(self):
+        return {task['name']: {'interval': task['interval'], 'runs': task['runs']}
+                for task in self._tasks}
@@ -0,0 +1,126 @@
+"""
+מדדים בפורמט הטקסט של Prometheus - מונים, מדדים רגעיים והיסטוגרמות בלי תלויות חיצוניות
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# דליים לשלבים שנמשכים בין עשיריות שנייה לעשרות דקות
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """מונה שרק עולה"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_labels(self.labelnames, key)} {value}'
+
+
+class Gauge:
+    """מדד רגעי שנקרא מפונקציה בזמן האיסוף - אין עלות כשלא אוספים"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if value is not None:
+            yield f'{self.name} {value}'
+
+
+class Histogram:
+    """התפלגות משכי זמן לפי דליים מצטברים"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), count, total)
+                     for key, (counts, count, total) in self._series.items()]
+        for key, counts, count, total in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                labels = _labels(self.labelnames + ('le',), key + (bound,))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _labels(self.labelnames, key)
+            yield f'{self.name}_count{labels} {count}'
+            yield f'{self.name}_sum{labels} {total}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """כל המדדים בפורמט הטקסט של Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                lines.append(f'# error collecting {metric.name}: {e}')
+        return '\n'.join(lines) + '\n'
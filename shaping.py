@@ -0,0 +1,205 @@
+"""
+חלוקת רוחב הפס של שליחת הקבצים (/api/file) בין הלקוחות.
+
+* מגבלה כללית ומגבלה לכל לקוח (לפי כתובת IP), בבתים לשנייה
+* כל שליחה מזמינה בלוק רק אחרי ששלחה את הקודם, וההזמנות נענות לפי סדר
+  ההגעה - כך השליחות הפעילות מתחלקות שווה בקצב, ושליחה ללקוח איטי לא
+  תופסת רוחב פס שהיא לא משתמשת בו
+* בזמן שהורדות מהאתר רצות, חלק מהמגבלה הכללית נשמר להן
+"""
+
+import itertools
+import threading
+import time
+
+# המתנה קצרה מזה לא מבוצעת - החוב נשאר ונפרע בבלוק הבא
+MIN_SLEEP = 0.005
+
+
+class RateBucket:
+    """rate בתים לשנייה. הזמנה תמיד מתקבלת ומכניסה את הדלי לחוב, והממתין
+    ישן עד שהחוב נפרע. rate 0 - בלי הגבלה"""
+
+    def __init__(self, rate, burst_seconds, clock=time.monotonic):
+        self.rate = rate
+        self.burst_seconds = burst_seconds
+        self.tokens = rate * burst_seconds
+        self.updated = clock()
+
+    def book(self, size, now):
+        """הזמנת size בתים - מחזיר כמה שניות לחכות לפני השליחה"""
+        if not self.rate:
+            return 0
+        burst = self.rate * self.burst_seconds
+        self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate) - size
+        self.updated = now
+        return max(-self.tokens, 0) / self.rate
+
+
+class Transfer:
+    """שליחה אחת (חיבור אחד) - pace לפני כל בלוק, close בסוף"""
+
+    def __init__(self, shaper, transfer_id, client, name, endpoint, size):
+        self.shaper = shaper
+        self.id = transfer_id
+        self.client = client
+        self.name = name
+        self.endpoint = endpoint
+        self.size = size
+        self.started = shaper.clock()
+        self.sent = 0
+        self.waited = 0.0
+        # קצב בחלון האחרון, ל-stats
+        self._window_started = self.started
+        self._window_bytes = 0
+        self.rate = 0.0
+
+    def pace(self, size):
+        """הזמנת הבלוק הבא - מחזיר את זמן ההמתנה לפני שליחתו"""
+        return self.shaper._book(self, size)
+
+    def close(self):
+        self.shaper._close(self)
+
+    def stats(self, now):
+        elapsed = now - self.started
+        return {
+            'id': self.id,
+            'client': self.client,
+            'name': self.name,
+            'endpoint': self.endpoint,
+            'size': self.size,
+            'sent': self.sent,
+            'seconds': round(elapsed, 2),
+            'rate_bps': round(self.rate),
+            'average_bps': round(self.sent / elapsed) if elapsed else 0,
+            'waited_seconds': round(self.waited, 2),
+        }
+
+
+class ShapedBody:
+    """גוף תשובת WSGI שכל בלוק שלו יוצא אחרי ההמתנה שנקבעה לו"""
+
+    def __init__(self, body, transfer):
+        self.body = body
+        self.transfer = transfer
+
+    def __iter__(self):
+        for block in self.body:
+            delay = self.transfer.pace(len(block))
+            if delay >= MIN_SLEEP:
+                time.sleep(delay)
+            yield block
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.transfer.close()
+
+
+class BandwidthShaper:
+    """rate - בתים לשנייה לכל השליחות יחד, client_rate - לכל לקוח (0 - בלי הגבלה).
+    ingest_reserve - החלק מ-rate שלא משמש לשליחה כל עוד ingest_active() אמת
+    (הורדות מהאתר רצות). clock - לבדיקות"""
+
+    def __init__(self, rate=0, client_rate=0, ingest_reserve=0.2, ingest_active=None,
+                 burst_seconds=0.5, clock=time.monotonic):
+        self.clock = clock
+        self.rate = rate
+        self.client_rate = client_rate
+        self.ingest_reserve = ingest_reserve
+        self.ingest_active = ingest_active
+        self.burst_seconds = burst_seconds
+        self._global = RateBucket(rate, burst_seconds, clock)
+        self._clients = {}
+        self._transfers = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._ingest = False
+        self._ingest_checked = 0
+        self.total_sent = 0
+        self.total_waited = 0.0
+        self.completed = 0
+
+    @property
+    def enabled(self):
+        return bool(self.rate or self.client_rate)
+
+    def chunk_size(self):
+        """גודל בלוק ששליחה בלוקים שלמים (sendfile) מזמינה - בערך 50ms בקצב המוגבל"""
+        limits = [rate for rate in (self.rate, self.client_rate) if rate]
+        if not limits:
+            return 1024 * 1024
+        return min(max(int(min(limits) / 20), 16 * 1024), 1024 * 1024)
+
+    def open(self, client, name, endpoint='file', size=None):
+        with self._lock:
+            transfer = Transfer(self, next(self._ids), client, name, endpoint, size)
+            self._transfers[transfer.id] = transfer
+            state = self._clients.get(client)
+            if state is None:
+                state = self._clients[client] = {
+                    'bucket': RateBucket(self.client_rate, self.burst_seconds, self.clock), 'transfers': 0}
+            state['transfers'] += 1
+        return transfer
+
+    def _close(self, transfer):
+        with self._lock:
+            if self._transfers.pop(transfer.id, None) is None:
+                return
+            self.completed += 1
+            state = self._clients[transfer.client]
+            state['transfers'] -= 1
+            if not state['transfers']:
+                del self._clients[transfer.client]
+
+    def _check_ingest(self, now):
+        # נבדק פעם בשנייה לכל היותר - הבדיקה נוגעת בנעילה של תור ההורדות
+        if self.ingest_active and self.rate and now - self._ingest_checked >= 1:
+            self._ingest_checked = now
+            self._ingest = bool(self.ingest_active())
+
+    def _book(self, transfer, size):
+        now = self.clock()
+        self._check_ingest(now)
+        with self._lock:
+            if self.rate:
+                self._global.rate = self.rate * (1 - self.ingest_reserve) if self._ingest else self.rate
+            delay = self._global.book(size, now)
+            state = self._clients.get(transfer.client)
+            if state:
+                delay = max(delay, state['bucket'].book(size, now))
+            transfer.sent += size
+            transfer.waited += delay
+            self.total_sent += size
+            self.total_waited += delay
+            # קצב אחרון - חלון של שנייה
+            transfer._window_bytes += size
+            window = now - transfer._window_started
+            if window >= 1:
+                transfer.rate = transfer._window_bytes / window
+                transfer._window_started, transfer._window_bytes = now, 0
+        return delay
+
+    def transfers(self):
+        """מצב כל שליחה פעילה"""
+        now = self.clock()
+        with self._lock:
+            return [transfer.stats(now) for transfer in self._transfers.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'rate_bps': self.rate,
+                'client_rate_bps': self.client_rate,
+                'effective_rate_bps': self._global.rate,
+                'ingest_active': self._ingest,
+                'active_transfers': len(self._transfers),
+                'active_clients': len(self._clients),
+                'completed_transfers': self.completed,
+                'sent_bytes': self.total_sent,
+                'waited_seconds': round(self.total_waited, 2),
+            }
@@ -0,0 +1,342 @@
+"""
+מצב משותף לכמה תהליכים או שרתים - עבודות, מיקום הקבצים, נעילות וחכירות
+(leases: קבצים שנשלחים כרגע ומקום ששמרו הורדות שרצות).
+
+    SQLiteState  - כמה תהליכים באותו שרת (gunicorn -w N), קובץ SQLite משותף
+    RedisState   - כמה שרתים מאחורי load balancer, כל לקוח בממשק של redis-py
+    LocalRedis   - תחליף ל-Redis בתוך התהליך, לבדיקות ולהרצה בתהליך אחד
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# עבודה שלא עודכנה זמן רב נחשבת נטושה (התהליך שהריץ אותה נפל)
+JOB_TTL = 3600
+
+
+class SQLiteState:
+    """מצב משותף בקובץ SQLite. SQLite נועל את הקובץ בכתיבה, כך שהנעילות
+    בטוחות בין תהליכים באותו שרת"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)''')
+        db.execute('''CREATE TABLE IF NOT EXISTS files (
+            download_id TEXT PRIMARY KEY, data TEXT NOT NULL)''')
+        db.execute('''CREATE TABLE IF NOT EXISTS locks (
+            name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)''')
+        db.execute('''CREATE TABLE IF NOT EXISTS leases (
+            kind TEXT NOT NULL, name TEXT NOT NULL, owner TEXT NOT NULL, value INTEGER NOT NULL,
+            expires_at REAL NOT NULL, PRIMARY KEY (kind, name, owner))''')
+
+    def _db(self):
+        # חיבור לכל thread - בלי נעילה משותפת בתוך התהליך. אחרי fork החיבור
+        # שעבר בירושה מה-thread הראשי לא בשימוש - נפתח חדש
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def put_job(self, job_id, data, ttl=JOB_TTL):
+        self._db().execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)',
+                           (job_id, json.dumps(data), time.time() + ttl))
+
+    def get_job(self, job_id):
+        row = self._db().execute('SELECT data FROM jobs WHERE job_id = ? AND expires_at > ?',
+                                 (job_id, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_file(self, download_id, data):
+        self._db().execute('INSERT OR REPLACE INTO files VALUES (?, ?)',
+                           (download_id, json.dumps(data)))
+
+    def get_file(self, download_id):
+        row = self._db().execute('SELECT data FROM files WHERE download_id = ?',
+                                 (download_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def remove_file(self, download_id, node):
+        """הסרת המיקום - רק אם הקובץ רשום על השרת הזה"""
+        data = self.get_file(download_id)
+        if data and data.get('node') == node:
+            self._db().execute('DELETE FROM files WHERE download_id = ?', (download_id,))
+
+    def acquire(self, name, owner, ttl):
+        """נעילה עם תפוגה - True אם התקבלה (או שכבר שלנו, ואז היא מתחדשת)"""
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT owner, expires_at FROM locks WHERE name = ?', (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            db.execute('INSERT OR REPLACE INTO locks VALUES (?, ?, ?)', (name, owner, now + ttl))
+            return True
+        finally:
+            db.execute('COMMIT')
+
+    def release(self, name, owner):
+        self._db().execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+
+    def put_lease(self, kind, name, owner, value, ttl):
+        """חכירה של owner על name (למשל קובץ נעוץ) עם ערך, שפגה אחרי ttl אם לא חודשה"""
+        self._db().execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?, ?)',
+                           (kind, name, owner, value, time.time() + ttl))
+
+    def remove_lease(self, kind, name, owner):
+        self._db().execute('DELETE FROM leases WHERE kind = ? AND name = ? AND owner = ?',
+                           (kind, name, owner))
+
+    def leases(self, kind):
+        """החכירות בתוקף מסוג kind - רשימה של (name, owner, value)"""
+        return self._db().execute('SELECT name, owner, value FROM leases WHERE kind = ? AND expires_at > ?',
+                                  (kind, time.time())).fetchall()
+
+    def prune(self):
+        now = time.time()
+        db = self._db()
+        db.execute('DELETE FROM jobs WHERE expires_at < ?', (now,))
+        db.execute('DELETE FROM locks WHERE expires_at < ?', (now,))
+        db.execute('DELETE FROM leases WHERE expires_at < ?', (now,))
+
+
+class RedisState:
+    """מצב משותף ב-Redis. client הוא redis.Redis (או LocalRedis) עם decode_responses=True"""
+
+    def __init__(self, client, prefix='ytdl:'):
+        self.client = client
+        self.prefix = prefix
+
+    def put_job(self, job_id, data, ttl=JOB_TTL):
+        self.client.set(f'{self.prefix}job:{job_id}', json.dumps(data), ex=ttl)
+
+    def get_job(self, job_id):
+        data = self.client.get(f'{self.prefix}job:{job_id}')
+        return json.loads(data) if data else None
+
+    def put_file(self, download_id, data):
+        self.client.hset(f'{self.prefix}files', download_id, json.dumps(data))
+
+    def get_file(self, download_id):
+        data = self.client.hget(f'{self.prefix}files', download_id)
+        return json.loads(data) if data else None
+
+    def remove_file(self, download_id, node):
+        data = self.get_file(download_id)
+        if data and data.get('node') == node:
+            self.client.hdel(f'{self.prefix}files', download_id)
+
+    def acquire(self, name, owner, ttl):
+        key = f'{self.prefix}lock:{name}'
+        if self.client.set(key, owner, nx=True, ex=ttl):
+            return True
+        if self.client.get(key) == owner:
+            self.client.expire(key, ttl)
+            return True
+        return False
+
+    def release(self, name, owner):
+        # בדיקה ומחיקה בלי טרנזקציה: במקרה הגרוע הנעילה של מישהו אחר משתחררת
+        # מוקדם והורדה אחת רצה פעמיים - לא שווה סקריפט Lua
+        key = f'{self.prefix}lock:{name}'
+        if self.client.get(key) == owner:
+            self.client.delete(key)
+
+    def put_lease(self, kind, name, owner, value, ttl):
+        # לשדות ב-hash אין תפוגה משלהם - זמן התפוגה נשמר עם הערך
+        self.client.hset(f'{self.prefix}leases:{kind}', json.dumps([name, owner]),
+                         json.dumps([value, time.time() + ttl]))
+
+    def remove_lease(self, kind, name, owner):
+        self.client.hdel(f'{self.prefix}leases:{kind}', json.dumps([name, owner]))
+
+    def leases(self, kind):
+        now = time.time()
+        result, expired = [], []
+        for field, data in self.client.hgetall(f'{self.prefix}leases:{kind}').items():
+            value, expires_at = json.loads(data)
+            if expires_at > now:
+                result.append((*json.loads(field), value))
+            else:
+                expired.append(field)
+        if expired:
+            self.client.hdel(f'{self.prefix}leases:{kind}', *expired)
+        return result
+
+    def prune(self):
+        # ל-Redis יש תפוגה משלו, וחכירות שפגו נמחקות בקריאה
+        pass
+
+
+class LocalRedis:
+    """החלק של redis-py ש-RedisState משתמש בו, בזיכרון התהליך"""
+
+    def __init__(self):
+        self._values = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._values
+
+    def get(self, key):
+        with self._lock:
+            return self._values.get(key) if self._alive(key) else None
+
+    def set(self, key, value, nx=False, ex=None):
+        with self._lock:
+            if nx and self._alive(key):
+                return None
+            self._values[key] = value
+            self._expires.pop(key, None)
+            if ex:
+                self._expires[key] = time.time() + ex
+            return True
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._expires[key] = time.time() + seconds
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._alive(key):
+                    del self._values[key]
+                    self._expires.pop(key, None)
+                    removed += 1
+            return removed
+
+    def hset(self, name, key, value):
+        with self._lock:
+            self._alive(name)
+            self._values.setdefault(name, {})[key] = value
+            return 1
+
+    def hget(self, name, key):
+        with self._lock:
+            return self._values[name].get(key) if self._alive(name) else None
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._values[name]) if self._alive(name) else {}
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            if not self._alive(name):
+                return 0
+            return sum(1 for key in keys if self._values[name].pop(key, None) is not None)
+
+
+def open_state(backend, path=None, url=None):
+    """יצירת המצב המשותף לפי STATE_BACKEND: sqlite, redis או memory"""
+    if backend == 'sqlite':
+        return SQLiteState(path)
+    if backend == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('STATE_BACKEND=redis requires the redis package (pip install redis)')
+        return RedisState(redis.Redis.from_url(url, decode_responses=True))
+    if backend == 'memory':
+        return RedisState(LocalRedis())
+    raise ValueError(f'Unknown state backend: {backend}')
+
+
+class RemoteJob:
+    """עבודה שרצה בתהליך או בשרת אחר, לפי העותק שלה במצב המשותף.
+    יש לה אותו ממשק קריאה כמו ל-Job, כך שמצב, SSE וקבוצות עובדים גם איתה"""
+
+    POLL_INTERVAL = 1
+    # שדות פנימיים בעותק (מיקום הקבצים בשרת שמריץ) - לא נשלחים ללקוח
+    LOCAL_FIELDS = ('host', 'partial_path', 'output_path', 'stream')
+
+    def __init__(self, state, job_id, data=None):
+        self.id = job_id
+        self._state = state
+        self._data = data or {'job_id': job_id, 'download_id': job_id, 'state': 'queued'}
+        self._fetched = time.time() if data else 0
+        self._seen = data is not None
+        self.version = 0
+
+    def refresh(self):
+        if time.time() - self._fetched >= self.POLL_INTERVAL:
+            self._fetched = time.time()
+            data = self._state.get_job(self.id)
+            if data is None and self._seen and self._data['state'] not in ('finished', 'failed'):
+                # העותק פג בלי שהעבודה הסתיימה - התהליך שהריץ אותה נפל
+                data = dict(self._data, state='failed', error='Worker running this download stopped')
+            if data and data != self._data:
+                self._data = data
+                self._seen = True
+                self.version += 1
+        return self._data
+
+    @property
+    def state(self):
+        return self.refresh()['state']
+
+    @property
+    def done(self):
+        return self.state in ('finished', 'failed')
+
+    @property
+    def result(self):
+        data = self.refresh()
+        return data if data['state'] == 'finished' else None
+
+    @property
+    def error(self):
+        return self.refresh().get('error')
+
+    @property
+    def node(self):
+        return self.refresh().get('node')
+
+    @property
+    def host(self):
+        return self.refresh().get('host')
+
+    @property
+    def partial_path(self):
+        return self.refresh().get('partial_path')
+
+    @property
+    def output_path(self):
+        return self.refresh().get('output_path')
+
+    @property
+    def progress(self):
+        return self.refresh().get('progress') or {}
+
+    @property
+    def streamable(self):
+        return bool(self.refresh().get('stream'))
+
+    def wait_for_change(self, version, timeout=None):
+        deadline = time.time() + (timeout or 0)
+        while True:
+            self.refresh()
+            if self.version != version or self.done or time.time() >= deadline:
+                return self.version
+            time.sleep(self.POLL_INTERVAL)
+
+    def to_dict(self):
+        return {k: v for k, v in self.refresh().items() if k not in self.LOCAL_FIELDS}
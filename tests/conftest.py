@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app נטען בבדיקות עם תיקיית הורדות זמנית ובלי דרישת מקום פנוי
+os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp(prefix='ytdl-tests-'))
+os.environ.setdefault('MIN_FREE_BYTES', '0')
+
+from state import open_state  # noqa: E402
+
+
+class Clock:
+    """שעון שמתקדם רק ב-advance"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time מזויף - התפוגות במצב המשותף ובפרסום העבודות נקבעות לפיו"""
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def monotonic():
+    """שעון מזויף שמועבר כ-clock למחלקות שמקבלות אותו (קצב הפניות, תעבורה)"""
+    return Clock(0.0)
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def state(request, tmp_path):
+    """כל בדיקה רצה מול SQLiteState ומול RedisState על LocalRedis"""
+    return open_state(request.param, path=str(tmp_path / 'state.sqlite3'))
@@ -0,0 +1,163 @@
+import pytest
+
+import app
+from jobs import Job
+from state import RemoteJob
+
+
+def publish_every_second(job, clock, seconds):
+    for _ in range(seconds):
+        clock.advance(1)
+        app.publish_job(job)
+
+
+def test_unchanged_job_stays_in_shared_state(monkeypatch, clock, state):
+    # עבודה שממתינה בתור (או למקום, או להמרה) בלי שינוי יותר מ-LOCK_TTL
+    monkeypatch.setattr(app, 'shared_state', state)
+    monkeypatch.setattr(app, 'published_jobs', {})
+    job = Job({'url': 'https://example.com/watch?v=1'})
+    app.publish_job(job)
+
+    publish_every_second(job, clock, app.LOCK_TTL * 3)
+
+    assert state.get_job(job.id)['state'] == Job.QUEUED
+    assert RemoteJob(state, job.id).state == Job.QUEUED
+    assert not state.acquire(f'download:{job.id}', 'other-worker', app.LOCK_TTL)
+
+
+def test_job_of_stopped_worker_expires(monkeypatch, clock, state):
+    monkeypatch.setattr(app, 'shared_state', state)
+    monkeypatch.setattr(app, 'published_jobs', {})
+    job = Job({'url': 'https://example.com/watch?v=1'})
+    app.publish_job(job)
+    remote = RemoteJob(state, job.id, state.get_job(job.id))
+
+    # התהליך נפל - אף אחד לא מפרסם יותר
+    clock.advance(app.LOCK_TTL + 1)
+
+    assert state.get_job(job.id) is None
+    assert remote.state == Job.FAILED
+    assert state.acquire(f'download:{job.id}', 'other-worker', app.LOCK_TTL)
+
+
+def test_finished_job_is_kept_and_lock_released(monkeypatch, clock, state):
+    monkeypatch.setattr(app, 'shared_state', state)
+    monkeypatch.setattr(app, 'published_jobs', {})
+    job = Job({'url': 'https://example.com/watch?v=1'})
+    app.publish_job(job)
+    job.set_state(Job.FINISHED)
+    app.publish_job(job)
+
+    clock.advance(app.LOCK_TTL * 3)
+
+    assert state.get_job(job.id)['state'] == Job.FINISHED
+    assert state.acquire(f'download:{job.id}', 'other-worker', app.LOCK_TTL)
+
+
+def make_file(name, size=1024):
+    path = app.os.path.join(app.DOWNLOAD_DIR, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+
+def test_transcoded_job_does_not_stay_transcoding():
+    job = Job({'url': 'https://example.com/watch?v=1'})
+    job.update_progress(status='transcoding')
+    path = make_file(f'{job.id}.mp3')
+
+    entry = app.finish_transcode(job, {'path': path, 'mode': 'copy', 'seconds': 0.1}, 'Title', 10)
+
+    assert job.progress['status'] == 'finished'
+    assert entry['filename'] == app.os.path.basename(path)
+    app.result_cache.discard(job.id)
+
+
+def test_failed_transcode_does_not_stay_transcoding():
+    job = Job({'url': 'https://example.com/watch?v=1'})
+    job.update_progress(status='transcoding')
+    path = make_file(f'{job.id}.m4a')
+
+    app.fail_download(job, {path})
+
+    assert job.progress['status'] == 'failed'
+    assert not app.os.path.exists(path)
+
+
+def jobs_total(state):
+    return app.JOBS_TOTAL._values.get((state,), 0)
+
+
+def test_job_failing_in_cache_add_is_counted_once(monkeypatch):
+    job = Job({'url': 'https://example.com/watch?v=1'})
+    path = make_file(f'{job.id}.mp4')
+    finished, failed = jobs_total(Job.FINISHED), jobs_total(Job.FAILED)
+
+    def evict():
+        raise OSError('disk error')
+
+    monkeypatch.setattr(app.result_cache, 'evict', evict)
+    with pytest.raises(OSError):
+        app.finish_download(job, path, 'Title', 10)
+
+    assert jobs_total(Job.FINISHED) == finished
+    assert jobs_total(Job.FAILED) == failed + 1
+    assert app.result_cache.get(job.id) is None
+    assert not app.os.path.exists(path)
+
+
+def served_bytes(endpoint):
+    return app.SERVED_BYTES._values.get((endpoint,), 0)
+
+
+def cached_file(size):
+    job_id = Job({}).id
+    make_file(f'{job_id}.mp4', size)
+    app.result_cache.add(job_id, {'filename': f'{job_id}.mp4', 'title': 'Title', 'duration': 10})
+    return job_id
+
+
+def test_aborted_transfer_counts_only_sent_bytes(monkeypatch):
+    monkeypatch.setattr(app, 'start', lambda: None)
+    size = 4 * 1024 * 1024
+    download_id = cached_file(size)
+    before = served_bytes('file')
+
+    response = app.app.test_client().get(f'/api/file/{download_id}', buffered=False)
+    body = iter(response.response)
+    first = next(body)
+    # הלקוח התנתק אחרי הבלוק הראשון
+    response.close()
+
+    assert served_bytes('file') - before <= len(first) < size
+    assert download_id not in app.result_cache._pinned_keys()
+    app.result_cache.discard(download_id)
+
+
+def test_complete_transfer_counts_whole_file(monkeypatch):
+    monkeypatch.setattr(app, 'start', lambda: None)
+    size = 256 * 1024 + 5
+    download_id = cached_file(size)
+    before = served_bytes('file')
+
+    response = app.app.test_client().get(f'/api/file/{download_id}')
+    data = response.data
+    response.close()
+
+    assert len(data) == size
+    assert served_bytes('file') - before == size
+    app.result_cache.discard(download_id)
+
+
+@pytest.mark.parametrize('quality', [720, ['720p'], True])
+def test_non_string_quality_is_rejected(monkeypatch, quality):
+    monkeypatch.setattr(app, 'start', lambda: None)
+    response = app.app.test_client().post('/api/download', json={'url': 'https://youtu.be/x', 'quality': quality})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'quality must be a string'
+
+
+def test_null_quality_means_best():
+    params = app.parse_download_params({'quality': None}, 'https://youtu.be/x')
+    assert params['quality'] == 'best'
+    assert params['target'] == {}
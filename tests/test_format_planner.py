@@ -0,0 +1,103 @@
+import pytest
+
+from format_planner import fallback_selector, make_target, plan_format
+
+
+def fmt(format_id, ext, vcodec='none', acodec='none', height=None, fps=None, abr=None, tbr=None,
+        filesize=None):
+    return {'format_id': format_id, 'url': f'https://cdn/{format_id}', 'ext': ext, 'vcodec': vcodec,
+            'acodec': acodec, 'height': height, 'fps': fps, 'abr': abr, 'tbr': tbr, 'filesize': filesize}
+
+
+# רשימה בנוסח YouTube: קובץ מוכן אחד, וידאו בלבד ואודיו בלבד בשני קונטיינרים
+FORMATS = [
+    fmt('18', 'mp4', 'avc1.42001E', 'mp4a.40.2', height=360, fps=30, tbr=600, filesize=8_000_000),
+    fmt('140', 'm4a', acodec='mp4a.40.2', abr=129, tbr=129, filesize=3_000_000),
+    fmt('251', 'webm', acodec='opus', abr=160, tbr=160, filesize=3_500_000),
+    fmt('136', 'mp4', 'avc1.4d401f', height=720, fps=30, tbr=1500, filesize=20_000_000),
+    fmt('247', 'webm', 'vp9', height=720, fps=30, tbr=1200, filesize=16_000_000),
+    fmt('137', 'mp4', 'avc1.640028', height=1080, fps=30, tbr=3000, filesize=40_000_000),
+]
+INFO = {'duration': 200, 'formats': FORMATS}
+
+
+def test_audio_only_prefers_copyable_audio_stream():
+    plan = plan_format(INFO, make_target(audio_format='m4a'))
+    assert plan['format'] == '140'
+    assert not plan['transcode']
+    assert not plan['merge']
+
+
+def test_audio_only_transcodes_best_audio_when_nothing_copies():
+    plan = plan_format(INFO, make_target(audio_format='mp3'))
+    # שום מקור אינו mp3 - האודיו בלבד עם קצב הסיביות הגבוה ביותר
+    assert plan['format'] == '251'
+    assert plan['transcode']
+
+
+def test_audio_only_never_picks_video_while_audio_stream_exists():
+    formats = [f for f in FORMATS if f['format_id'] != '140']
+    plan = plan_format({'duration': 200, 'formats': formats}, make_target(audio_format='m4a'))
+    # ל-18 יש aac שאפשר להעתיק, אבל הוא גדול פי כמה מ-251
+    assert plan['format'] == '251'
+
+
+def test_video_merges_into_same_container():
+    plan = plan_format(INFO, make_target('720p'))
+    assert plan['format'] == '247+251'
+    assert plan['ext'] == 'webm'
+    assert plan['estimated_bytes'] == 16_000_000 + 3_500_000
+
+
+def test_container_restricts_merge():
+    plan = plan_format(INFO, make_target('720p', container='mp4'))
+    assert plan['format'] == '136+140'
+    assert plan['ext'] == 'mp4'
+
+
+def test_size_cap_lowers_resolution():
+    plan = plan_format(INFO, make_target('best', max_filesize=25_000_000))
+    assert plan['height'] == 720
+    assert plan['estimated_bytes'] <= 25_000_000
+
+
+def test_size_cap_uses_bitrate_estimate():
+    formats = [dict(f, filesize=None) for f in FORMATS]
+    # 1080p: (3000 + 129) kbps * 200 שניות הם כ-78MB, 720p עם opus כ-34MB
+    plan = plan_format({'duration': 200, 'formats': formats}, make_target('best', max_filesize=50_000_000))
+    assert plan['format'] == '247+251'
+    assert plan['estimated_bytes'] == int(1200 * 1000 / 8 * 200) + int(160 * 1000 / 8 * 200)
+
+
+def test_size_cap_applies_to_audio():
+    plan = plan_format(INFO, make_target(audio_format='m4a', max_filesize=3_200_000))
+    assert plan['format'] == '140'
+    assert plan_format(INFO, make_target(audio_format='m4a', max_filesize=1_000_000)) is None
+
+
+def test_nothing_fits_size_cap():
+    target = make_target('best', max_filesize=1000)
+    assert plan_format(INFO, target) is None
+    assert fallback_selector(target) == 'bestvideo[filesize<=1000]+bestaudio/best[filesize<=1000]/best'
+
+
+@pytest.mark.parametrize('max_filesize', ['10', 10])
+def test_max_filesize_accepts_digits(max_filesize):
+    assert make_target(max_filesize=max_filesize) == {'max_filesize': 10}
+
+
+@pytest.mark.parametrize('max_filesize', [-1, 1.5, 'big', True])
+def test_invalid_max_filesize(max_filesize):
+    with pytest.raises(ValueError, match='max_filesize'):
+        make_target(max_filesize=max_filesize)
+
+
+@pytest.mark.parametrize('quality', [720, 1.5, ['720p'], {'height': 720}])
+def test_invalid_quality(quality):
+    with pytest.raises(ValueError, match='quality'):
+        make_target(quality)
+
+
+def test_raw_selector_is_not_planned():
+    assert make_target('bestvideo[height<=480]+bestaudio') is None
+    assert fallback_selector(None, 'bestvideo[height<=480]+bestaudio') == 'bestvideo[height<=480]+bestaudio'
@@ -0,0 +1,93 @@
+import pytest
+
+from shaping import BandwidthShaper, RateBucket
+
+
+def test_bucket_goes_into_debt_and_refills(monotonic):
+    bucket = RateBucket(1000, 0.5, monotonic)
+    # חצי שנייה של burst
+    assert bucket.book(500, monotonic()) == 0
+    assert bucket.book(1000, monotonic()) == pytest.approx(1.0)
+
+    monotonic.advance(0.5)
+    assert bucket.book(0, monotonic()) == pytest.approx(0.5)
+    monotonic.advance(60)
+    bucket.book(0, monotonic())
+    assert bucket.tokens == 500
+
+
+def test_bucket_without_rate_never_waits(monotonic):
+    bucket = RateBucket(0, 0.5, monotonic)
+    assert bucket.book(10 ** 9, monotonic()) == 0
+
+
+def test_client_limit_is_shared_by_its_transfers(monotonic):
+    shaper = BandwidthShaper(client_rate=1000, burst_seconds=0, clock=monotonic)
+    first = shaper.open('10.0.0.1', 'a')
+    second = shaper.open('10.0.0.1', 'b')
+    other = shaper.open('10.0.0.2', 'c')
+
+    assert first.pace(1000) == pytest.approx(1.0)
+    assert second.pace(1000) == pytest.approx(2.0)
+    # ללקוח אחר דלי משלו
+    assert other.pace(1000) == pytest.approx(1.0)
+
+    first.close()
+    second.close()
+    assert shaper.stats()['active_clients'] == 1
+    other.close()
+    # close שני לא נספר פעמיים
+    other.close()
+    assert shaper.stats()['completed_transfers'] == 3
+
+
+def test_global_limit_is_shared_in_booking_order(monotonic):
+    shaper = BandwidthShaper(rate=1000, burst_seconds=0, clock=monotonic)
+    transfers = [shaper.open('10.0.0.1', 'a'), shaper.open('10.0.0.2', 'b')]
+    delays = [transfers[i % 2].pace(100) for i in range(6)]
+    assert delays == pytest.approx([0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
+    assert [t.sent for t in transfers] == [300, 300]
+
+    # כל שליחה ממתינה לבלוק שלה, והחוב נפרע עם הזמן
+    monotonic.advance(0.6)
+    assert transfers[0].pace(100) == pytest.approx(0.1)
+
+
+def test_ingest_reserve_applies_while_downloads_run(monotonic):
+    downloading = [True]
+    shaper = BandwidthShaper(rate=1000, ingest_reserve=0.2, ingest_active=lambda: downloading[0],
+                             burst_seconds=0, clock=monotonic)
+    monotonic.advance(10)
+    transfer = shaper.open('10.0.0.1', 'a')
+    assert transfer.pace(800) == pytest.approx(1.0)
+    assert shaper.stats()['effective_rate_bps'] == 800
+    assert shaper.stats()['ingest_active']
+
+    # המצב נבדק מחדש רק אחרי שנייה
+    downloading[0] = False
+    transfer.pace(0)
+    assert shaper.stats()['effective_rate_bps'] == 800
+    monotonic.advance(1)
+    transfer.pace(0)
+    assert shaper.stats()['effective_rate_bps'] == 1000
+
+
+def test_transfer_stats(monotonic):
+    shaper = BandwidthShaper(rate=1000, burst_seconds=0, clock=monotonic)
+    transfer = shaper.open('10.0.0.1', 'video.mp4', size=2000)
+    transfer.pace(1000)
+    monotonic.advance(1)
+    transfer.pace(1000)
+
+    [stats] = shaper.transfers()
+    assert stats['sent'] == 2000
+    assert stats['seconds'] == 1
+    assert stats['average_bps'] == 2000
+    assert stats['rate_bps'] == 2000
+    assert stats['waited_seconds'] == pytest.approx(2.0)
+
+
+def test_chunk_size_follows_the_tighter_limit():
+    assert BandwidthShaper().chunk_size() == 1024 * 1024
+    assert BandwidthShaper(rate=10 * 1024 * 1024, client_rate=1024 * 1024).chunk_size() == 1024 * 1024 // 20
+    assert BandwidthShaper(rate=1000).chunk_size() == 16 * 1024
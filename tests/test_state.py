@@ -0,0 +1,99 @@
+from state import RemoteJob
+
+
+def test_lock_is_exclusive_until_released(clock, state):
+    assert state.acquire('download:a', 'w1', 30)
+    assert not state.acquire('download:a', 'w2', 30)
+    # המחזיק מחדש את הנעילה
+    assert state.acquire('download:a', 'w1', 30)
+
+    state.release('download:a', 'w2')
+    assert not state.acquire('download:a', 'w2', 30)
+    state.release('download:a', 'w1')
+    assert state.acquire('download:a', 'w2', 30)
+
+
+def test_lock_expires_unless_renewed(clock, state):
+    assert state.acquire('download:a', 'w1', 30)
+    clock.advance(20)
+    assert state.acquire('download:a', 'w1', 30)
+    clock.advance(20)
+    assert not state.acquire('download:a', 'w2', 30)
+    clock.advance(11)
+    assert state.acquire('download:a', 'w2', 30)
+
+
+def test_job_expires_after_ttl(clock, state):
+    state.put_job('a', {'state': 'running'}, ttl=30)
+    state.put_job('b', {'state': 'finished'})
+    clock.advance(29)
+    assert state.get_job('a') == {'state': 'running'}
+
+    clock.advance(2)
+    state.prune()
+    assert state.get_job('a') is None
+    assert state.get_job('b') == {'state': 'finished'}
+    assert state.get_job('missing') is None
+
+
+def test_put_job_renews_ttl(clock, state):
+    state.put_job('a', {'state': 'queued'}, ttl=30)
+    clock.advance(20)
+    state.put_job('a', {'state': 'queued'}, ttl=30)
+    clock.advance(20)
+    assert state.get_job('a') == {'state': 'queued'}
+
+
+def test_leases_expire_and_are_per_owner(clock, state):
+    state.put_lease('pin', 'file1', 'host:1', 1, 30)
+    state.put_lease('pin', 'file1', 'host:2', 1, 60)
+    state.put_lease('reserve', 'job1', 'host:1', 5000, 30)
+    assert sorted(state.leases('pin')) == [('file1', 'host:1', 1), ('file1', 'host:2', 1)]
+    assert state.leases('reserve') == [('job1', 'host:1', 5000)]
+
+    clock.advance(31)
+    state.prune()
+    assert state.leases('pin') == [('file1', 'host:2', 1)]
+    assert state.leases('reserve') == []
+
+    state.remove_lease('pin', 'file1', 'host:2')
+    assert state.leases('pin') == []
+
+
+def test_file_location_removed_only_by_its_node(state):
+    state.put_file('a', {'node': 'http://n1'})
+    state.remove_file('a', 'http://n2')
+    assert state.get_file('a') == {'node': 'http://n1'}
+    state.remove_file('a', 'http://n1')
+    assert state.get_file('a') is None
+
+
+def test_remote_job_follows_shared_copy(clock, state):
+    state.put_job('a', {'job_id': 'a', 'state': 'running', 'host': 'h', 'partial_path': '/x.part'},
+                  ttl=30)
+    job = RemoteJob(state, 'a', state.get_job('a'))
+    assert job.state == 'running' and not job.done
+    # שדות פנימיים לא נשלחים ללקוח
+    assert job.to_dict() == {'job_id': 'a', 'state': 'running'}
+
+    state.put_job('a', {'job_id': 'a', 'state': 'finished', 'filename': 'a.mp4'})
+    clock.advance(RemoteJob.POLL_INTERVAL)
+    assert job.done and job.result['filename'] == 'a.mp4'
+
+
+def test_remote_job_fails_when_owner_died(clock, state):
+    state.put_job('a', {'job_id': 'a', 'state': 'running'}, ttl=30)
+    job = RemoteJob(state, 'a', state.get_job('a'))
+    version = job.version
+
+    # התהליך שהריץ את העבודה נפל - העותק לא מתחדש ופג
+    clock.advance(31)
+    assert job.state == 'failed'
+    assert job.error == 'Worker running this download stopped'
+    assert job.version != version
+
+
+def test_remote_job_not_yet_published_is_not_failed(clock, state):
+    job = RemoteJob(state, 'a')
+    clock.advance(31)
+    assert job.state == 'queued'
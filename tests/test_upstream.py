@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+from upstream import Throttled, TokenBucket, UpstreamScheduler, is_throttled
+
+
+def test_bucket_refills_up_to_burst(monotonic):
+    bucket = TokenBucket(2, 4, monotonic)
+    for _ in range(4):
+        assert bucket.delay(monotonic()) == 0
+        bucket.take(monotonic())
+    assert bucket.delay(monotonic()) == pytest.approx(0.5)
+
+    monotonic.advance(0.25)
+    assert bucket.delay(monotonic()) == pytest.approx(0.25)
+    monotonic.advance(60)
+    bucket.delay(monotonic())
+    assert bucket.tokens == 4
+
+
+def test_bucket_without_rate_is_unlimited(monotonic):
+    bucket = TokenBucket(0, 1, monotonic)
+    for _ in range(100):
+        bucket.take(monotonic())
+    assert bucket.delay(monotonic()) == 0
+
+
+def test_backoff_doubles_up_to_max(monotonic):
+    scheduler = UpstreamScheduler(backoff=5, max_backoff=12, clock=monotonic)
+    for pause in (5, 10, 12, 12):
+        scheduler.throttled('youtube')
+        assert scheduler.stats()['hosts']['youtube']['paused_seconds'] == pause
+    assert scheduler.stats()['hosts']['youtube']['throttled'] == 4
+
+    # הצלחה מאפסת את ההכפלה
+    scheduler.succeeded('youtube')
+    scheduler.throttled('youtube')
+    assert scheduler.stats()['hosts']['youtube']['paused_seconds'] == 5
+
+
+def test_throttle_halves_rate_and_success_recovers_it(monotonic):
+    scheduler = UpstreamScheduler(host_rate=4, min_rate_fraction=0.2, clock=monotonic)
+    rates = []
+    for _ in range(4):
+        scheduler.throttled('youtube')
+        rates.append(scheduler.stats()['hosts']['youtube']['rate'])
+    # לא יורד מתחת ל-20% מהקצב המקורי
+    assert rates == [2, 1, 0.8, 0.8]
+
+    scheduler.succeeded('youtube')
+    assert scheduler.stats()['hosts']['youtube']['rate'] == pytest.approx(0.88)
+    for _ in range(50):
+        scheduler.succeeded('youtube')
+    assert scheduler.stats()['hosts']['youtube']['rate'] == 4
+
+
+def test_paused_host_raises_instead_of_blocking(monotonic):
+    scheduler = UpstreamScheduler(backoff=30, clock=monotonic)
+    scheduler.throttled('youtube')
+
+    began = time.monotonic()
+    with pytest.raises(Throttled):
+        scheduler.acquire('youtube', 'info', timeout=5)
+    assert time.monotonic() - began < 0.5
+    # אתר אחר לא מושהה
+    assert scheduler.acquire('vimeo', 'info', timeout=5) == 0
+
+    monotonic.advance(30)
+    assert scheduler.acquire('youtube', 'info', timeout=5) == 0
+
+
+def test_run_retries_after_throttle(monotonic):
+    scheduler = UpstreamScheduler(rate=0, host_rate=0, backoff=0, clock=monotonic)
+    attempts = []
+
+    def extract():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise Exception('ERROR: HTTP Error 429: Too Many Requests')
+        return 'info'
+
+    assert scheduler.run('youtube', 'info', extract, retries=1) == 'info'
+    assert len(attempts) == 2
+    assert scheduler.stats()['hosts']['youtube']['throttled'] == 1
+    assert scheduler.stats()['hosts']['youtube']['strikes'] == 0
+
+
+def test_is_throttled_follows_cause():
+    try:
+        try:
+            raise Exception('HTTP Error 429')
+        except Exception as e:
+            raise RuntimeError('extract failed') from e
+    except RuntimeError as e:
+        assert is_throttled(e)
+    assert not is_throttled(Exception('HTTP Error 404'))
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_info_requests_go_before_batch(monotonic):
+    scheduler = UpstreamScheduler(rate=1, burst=1, host_rate=0, clock=monotonic)
+    scheduler.acquire('youtube', 'download')
+    order = []
+
+    def acquire(priority):
+        scheduler.acquire('youtube', priority)
+        order.append(priority)
+
+    threads = []
+    for priority in ('batch', 'download', 'info'):
+        threads.append(threading.Thread(target=acquire, args=(priority,)))
+        threads[-1].start()
+        wait_for(lambda: len(scheduler._waiting) == len(threads))
+
+    for count in range(1, 4):
+        monotonic.advance(1)
+        with scheduler._changed:
+            scheduler._changed.notify_all()
+        wait_for(lambda: len(order) == count)
+    for thread in threads:
+        thread.join()
+    assert order == ['info', 'download', 'batch']
+
+
+def test_concurrent_identical_requests_coalesce(monotonic):
+    scheduler = UpstreamScheduler(clock=monotonic)
+    release = threading.Event()
+    calls = []
+
+    def extract():
+        calls.append(1)
+        release.wait(5)
+        return {'id': 'x'}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(scheduler.coalesce('info:x', extract)))
+    leader.start()
+    wait_for(lambda: calls)
+    follower = threading.Thread(target=lambda: results.append(scheduler.coalesce('info:x', extract)))
+    follower.start()
+    wait_for(lambda: scheduler.coalesced == 1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(calls) == 1
+    assert results[0] is results[1]
+    assert scheduler.stats()['in_flight_info'] == 0
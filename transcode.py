@@ -0,0 +1,93 @@
+"""
+המרת אודיו בתהליכי ffmpeg נפרדים, כך שהמרות כבדות לא תופסות את עובדי ההורדה
+"""
+
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FFMPEG = os.environ.get('FFMPEG', 'ffmpeg')
+
+# פורמט יעד -> (הקודק שמאפשר העתקה בלי קידוד, מקודד, פורמט הקובץ של ffmpeg)
+AUDIO_FORMATS = {
+    'mp3': ('mp3', 'libmp3lame', 'mp3'),
+    'm4a': ('aac', 'aac', 'ipod'),
+}
+
+
+def codec_name(acodec):
+    """שם הקודק מהמחרוזת של yt-dlp ('mp4a.40.2' -> 'aac')"""
+    if not acodec or acodec == 'none':
+        return None
+    acodec = acodec.split('.')[0].lower()
+    return 'aac' if acodec == 'mp4a' else acodec
+
+
+def extract_audio(source, audio_format, quality, source_codec=None, audio_only_source=False):
+    """המרת source לקובץ אודיו בפורמט audio_format בתהליך ffmpeg.
+    כשהקודק של המקור כבר מתאים האודיו מועתק כמו שהוא (בלי קידוד מחדש).
+    מחזיר את נתיב הקובץ, האופן (copy / encode / none) ומשך ההמרה"""
+    copy_codec, encoder, muxer = AUDIO_FORMATS[audio_format]
+    base, ext = os.path.splitext(source)
+    target = f'{base}.{audio_format}'
+    started = time.perf_counter()
+
+    # קובץ אודיו בלבד שכבר בפורמט הנכון - אין מה לעשות
+    if audio_only_source and ext == f'.{audio_format}' and source_codec == copy_codec:
+        return {'path': source, 'mode': 'none', 'seconds': 0.0}
+
+    mode = 'copy' if source_codec == copy_codec else 'encode'
+    if mode == 'copy':
+        codec_args = ['-c:a', 'copy']
+    else:
+        codec_args = ['-c:a', encoder, '-b:a', f'{quality}k']
+    temp = target + '.temp'
+    # תהליך אחד לכל ליבה כבר מנצל את המעבד - ffmpeg עצמו מוגבל ל-thread אחד
+    command = [FFMPEG, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+               '-i', source, '-map', '0:a:0', '-threads', '1',
+               *codec_args, '-f', muxer, temp]
+    if muxer == 'ipod':
+        command[-1:-1] = ['-movflags', '+faststart']
+
+    try:
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f'ffmpeg failed: {process.stderr.strip()[-500:]}')
+        os.replace(temp, target)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    if target != source:
+        os.remove(source)
+    return {'path': target, 'mode': mode, 'seconds': time.perf_counter() - started}
+
+
+class TranscodePool:
+    """לכל היותר תהליך ffmpeg אחד לכל ליבה. כל thread במאגר רק ממתין לתהליך שלו,
+    כך שההמרה עצמה לא מתחרה על ה-GIL עם השרת"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix='transcode')
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, source, audio_format, quality, source_codec=None, audio_only_source=False):
+        """המרה ברקע - מחזיר Future עם התוצאה של extract_audio"""
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(extract_audio, source, audio_format, quality,
+                                       source_codec, audio_only_source)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def stats(self):
+        return {'workers': self.workers, 'pending': self.pending}
@@ -0,0 +1,234 @@
+"""
+הורדת קובץ מהשרת בכמה טווחי בתים במקביל, ובדיקת החתיכות מול ה-manifest של השרת
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from chunks import ALGORITHM, chunk_digest
+
+# גודל חתיכה שעובד מוריד בבקשת Range אחת
+PIECE_SIZE = 4 * 1024 * 1024
+# מתחת לגודל הזה חיבור אחד מספיק
+MIN_SEGMENTED_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadCancelled(Exception):
+    """ההורדה בוטלה על ידי המשתמש - הקבצים החלקיים נשארים להמשך"""
+
+
+class ChecksumMismatch(Exception):
+    """חתיכה שלא תאמה לגיבוב שלה ב-manifest גם אחרי הורדה חוזרת"""
+
+
+def make_session(pool_size=16):
+    """Session עם מאגר חיבורים גדול מספיק לכל העובדים"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class SegmentedDownloader:
+    """מוריד קובץ בחתיכות במקביל לתוך קובץ שהוקצה מראש, וכל עובד כותב במיקום שלו.
+
+    מספר העובדים מתחיל ב-initial_segments וגדל כל עוד התוספת האחרונה שיפרה
+    את קצב ההורדה הכולל ביותר מ-10%. החתיכות שהושלמו נרשמות בקובץ <path>.pieces
+    כך שאפשר להמשיך אחרי הפסקה. cancelled - פונקציה שמחזירה True כשצריך לעצור.
+    hashes - הגיבובים מה-manifest (piece_size בגודל החתיכה שלו): חתיכה שלא
+    תואמת מורדת שוב, והחתיכות שמסומנות כגמורות כבר נבדקו"""
+
+    def __init__(self, session, url, path, size, etag=None, initial_segments=4,
+                 max_segments=16, piece_size=PIECE_SIZE, retries=5, progress=None, cancelled=None,
+                 hashes=None):
+        self.session = session
+        self.url = url
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.initial_segments = initial_segments
+        self.max_segments = max_segments
+        self.piece_size = piece_size
+        self.retries = retries
+        self.progress = progress
+        self.cancelled = cancelled or (lambda: False)
+        self.hashes = hashes
+        self.pieces_path = path + '.pieces'
+        self.downloaded = 0
+        # חתיכות שהגיעו פגומות והורדו שוב
+        self.corrupted = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._workers = []
+
+    @property
+    def segments(self):
+        """מספר החיבורים שנפתחו עד כה"""
+        return len(self._workers)
+
+    def run(self):
+        """הורדת כל החתיכות - זורק חריגה אם אחת מהן נכשלה סופית"""
+        pieces = [(start, min(start + self.piece_size, self.size) - 1)
+                  for start in range(0, self.size, self.piece_size)]
+        done = self._load_done()
+
+        # הקצאת הקובץ בגודלו הסופי
+        with open(self.path, 'r+b' if done and os.path.exists(self.path) else 'wb') as f:
+            f.truncate(self.size)
+
+        for index, (start, end) in enumerate(pieces):
+            if index in done:
+                self.downloaded += end - start + 1
+            else:
+                self._pending.put((index, start, end))
+
+        with open(self.pieces_path, 'a', encoding='utf-8') as self._pieces_file:
+            if not done:
+                self._pieces_file.write(f'{self.etag or ""}\n')
+                self._pieces_file.flush()
+            self._monitor()
+
+        if self.error:
+            raise self.error
+        os.remove(self.pieces_path)
+        return self.downloaded
+
+    def _monitor(self):
+        """הפעלת עובדים והוספת עובד כל עוד הקצב הכולל משתפר"""
+        for _ in range(min(self.initial_segments, self._pending.qsize())):
+            self._add_worker()
+
+        best_rate = 0
+        last_bytes, last_time = self.downloaded, time.time()
+        while any(worker.is_alive() for worker in self._workers):
+            time.sleep(1)
+            now = time.time()
+            rate = (self.downloaded - last_bytes) / (now - last_time)
+            last_bytes, last_time = self.downloaded, now
+
+            if self.progress:
+                self.progress(self.downloaded, self.size, rate, len(self._workers))
+
+            if (rate > best_rate * 1.1 and len(self._workers) < self.max_segments
+                    and not self._pending.empty() and not self.error):
+                best_rate = rate
+                self._add_worker()
+
+        for worker in self._workers:
+            worker.join()
+
+    def _add_worker(self):
+        worker = threading.Thread(target=self._worker, daemon=True)
+        self._workers.append(worker)
+        worker.start()
+
+    def _worker(self):
+        # לכל עובד ידית משלו לקובץ - כתיבה במיקום בלי נעילה משותפת
+        with open(self.path, 'r+b') as f:
+            while not self.error:
+                try:
+                    index, start, end = self._pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    self._fetch_piece(f, index, start, end)
+                except Exception as e:
+                    self.error = e
+                    return
+                # הנתונים בדיסק לפני שהחתיכה נרשמת כגמורה
+                f.flush()
+                with self._lock:
+                    self._pieces_file.write(f'{index}\n')
+                    self._pieces_file.flush()
+
+    def _fetch_piece(self, f, index, start, end):
+        """הורדת חתיכה אחת, עם המשך מהבית האחרון שהתקבל אחרי ניתוק. עם hashes
+        החתיכה מגובבת תוך כדי הכתיבה, ואם לא תאמה - מורדת שוב מההתחלה"""
+        position = start
+        digest = hashlib.new(ALGORITHM) if self.hashes else None
+        for attempt in range(self.retries + 1):
+            headers = {'Range': f'bytes={position}-{end}'}
+            if self.etag:
+                headers['If-Range'] = self.etag
+            try:
+                with self.session.get(self.url, headers=headers, stream=True,
+                                      timeout=(10, 60)) as response:
+                    if response.status_code != 206:
+                        raise RuntimeError(f'Server did not honor range request ({response.status_code})')
+                    f.seek(position)
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if self.cancelled():
+                            raise DownloadCancelled()
+                        f.write(chunk)
+                        if digest:
+                            digest.update(chunk)
+                        position += len(chunk)
+                        with self._lock:
+                            self.downloaded += len(chunk)
+                if position != end + 1:
+                    raise requests.exceptions.ChunkedEncodingError('Short read')
+                if not digest or digest.hexdigest() == self.hashes[index]:
+                    return
+                with self._lock:
+                    self.downloaded -= position - start
+                    self.corrupted += 1
+                position = start
+                digest = hashlib.new(ALGORITHM)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ReadTimeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+        raise ChecksumMismatch(f'Piece {index} does not match the server manifest')
+
+    def _load_done(self):
+        """חתיכות שכבר הושלמו בניסיון קודם לאותו קובץ (לפי ETag)"""
+        if not os.path.exists(self.pieces_path) or not os.path.exists(self.path):
+            return set()
+        with open(self.pieces_path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        if not lines or lines[0] != (self.etag or ''):
+            os.remove(self.pieces_path)
+            return set()
+        return {int(line) for line in lines[1:] if line.strip().isdigit()}
+
+
+def repair_chunks(session, url, path, manifest, indexes, etag=None, retries=3, cancelled=None):
+    """הורדה מחדש של החתיכות indexes בלבד לתוך path. כל חתיכה נבדקת מול
+    ה-manifest לפני שהיא נכתבת"""
+    chunk_size = manifest['chunk_size']
+    with open(path, 'r+b') as f:
+        for index in indexes:
+            start = index * chunk_size
+            end = min(start + chunk_size, manifest['size']) - 1
+            headers = {'Range': f'bytes={start}-{end}'}
+            if etag:
+                headers['If-Range'] = etag
+            for attempt in range(retries + 1):
+                if cancelled and cancelled():
+                    raise DownloadCancelled()
+                try:
+                    response = session.get(url, headers=headers, timeout=(10, 60))
+                except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
+                    if attempt == retries:
+                        raise
+                    time.sleep(min(2 ** attempt, 30))
+                    continue
+                if response.status_code != 206:
+                    raise RuntimeError(f'Server did not honor range request ({response.status_code})')
+                if chunk_digest(response.content) == manifest['hashes'][index]:
+                    f.seek(start)
+                    f.write(response.content)
+                    break
+            else:
+                raise ChecksumMismatch(f'Chunk {index} does not match the server manifest')
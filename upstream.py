@@ -0,0 +1,232 @@
+"""
+קצב הפניות לאתר המקור - כל קריאה ל-yt-dlp שיוצאת לרשת עוברת כאן.
+
+* token bucket כללי ו-token bucket לכל אתר (לפי החולץ)
+* עדיפויות: בקשות מידע לפני הורדות, והורדות לפני הרחבת פלייליסטים
+* בקשות מידע זהות שרצות במקביל מתאחדות לחילוץ אחד
+* חסימה מהאתר (429 וכו') מורידה את הקצב לאותו אתר ומשהה אותו לזמן
+  שמוכפל בכל חסימה נוספת; בקשות שהצליחו מחזירות את הקצב בהדרגה
+"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+PRIORITIES = {'info': 0, 'download': 1, 'batch': 2}
+
+# הודעות של yt-dlp כשהאתר מגביל אותנו
+THROTTLE_MARKERS = ('HTTP Error 429', 'Too Many Requests', 'rate-limit', 'rate limit',
+                    'confirm you’re not a bot', "confirm you're not a bot")
+
+
+class Throttled(Exception):
+    """האתר עדיין בהשהיה אחרי חסימה, והבקשה לא יכלה לחכות"""
+
+
+def is_throttled(error):
+    """האם השגיאה (או הסיבה שלה) היא הגבלת קצב מהאתר"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if getattr(error, 'status', None) == 429:
+            return True
+        if any(marker in str(error) for marker in THROTTLE_MARKERS):
+            return True
+        exc_info = getattr(error, 'exc_info', None)
+        error = (exc_info[1] if exc_info else None) or error.__cause__ or error.__context__
+    return False
+
+
+class TokenBucket:
+    """rate אסימונים לשנייה, עד burst שמורים. rate 0 - בלי הגבלה"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """כמה שניות עד שיהיה אסימון"""
+        if not self.rate:
+            return 0
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1
+
+
+class HostState:
+    """הקצב וההשהיה של אתר אחד"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.base_rate = rate
+        self.strikes = 0
+        self.paused_until = 0
+        self.throttled = 0
+
+
+class UpstreamScheduler:
+    """תור עדיפויות לפניות לאתרים. run(host, priority, func) ממתין לתורו
+    ולאסימון (כללי ושל האתר), מריץ את func ומטפל בחסימות. clock - לבדיקות"""
+
+    def __init__(self, rate=10, burst=20, host_rate=5, host_burst=10,
+                 backoff=5, max_backoff=300, min_rate_fraction=0.1, clock=time.monotonic):
+        self.clock = clock
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.min_rate_fraction = min_rate_fraction
+        self._global = TokenBucket(rate, burst, clock)
+        self._hosts = {}
+        self._waiting = []
+        self._counter = itertools.count()
+        self._changed = threading.Condition()
+        self._inflight = {}
+        self.coalesced = 0
+        self.waited_seconds = 0.0
+        self.calls = 0
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(self.host_rate, self.host_burst, self.clock)
+        return state
+
+    def _delay(self, host, now):
+        state = self._host(host)
+        return max(state.paused_until - now, state.bucket.delay(now))
+
+    def acquire(self, host, priority='download', key=None, timeout=None):
+        """המתנה לתור ולאסימון - מחזיר את זמן ההמתנה. זורק Throttled אם
+        timeout עבר (האתר מושהה או התור ארוך מדי)"""
+        began = self.clock()
+        # [עדיפות, סדר הגעה, אתר, מפתח] - ההשוואה לפי העדיפות ואז סדר ההגעה
+        waiter = [PRIORITIES[priority], next(self._counter), host, key]
+        with self._changed:
+            self._waiting.append(waiter)
+            try:
+                while True:
+                    now = self.clock()
+                    # הממתין הראשון בסדר העדיפויות שהאתר שלו פנוי - רק הוא לוקח
+                    # את האסימון הכללי, כך שהורדות לא עוקפות בקשות מידע
+                    first = min((w for w in self._waiting if self._delay(w[2], now) <= 0),
+                                default=None)
+                    wait = max(self._global.delay(now), self._delay(host, now))
+                    if first is waiter and wait <= 0:
+                        self._global.take(now)
+                        self._host(host).bucket.take(now)
+                        break
+                    if timeout is not None and now - began + wait > timeout:
+                        raise Throttled(f'Upstream {host} is rate limited, try again later')
+                    # מי שלוקח אסימון מעיר את כולם; ההמתנה רק חוסמת מלמעלה
+                    self._changed.wait(min(wait, 1) if wait > 0 else 1)
+            finally:
+                self._waiting.remove(waiter)
+                self._changed.notify_all()
+            waited = self.clock() - began
+            self.calls += 1
+            self.waited_seconds += waited
+        return waited
+
+    def boost(self, key, priority):
+        """בקשה שהצטרפה לחילוץ שממתין - הוא מקבל את העדיפות הגבוהה מביניהן"""
+        with self._changed:
+            for waiter in self._waiting:
+                if waiter[3] == key and PRIORITIES[priority] < waiter[0]:
+                    waiter[0] = PRIORITIES[priority]
+            self._changed.notify_all()
+
+    def run(self, host, priority, func, key=None, retries=0, timeout=None):
+        """הרצת func אחרי acquire. בחסימה מהאתר - השהיה, ועוד retries ניסיונות"""
+        for attempt in range(retries + 1):
+            self.acquire(host, priority, key=key, timeout=timeout)
+            try:
+                result = func()
+            except Exception as e:
+                if not is_throttled(e):
+                    raise
+                self.throttled(host)
+                if attempt == retries:
+                    raise
+            else:
+                self.succeeded(host)
+                return result
+
+    def throttled(self, host):
+        """חסימה מהאתר: חצי קצב והשהיה שמוכפלת בכל חסימה נוספת"""
+        with self._changed:
+            state = self._host(host)
+            state.strikes += 1
+            state.throttled += 1
+            pause = min(self.backoff * 2 ** (state.strikes - 1), self.max_backoff)
+            state.paused_until = self.clock() + pause
+            if state.bucket.rate:
+                state.bucket.rate = max(state.bucket.rate / 2, state.base_rate * self.min_rate_fraction)
+                state.bucket.tokens = min(state.bucket.tokens, 0)
+            self._changed.notify_all()
+        print(f"Upstream {host} throttled, pausing {pause:.0f}s")
+
+    def succeeded(self, host):
+        """הצלחה מחזירה את הקצב בהדרגה (10% בכל פעם) ומאפסת את ספירת החסימות"""
+        with self._changed:
+            state = self._host(host)
+            state.strikes = 0
+            if state.bucket.rate and state.bucket.rate < state.base_rate:
+                state.bucket.rate = min(state.base_rate, state.bucket.rate * 1.1)
+
+    def coalesce(self, key, func, priority='info'):
+        """func פעם אחת לכל key בו-זמנית: מי שמגיע בזמן שהחילוץ רץ מקבל את אותה תוצאה"""
+        with self._changed:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            self.boost(key, priority)
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._changed:
+                del self._inflight[key]
+
+    def stats(self):
+        now = self.clock()
+        with self._changed:
+            waiting = {}
+            for name, value in PRIORITIES.items():
+                waiting[name] = sum(1 for w in self._waiting if w[0] == value)
+            hosts = {host: {
+                'rate': round(state.bucket.rate, 3),
+                'strikes': state.strikes,
+                'throttled': state.throttled,
+                'paused_seconds': round(max(state.paused_until - now, 0), 1),
+            } for host, state in self._hosts.items()}
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'waited_seconds': round(self.waited_seconds, 3),
+            'waiting': waiting,
+            'in_flight_info': len(self._inflight),
+            'hosts': hosts,
+        }
@@ -0,0 +1,155 @@
+"""
+מאגר של מופעי YoutubeDL חמים. יצירת YoutubeDL טוענת את החולצים, מפרשת את
+ההגדרות ופותחת מאגר חיבורים חדש - כאן כל אלה נשמרים בין בקשות.
+yt-dlp עצמו מיובא רק כשנוצר המופע הראשון (או ב-preload)
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+_ytdlp = None
+_load_lock = threading.Lock()
+
+
+def load_ytdlp():
+    """המודול yt_dlp, עם התוספים שלו. הייבוא הראשון נעשה בנעילה - ייבוא ראשון
+    במקביל מכמה threads נשבר על הייבוא המעגלי של yt-dlp"""
+    global _ytdlp
+    if _ytdlp is None:
+        with _load_lock:
+            if _ytdlp is None:
+                import yt_dlp
+                from yt_dlp.globals import all_plugins_loaded
+                from yt_dlp.plugins import load_all_plugins
+
+                # חולצים מתוספים נטענים בדרך כלל רק ביצירת YoutubeDL
+                if not all_plugins_loaded.value:
+                    load_all_plugins()
+                _ytdlp = yt_dlp
+    return _ytdlp
+
+
+def preload():
+    """טעינת yt-dlp וכל החולצים מראש - מחזיר את משך הטעינה. בתהליך הראשי
+    של gunicorn --preload הזיכרון הזה משותף לכל העובדים (copy-on-write)"""
+    started = time.perf_counter()
+    yt_dlp = load_ytdlp()
+    from yt_dlp.extractor import gen_extractor_classes
+
+    for ie in gen_extractor_classes():
+        ie.ie_key()
+    yt_dlp.YoutubeDL({'quiet': True}).close()
+    return time.perf_counter() - started
+
+
+class PooledYDL:
+    """מופע במאגר, עם מתי נוצר וכמה בקשות שירת"""
+
+    def __init__(self, ydl):
+        self.ydl = ydl
+        self.created_at = time.time()
+        self.uses = 0
+
+
+class YDLPool:
+    """מופעים פנויים לפי סט הגדרות. כל מופע משמש בקשה אחת בכל פעם (YoutubeDL
+    לא בטוח לשימוש מכמה threads) וחוזר למאגר בסופה, עם החיבורים הפתוחים שלו.
+
+    size - כמה מופעים פנויים נשמרים לכל סט הגדרות (0 - מופע חדש לכל בקשה).
+    מופע מוחלף אחרי max_uses בקשות או max_age שניות, כדי שהמצב שמצטבר בו
+    לא יגדל בלי סוף"""
+
+    def __init__(self, size=8, max_uses=200, max_age=600, factory=None):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.factory = factory
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(params):
+        return json.dumps(params, sort_keys=True)
+
+    def _create(self, params):
+        factory = self.factory or load_ytdlp().YoutubeDL
+        with self._lock:
+            self.created += 1
+        return PooledYDL(factory(dict(params)))
+
+    def _expired(self, item):
+        return item.uses >= self.max_uses or time.time() - item.created_at >= self.max_age
+
+    @contextmanager
+    def checkout(self, params):
+        """מופע YoutubeDL להגדרות params (רק ערכים שאפשר לייצג ב-JSON)"""
+        key = self._key(params)
+        item = None
+        with self._lock:
+            idle = self._idle[key]
+            while idle and item is None:
+                item = idle.pop()
+                if self._expired(item):
+                    item.ydl.close()
+                    item = None
+            if item:
+                self.reused += 1
+        if item is None:
+            item = self._create(params)
+        DownloadError = load_ytdlp().utils.DownloadError
+
+        try:
+            yield item.ydl
+        except DownloadError:
+            # שגיאת חילוץ רגילה (סרטון לא זמין וכו') - המופע עצמו תקין
+            self._return(key, item)
+            raise
+        except BaseException:
+            item.ydl.close()
+            raise
+        else:
+            self._return(key, item)
+
+    def _return(self, key, item):
+        item.uses += 1
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.size and not self._expired(item):
+                idle.append(item)
+                return
+        item.ydl.close()
+
+    def warm(self, params, count=1):
+        """יצירת מופעים מראש, כך שגם הבקשות הראשונות ימצאו מופע חם"""
+        key = self._key(params)
+        for _ in range(count):
+            with self._lock:
+                if len(self._idle[key]) >= self.size:
+                    return
+            item = self._create(params)
+            with self._lock:
+                self._idle[key].append(item)
+
+    def close(self):
+        with self._lock:
+            items = [item for idle in self._idle.values() for item in idle]
+            self._idle.clear()
+        for item in items:
+            item.ydl.close()
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(items) for items in self._idle.values())
+            checkouts = self.created + self.reused
+        return {
+            'idle': idle,
+            'created': self.created,
+            'reused': self.reused,
+            'reuse_ratio': round(self.reused / checkouts, 3) if checkouts else None,
+        }
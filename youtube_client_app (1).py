@@ -8,60 +8,68 @@ YouTube Downloader Client
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import requests
+import queue
 import threading
 import os
-import json
 import webbrowser
-from urllib.parse import urlparse
 from datetime import datetime
 import sys
 
+import client_engine
+from client_engine import DownloadEngine, ServerError
+from download_queue import DownloadQueue, QueueItem
+
+# קצב עדכון הממשק מה-threads של ההורדה (20 פעמים בשנייה)
+UI_TICK_MS = 50
+# היומן שומר רק את השורות האחרונות
+MAX_LOG_LINES = 2000
+
+# עמודות טבלת התור
+QUEUE_COLUMNS = (
+    ('title', "סרטון", 260),
+    ('state', "מצב", 90),
+    ('progress', "התקדמות", 70),
+    ('size', "גודל", 70),
+    ('speed', "מהירות", 80),
+    ('eta', "זמן נותר", 70),
+)
+STATE_LABELS = {
+    QueueItem.WAITING: "⏳ ממתין",
+    QueueItem.DONE: "✅ הושלם",
+    QueueItem.FAILED: "❌ נכשל",
+    QueueItem.CANCELLED: "⏹️ בוטל",
+}
+STAGE_LABELS = {None: "📤 נשלח", 'server': "🖥️ בשרת", 'transfer': "📥 מוריד"}
+
+
 class YouTubeDownloader:
     def __init__(self):
-        self.server_url = self.load_server_config()
-        self.setup_gui()
-        
-    def load_server_config(self):
-        """טוען הגדרות שרת מקובץ קונפיגורציה"""
-        config_file = 'config.json'
-        default_config = {
-            'server_url': 'http://YOUR_SERVER_IP:5000',
-            'download_dir': os.path.expanduser('~/Downloads'),
-            'default_quality': 'best'
-        }
+        config = client_engine.load_config()
+        self.server_url = config['server_url']
+        # כל הבקשות לשרת עוברות דרך המנוע - הממשק רק מציג
+        self.engine = DownloadEngine(self.server_url, pool_size=32)
+        self.queue = DownloadQueue(self.engine, concurrency=config['queue_concurrency'],
+                                   on_change=self.queue_changed, on_log=self.log_message)
+        # עדכוני ממשק מ-threads אחרים: קריאות לפי הסדר, ושורת המצב, פס ההתקדמות
+        # והיומן נאספים ומוצגים יחד בכל tick
+        self._ui_calls = queue.SimpleQueue()
+        self._ui_lock = threading.Lock()
+        self._latest = {}
+        self._log_lines = []
+        self._changed_items = set()
+        self.setup_gui(config['queue_concurrency'])
         
-        try:
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                return config.get('server_url', default_config['server_url'])
-            else:
-                # יצירת קובץ קונפיגורציה חדש
-                with open(config_file, 'w', encoding='utf-8') as f:
-                    json.dump(default_config, f, indent=2, ensure_ascii=False)
-                return default_config['server_url']
-        except Exception:
-            return default_config['server_url']
-    
     def save_server_config(self, server_url):
         """שומר הגדרות שרת"""
         try:
-            config = {'server_url': server_url}
-            if os.path.exists('config.json'):
-                with open('config.json', 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            
-            config['server_url'] = server_url
-            
-            with open('config.json', 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            client_engine.save_config(server_url=server_url)
         except Exception as e:
             print(f"Error saving config: {e}")
         
-    def setup_gui(self):
+    def setup_gui(self, concurrency):
         self.root = tk.Tk()
         self.root.title("YouTube Downloader - מוריד סרטונים")
-        self.root.geometry("700x600")
+        self.root.geometry("760x780")
         self.root.resizable(True, True)
         
         # Style configuration
@@ -80,17 +88,19 @@ class YouTubeDownloader:
         self.settings_frame = ttk.Frame(self.notebook, padding="10")
         self.notebook.add(self.settings_frame, text="הגדרות")
         
-        self.setup_download_tab()
+        self.setup_download_tab(concurrency)
         self.setup_settings_tab()
+        self.root.after(UI_TICK_MS, self.process_ui_events)
         
-    def setup_download_tab(self):
+    def setup_download_tab(self, concurrency):
         # Title
         title_label = ttk.Label(self.download_frame, text="🎬 מוריד סרטונים מיוטיוב", 
                                font=('Arial', 16, 'bold'))
-        title_label.pack(pady=(0, 20))
+        title_label.pack(pady=(0, 10))
         
         # URL input section
-        url_section = ttk.LabelFrame(self.download_frame, text="📎 קישור הסרטון", padding="10")
+        url_section = ttk.LabelFrame(self.download_frame, text="📎 קישורים (אפשר כמה, מופרדים ברווח)",
+                                     padding="10")
         url_section.pack(fill=tk.X, pady=(0, 10))
         
         self.url_var = tk.StringVar()
@@ -147,11 +157,53 @@ class YouTubeDownloader:
         download_section = ttk.Frame(self.download_frame)
         download_section.pack(fill=tk.X, pady=(0, 10))
         
-        self.download_button = ttk.Button(download_section, text="⬇️ הורד עכשיו", 
+        self.download_button = ttk.Button(download_section, text="⬇️ הוסף לתור", 
                                         command=self.start_download, 
                                         style='Accent.TButton')
         self.download_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        ttk.Label(download_section, text="הורדות במקביל:").pack(side=tk.LEFT, padx=(10, 5))
+        self.concurrency_var = tk.IntVar(value=concurrency)
+        concurrency_spinbox = ttk.Spinbox(download_section, from_=1, to=8, width=4,
+                                          textvariable=self.concurrency_var,
+                                          command=self.concurrency_changed)
+        concurrency_spinbox.pack(side=tk.LEFT)
+        concurrency_spinbox.bind('<Return>', lambda event: self.concurrency_changed())
+        concurrency_spinbox.bind('<FocusOut>', lambda event: self.concurrency_changed())
+        
+        # Queue section
+        queue_section = ttk.LabelFrame(self.download_frame, text="📋 תור הורדות", padding="10")
+        queue_section.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        
+        tree_frame = ttk.Frame(queue_section)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.queue_tree = ttk.Treeview(tree_frame, columns=[c[0] for c in QUEUE_COLUMNS],
+                                       show='headings', height=7)
+        for column, heading, width in QUEUE_COLUMNS:
+            self.queue_tree.heading(column, text=heading)
+            self.queue_tree.column(column, width=width, stretch=(column == 'title'))
+        queue_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.queue_tree.yview)
+        self.queue_tree.configure(yscrollcommand=queue_scrollbar.set)
+        self.queue_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        queue_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.queue_tree.bind('<Double-1>', self.open_queue_item)
+        
+        queue_buttons_frame = ttk.Frame(queue_section)
+        queue_buttons_frame.pack(fill=tk.X, pady=(5, 0))
+        
+        ttk.Button(queue_buttons_frame, text="⏹️ בטל", 
+                  command=lambda: self.for_selected(self.queue.cancel)).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(queue_buttons_frame, text="🔁 נסה שוב", 
+                  command=lambda: self.for_selected(self.queue.retry)).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(queue_buttons_frame, text="🗑️ הסר", 
+                  command=lambda: self.for_selected(self.queue.remove)).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(queue_buttons_frame, text="🧹 נקה שהושלמו", 
+                  command=self.queue.clear_finished).pack(side=tk.LEFT)
+        
+        for item in self.queue.items():
+            self.update_queue_row(item)
+        
         # Progress section
         progress_section = ttk.LabelFrame(self.download_frame, text="📊 התקדמות", padding="10")
         progress_section.pack(fill=tk.X, pady=(0, 10))
@@ -170,7 +222,7 @@ class YouTubeDownloader:
         log_frame = ttk.Frame(log_section)
         log_frame.pack(fill=tk.BOTH, expand=True)
         
-        self.log_text = tk.Text(log_frame, height=8, wrap=tk.WORD, font=('Consolas', 9))
+        self.log_text = tk.Text(log_frame, height=6, wrap=tk.WORD, font=('Consolas', 9))
         log_scrollbar = ttk.Scrollbar(log_frame, orient=tk.VERTICAL, command=self.log_text.yview)
         self.log_text.configure(yscrollcommand=log_scrollbar.set)
         
@@ -180,6 +232,8 @@ class YouTubeDownloader:
         # Add initial log message
         self.log_message("🚀 יוטיוב דאונלודר מוכן לפעולה!")
         self.log_message(f"🔗 מחובר לשרת: {self.server_url}")
+        if self.queue.items():
+            self.log_message(f"📋 נטענו {len(self.queue.items())} פריטים מהתור הקודם")
         
     def setup_settings_tab(self):
         # Server settings
@@ -267,7 +321,9 @@ class YouTubeDownloader:
     
     def open_downloads_folder(self):
         """פתיחת תיקיית ההורדות"""
-        download_dir = self.download_dir_var.get()
+        self.open_folder(self.download_dir_var.get())
+    
+    def open_folder(self, download_dir):
         if os.path.exists(download_dir):
             if sys.platform.startswith('win'):
                 os.startfile(download_dir)
@@ -279,38 +335,173 @@ class YouTubeDownloader:
             messagebox.showerror("שגיאה", "תיקיית ההורדות לא קיימת")
     
     def log_message(self, message):
-        """הוספת הודעה ליומן"""
+        """הוספת הודעה ליומן - אפשר מכל thread, מוצג ב-tick הבא"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        formatted_message = f"[{timestamp}] {message}\n"
-        
-        self.log_text.insert(tk.END, formatted_message)
+        with self._ui_lock:
+            self._log_lines.append(f"[{timestamp}] {message}\n")
+    
+    def in_ui(self, func, *args, **kwargs):
+        """הרצת func ב-thread של הממשק (Tk לא בטוח לשימוש מ-threads אחרים)"""
+        self._ui_calls.put((func, args, kwargs))
+    
+    def set_status(self, text):
+        """שורת המצב - רק הערך האחרון בכל tick מוצג"""
+        with self._ui_lock:
+            self._latest['status'] = text
+    
+    def set_busy(self):
+        """פס התקדמות נע, כשאין אחוזים"""
+        with self._ui_lock:
+            self._latest['progress'] = 'busy'
+    
+    def process_ui_events(self):
+        """ה-tick של הממשק: הקריאות שהצטברו, ואז השורות החדשות ביומן
+        והערכים האחרונים של שורת המצב ופס ההתקדמות"""
+        try:
+            while True:
+                try:
+                    func, args, kwargs = self._ui_calls.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    func(*args, **kwargs)
+                except Exception as e:
+                    print(f"Error in UI callback: {e}")
+            
+            with self._ui_lock:
+                latest, self._latest = self._latest, {}
+                lines, self._log_lines = self._log_lines, []
+                changed, self._changed_items = self._changed_items, set()
+            for item_id in changed:
+                self.update_queue_row(self.queue.get(item_id), item_id)
+            if changed:
+                self.show_queue_summary()
+            if lines:
+                self.append_log(''.join(lines))
+            if 'status' in latest:
+                self.progress_var.set(latest['status'])
+            if 'progress' in latest:
+                self.show_progress(latest['progress'])
+        finally:
+            self.root.after(UI_TICK_MS, self.process_ui_events)
+    
+    def queue_changed(self, item):
+        """פריט בתור השתנה - אפשר מכל thread, השורה מתעדכנת ב-tick הבא"""
+        with self._ui_lock:
+            self._changed_items.add(item.id)
+    
+    def update_queue_row(self, item, item_id=None):
+        """עדכון שורה בטבלת התור, או מחיקתה אם הפריט הוסר (item הוא None)"""
+        if item is None:
+            if self.queue_tree.exists(item_id):
+                self.queue_tree.delete(item_id)
+            return
+        if item.state == QueueItem.RUNNING:
+            state = STAGE_LABELS.get(item.stage, STAGE_LABELS[None])
+        else:
+            state = STATE_LABELS[item.state]
+        values = (
+            item.label,
+            state,
+            f"{item.percent:.1f}%" if item.percent is not None else "",
+            f"{item.size / 1024 / 1024:.1f}MB" if item.size else "",
+            f"{item.speed / 1024 / 1024:.1f}MB/s" if item.speed else "",
+            "{}:{:02d}".format(*divmod(int(item.eta), 60)) if item.eta is not None else "",
+        )
+        if self.queue_tree.exists(item.id):
+            self.queue_tree.item(item.id, values=values)
+        else:
+            self.queue_tree.insert('', tk.END, iid=item.id, values=values)
+    
+    def show_queue_summary(self):
+        """שורת המצב ופס ההתקדמות לפי כל ההורדות הפעילות"""
+        items = self.queue.items()
+        running = [item for item in items if item.state == QueueItem.RUNNING]
+        waiting = sum(1 for item in items if item.state == QueueItem.WAITING)
+        done = sum(1 for item in items if item.state == QueueItem.DONE)
+        if not running and not waiting:
+            self.progress_var.set(f"✅ מוכן להורדה ({done} הושלמו)" if done else "✅ מוכן להורדה")
+            self.show_progress(None)
+            return
+        speed = sum(item.speed or 0 for item in running)
+        self.progress_var.set(f"⬇️ {len(running)} פעילות, {waiting} ממתינות, {done} הושלמו"
+                              + (f" ({speed / 1024 / 1024:.1f}MB/s)" if speed else ""))
+        sized = [item for item in running if item.size and item.percent is not None]
+        if sized:
+            total = sum(item.size for item in sized)
+            self.show_progress(sum(item.size * item.percent for item in sized) / total)
+        else:
+            self.show_progress('busy')
+    
+    def for_selected(self, action):
+        """הפעלת פעולת תור (ביטול, ניסיון חוזר, הסרה) על השורות שנבחרו"""
+        selection = self.queue_tree.selection()
+        if not selection:
+            messagebox.showinfo("תור הורדות", "בחר פריט בטבלה")
+            return
+        for item_id in selection:
+            action(item_id)
+    
+    def open_queue_item(self, event):
+        """לחיצה כפולה: פתיחת התיקייה של הורדה שהושלמה, או הצגת השגיאה"""
+        item = self.queue.get(self.queue_tree.identify_row(event.y))
+        if item and item.state == QueueItem.DONE:
+            self.open_folder(item.download_dir)
+        elif item and item.error:
+            messagebox.showerror("ההורדה נכשלה", f"{item.label}\n\n{item.error}")
+    
+    def concurrency_changed(self):
+        try:
+            concurrency = self.concurrency_var.get()
+        except tk.TclError:
+            return
+        self.queue.set_concurrency(concurrency)
+        client_engine.save_config(queue_concurrency=self.queue.concurrency)
+    
+    def append_log(self, text):
+        """הוספה ליומן ומחיקת השורות הישנות מעבר ל-MAX_LOG_LINES"""
+        self.log_text.insert(tk.END, text)
+        lines = int(self.log_text.index('end-1c').split('.')[0])
+        if lines > MAX_LOG_LINES:
+            self.log_text.delete('1.0', f'{lines - MAX_LOG_LINES}.0')
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
+    
+    def show_progress(self, value):
+        """percent (0-100), 'busy' לפס נע, או None למצב ההתחלתי"""
+        if value is None:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='indeterminate', value=0)
+        elif value == 'busy':
+            self.progress_bar.config(mode='indeterminate', value=0)
+            self.progress_bar.start()
+        else:
+            if str(self.progress_bar['mode']) != 'determinate':
+                self.progress_bar.stop()
+                self.progress_bar.config(mode='determinate', maximum=100)
+            self.progress_bar['value'] = value
     
     def test_server_connection(self):
         """בדיקת חיבור לשרת"""
+        server_url = self.server_url_var.get().strip().rstrip('/')
+        self.server_status_var.set("🔄 בודק חיבור...")
+        
         def test_connection():
             try:
-                self.server_status_var.set("🔄 בודק חיבור...")
-                server_url = self.server_url_var.get().strip().rstrip('/')
-                
-                response = requests.get(f"{server_url}/health", timeout=10)
-                
-                if response.status_code == 200:
-                    self.server_status_var.set("✅ השרת זמין ופועל")
-                    self.log_message("✅ חיבור לשרת תקין")
-                else:
-                    self.server_status_var.set("❌ השרת לא מגיב כראוי")
-                    self.log_message("❌ השרת מחזיר שגיאה")
+                DownloadEngine(server_url, session=self.engine.session).health()
+                self.in_ui(self.server_status_var.set, "✅ השרת זמין ופועל")
+                self.log_message("✅ חיבור לשרת תקין")
                     
+            except requests.exceptions.HTTPError:
+                self.in_ui(self.server_status_var.set, "❌ השרת לא מגיב כראוי")
+                self.log_message("❌ השרת מחזיר שגיאה")
             except requests.exceptions.Timeout:
-                self.server_status_var.set("⏰ זמן החיבור פג")
+                self.in_ui(self.server_status_var.set, "⏰ זמן החיבור פג")
                 self.log_message("⏰ זמן החיבור לשרת פג")
             except requests.exceptions.ConnectionError:
-                self.server_status_var.set("🔌 לא ניתן להתחבר לשרת")
+                self.in_ui(self.server_status_var.set, "🔌 לא ניתן להתחבר לשרת")
                 self.log_message("🔌 בעיית חיבור לשרת")
             except Exception as e:
-                self.server_status_var.set(f"❌ שגיאה: {str(e)[:30]}")
+                self.in_ui(self.server_status_var.set, f"❌ שגיאה: {str(e)[:30]}")
                 self.log_message(f"❌ שגיאה בבדיקת חיבור: {str(e)}")
         
         threading.Thread(target=test_connection, daemon=True).start()
@@ -319,7 +510,7 @@ class YouTubeDownloader:
         """שמירת הגדרות שרת"""
         new_url = self.server_url_var.get().strip().rstrip('/')
         if new_url:
-            self.server_url = new_url
+            self.server_url = self.engine.server_url = new_url
             self.save_server_config(new_url)
             self.log_message(f"💾 כתובת השרת נשמרה: {new_url}")
             messagebox.showinfo("הצלחה", "הגדרות השרת נשמרו בהצלחה")
@@ -332,11 +523,13 @@ class YouTubeDownloader:
             try:
                 if os.path.exists('config.json'):
                     os.remove('config.json')
-                self.server_url = "http://YOUR_SERVER_IP:5000"
+                self.server_url = self.engine.server_url = client_engine.DEFAULT_CONFIG['server_url']
                 self.server_url_var.set(self.server_url)
                 self.download_dir_var.set(os.path.expanduser("~/Downloads"))
                 self.quality_var.set("best")
                 self.format_var.set("video")
+                self.concurrency_var.set(client_engine.DEFAULT_CONFIG['queue_concurrency'])
+                self.queue.set_concurrency(self.concurrency_var.get())
                 self.log_message("🔄 הגדרות אופסו בהצלחה")
                 messagebox.showinfo("הצלחה", "ההגדרות אופסו בהצלחה")
             except Exception as e:
@@ -348,62 +541,74 @@ class YouTubeDownloader:
         if not url:
             messagebox.showerror("שגיאה", "אנא הכנס קישור")
             return
+        options = self.download_options()
         
         def fetch_info():
             try:
-                self.progress_var.set("🔍 מקבל מידע על הסרטון...")
-                self.progress_bar.start()
+                self.set_status("🔍 מקבל מידע על הסרטון...")
+                self.set_busy()
                 
-                response = requests.post(f"{self.server_url}/api/info", 
-                                       json={"url": url}, timeout=30)
+                # טבלת הפורמטים ממוינת בשרת - הטובים ביותר קודם, רק העמודות שמוצגות
+                info = self.engine.video_info(url, options, params={
+                    "sort": "-height,-tbr", "limit": 8,
+                    "fields": "height,fps,ext,vcodec,acodec,filesize,filesize_approx"})
                 
-                if response.status_code == 200:
-                    info = response.json()
-                    self.log_message("=" * 50)
-                    self.log_message(f"🎬 כותרת: {info['title']}")
-                    self.log_message(f"👤 יוצר: {info['uploader']}")
-                    
-                    if info.get('duration'):
-                        minutes = info['duration'] // 60
-                        seconds = info['duration'] % 60
-                        self.log_message(f"⏱️ אורך: {minutes}:{seconds:02d}")
-                    
-                    if info.get('view_count'):
-                        self.log_message(f"👁️ צפיות: {info['view_count']:,}")
-                    
-                    # הצגת פורמטים זמינים
-                    if info.get('formats'):
-                        self.log_message("🎥 פורמטים זמינים:")
-                        for fmt in info['formats'][:5]:  # מציג רק 5 ראשונים
-                            quality = fmt.get('quality', 'לא ידוע')
-                            ext = fmt.get('ext', 'לא ידוע')
-                            size = fmt.get('filesize')
-                            size_str = f" ({size//1024//1024:.1f}MB)" if size else ""
-                            self.log_message(f"   • {quality} - {ext}{size_str}")
-                    
-                    self.log_message("=" * 50)
-                    
-                else:
-                    error = response.json().get('error', 'שגיאה לא ידועה')
-                    self.log_message(f"❌ שגיאה בקבלת מידע: {error}")
-                    messagebox.showerror("שגיאה", error)
-                    
+                self.log_message("=" * 50)
+                self.log_message(f"🎬 כותרת: {info['title']}")
+                self.log_message(f"👤 יוצר: {info['uploader']}")
+                
+                if info.get('duration'):
+                    minutes = info['duration'] // 60
+                    seconds = info['duration'] % 60
+                    self.log_message(f"⏱️ אורך: {minutes}:{seconds:02d}")
+                
+                if info.get('view_count'):
+                    self.log_message(f"👁️ צפיות: {info['view_count']:,}")
+                
+                # הצגת פורמטים זמינים
+                if info.get('formats'):
+                    self.log_message("🎥 פורמטים זמינים:")
+                    for fmt in info['formats']:
+                        if fmt.get('height'):
+                            quality = f"{fmt['height']}p{fmt.get('fps') or ''}"
+                        else:
+                            quality = "אודיו"
+                        if fmt.get('vcodec') != 'none' and fmt.get('acodec') == 'none':
+                            quality += " (וידאו בלבד)"
+                        ext = fmt.get('ext', 'לא ידוע')
+                        size = fmt.get('filesize') or fmt.get('filesize_approx')
+                        size_str = f" ({size / 1024 / 1024:.1f}MB)" if size else ""
+                        self.log_message(f"   • {quality} - {ext}{size_str}")
+                
+                # הפורמט שהשרת יבחר להגדרות הנוכחיות
+                plan = info.get('plan')
+                if plan:
+                    size = plan.get('estimated_bytes')
+                    size_str = f" (~{size / 1024 / 1024:.1f}MB)" if size else ""
+                    height = f"{plan['height']}p " if plan.get('height') else ""
+                    self.log_message(f"📦 יורד: {height}{plan.get('ext') or ''}{size_str}")
+                
+                self.log_message("=" * 50)
+                
+            except ServerError as e:
+                self.log_message(f"❌ שגיאה בקבלת מידע: {e}")
+                self.in_ui(messagebox.showerror, "שגיאה", str(e))
             except requests.exceptions.Timeout:
                 self.log_message("⏰ זמן קבלת המידע פג")
-                messagebox.showerror("שגיאה", "זמן קבלת המידע פג")
+                self.in_ui(messagebox.showerror, "שגיאה", "זמן קבלת המידע פג")
             except Exception as e:
                 self.log_message(f"❌ שגיאה בקבלת מידע: {str(e)}")
-                messagebox.showerror("שגיאה", f"שגיאה בקבלת מידע: {str(e)}")
+                self.in_ui(messagebox.showerror, "שגיאה", f"שגיאה בקבלת מידע: {str(e)}")
             finally:
-                self.progress_bar.stop()
-                self.progress_var.set("✅ מוכן להורדה")
+                # שורת המצב חוזרת להציג את התור
+                self.in_ui(self.show_queue_summary)
         
         threading.Thread(target=fetch_info, daemon=True).start()
     
     def start_download(self):
-        """התחלת הורדה"""
-        url = self.url_var.get().strip()
-        if not url:
+        """הוספת הקישורים לתור ההורדות"""
+        urls = self.url_var.get().split()
+        if not urls:
             messagebox.showerror("שגיאה", "אנא הכנס קישור")
             return
         
@@ -416,99 +621,25 @@ class YouTubeDownloader:
                 messagebox.showerror("שגיאה", f"לא ניתן ליצור תיקיה: {str(e)}")
                 return
         
-        def download():
-            try:
-                self.progress_var.set("⬇️ מתחיל הורדה...")
-                self.progress_bar.start()
-                self.download_button.config(state='disabled')
-                
-                # הכנת נתוני הבקשה
-                format_selection = self.format_var.get()
-                quality = self.quality_var.get()
-                
-                data = {
-                    "url": url,
-                    "quality": quality,
-                    "audio_only": format_selection.startswith('audio')
-                }
-                
-                self.log_message(f"📤 שולח בקשת הורדה לשרת...")
-                self.log_message(f"🎯 איכות: {quality}")
-                self.log_message(f"📝 פורמט: {format_selection}")
-                
-                # שליחת בקשת הורדה
-                response = requests.post(f"{self.server_url}/api/download", 
-                                       json=data, timeout=300)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    download_id = result['download_id']
-                    filename = result['filename']
-                    title = result.get('title', 'לא ידוע')
-                    
-                    self.log_message(f"✅ השרת סיים להוריד: {title}")
-                    self.progress_var.set("📥 מוריד קובץ למחשב...")
-                    
-                    # הורדת הקובץ מהשרת
-                    file_response = requests.get(f"{self.server_url}/api/file/{download_id}", 
-                                               stream=True, timeout=300)
-                    
-                    if file_response.status_code == 200:
-                        local_path = os.path.join(download_dir, filename)
-                        
-                        # כתיבת הקובץ
-                        total_size = int(file_response.headers.get('content-length', 0))
-                        downloaded = 0
-                        
-                        with open(local_path, 'wb') as f:
-                            for chunk in file_response.iter_content(chunk_size=8192):
-                                if chunk:
-                                    f.write(chunk)
-                                    downloaded += len(chunk)
-                                    
-                                    if total_size > 0:
-                                        percent = (downloaded / total_size) * 100
-                                        self.progress_var.set(f"📥 מוריד: {percent:.1f}%")
-                        
-                        self.log_message(f"💾 קובץ נשמר: {filename}")
-                        self.log_message(f"📍 מיקום: {local_path}")
-                        self.progress_var.set("🎉 הורדה הושלמה בהצלחה!")
-                        
-                        # הצגת הודעת הצלחה
-                        result_msg = f"הקובץ נשמר בהצלחה!\n\nשם: {filename}\nמיקום: {local_path}"
-                        if messagebox.askyesno("הורדה הושלמה", 
-                                             result_msg + "\n\nלפתוח את התיקיה?"):
-                            self.open_downloads_folder()
-                    else:
-                        self.log_message("❌ שגיאה בהורדת הקובץ מהשרת")
-                        messagebox.showerror("שגיאה", "שגיאה בהורדת הקובץ מהשרת")
-                        
-                else:
-                    error = response.json().get('error', 'שגיאה לא ידועה')
-                    self.log_message(f"❌ שגיאת שרת: {error}")
-                    messagebox.showerror("שגיאת שרת", error)
-                    
-            except requests.exceptions.Timeout:
-                self.log_message("⏰ זמן ההורדה פג - הסרטון ארוך מדי או החיבור איטי")
-                messagebox.showerror("שגיאה", "זמן ההורדה פג")
-            except requests.exceptions.ConnectionError:
-                self.log_message("🔌 בעיית חיבור לשרת")
-                messagebox.showerror("שגיאה", "בעיית חיבור לשרת")
-            except Exception as e:
-                self.log_message(f"❌ שגיאה כללית: {str(e)}")
-                messagebox.showerror("שגיאה", f"שגיאה בהורדה: {str(e)}")
-            finally:
-                self.progress_bar.stop()
-                self.download_button.config(state='normal')
-                if "הושלמה" not in self.progress_var.get():
-                    self.progress_var.set("✅ מוכן להורדה")
-        
-        threading.Thread(target=download, daemon=True).start()
+        options = self.download_options()
+        for url in urls:
+            self.queue.add(url, download_dir, options)
+        self.log_message(f"📋 נוספו לתור {len(urls)} קישורים "
+                         f"({self.quality_var.get()}, {self.format_var.get()})")
+        self.url_var.set("")
+    
+    def download_options(self):
+        """האיכות והפורמט שנבחרו - השרת מבין '720p' כגובה מקסימלי"""
+        format_selection = self.format_var.get()
+        audio_format = format_selection[len('audio_'):] if format_selection.startswith('audio') else None
+        return client_engine.download_options(self.quality_var.get(), audio_format)
     
     def run(self):
         """הפעלת האפליקציה"""
         # בדיקת חיבור ראשונית
         self.test_server_connection()
+        # המשך ההורדות שנשארו בתור מההפעלה הקודמת
+        self.queue.start()
         
         # הצגת הודעת פתיחה
         if "YOUR_SERVER_IP" in self.server_url: